@@ -0,0 +1,81 @@
+"""
+Benchmark add_pattern's project I/O: the on-disk path (extract, copy, rglob,
+write, re-zip) against the in-memory ProjectTree, without any LLM calls.
+
+    python bench/bench_project_tree.py [--project example/output/not-farm-from-home] [--repeat 20]
+
+Each round writes FILES_PER_SERVICE generated files into every service, as
+CodegenWorkflow.write_files does.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import pattern_workflow as pw  # noqa: E402
+from project_tree import ProjectTree  # noqa: E402
+
+FILES_PER_SERVICE = 10
+CODE = "package {package};\n\npublic class Generated{i} {{\n    // TODO\n}}\n"
+
+
+def disk_round(blob: bytes, scratch: Path) -> bytes:
+    work, output_dir = scratch / "old_project_work", scratch / "output_project"
+    pw.unzip_bytes(blob, work)
+    pw.read_text_if_exists(work, "Readme.md")
+    services = pw.find_services(work)
+    pw.copy_tree(work, output_dir)
+    for svc in services:
+        package = pw.detect_package(output_dir / svc.name)
+        root = output_dir / svc.name / "src/main/java" / package.replace(".", "/") / "generated"
+        root.mkdir(parents=True, exist_ok=True)
+        for i in range(FILES_PER_SERVICE):
+            (root / f"Generated{i}.java").write_text(CODE.format(package=package, i=i), encoding="utf-8")
+    return pw.zip_dir_to_bytes(output_dir)
+
+
+def memory_round(blob: bytes) -> bytes:
+    project = ProjectTree.from_zip_bytes(blob)
+    project.read_text("Readme.md", default="")
+    for svc in project.find_services():
+        package = project.detect_package(svc)
+        base = f"{svc}/src/main/java/{package.replace('.', '/')}/generated"
+        for i in range(FILES_PER_SERVICE):
+            project.write(f"{base}/Generated{i}.java", CODE.format(package=package, i=i))
+    return project.to_zip_bytes()
+
+
+def timed(fn, repeat: int) -> list:
+    out = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - start) * 1000)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--project", type=Path, default=ROOT / "example/output/not-farm-from-home")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    blob = pw.zip_dir_to_bytes(args.project)
+    with tempfile.TemporaryDirectory() as tmp:
+        disk = timed(lambda: disk_round(blob, Path(tmp)), args.repeat)
+    memory = timed(lambda: memory_round(blob), args.repeat)
+
+    print(f"project: {args.project} ({len(blob) / 1024:.0f} KiB zipped, {os.cpu_count()} CPUs)")
+    for name, runs in (("disk (extract/copy/rglob/zip)", disk), ("in-memory ProjectTree", memory)):
+        print(f"{name:32s} median {statistics.median(runs):8.2f} ms   min {min(runs):8.2f} ms")
+    print(f"speedup: {statistics.median(disk) / statistics.median(memory):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
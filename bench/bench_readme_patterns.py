@@ -0,0 +1,82 @@
+"""
+Benchmark README pattern extraction: the compiled single-pass
+parse_patterns_from_readme against the former two-pass parser (kept as the
+reference in bench/legacy_readme.py) on synthetic multi-megabyte READMEs.
+
+    python bench/bench_readme_patterns.py [--mb 4] [--repeat 5] [--bullet-ratio 0.3]
+
+Checks that both produce the same mapping before timing them.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from pattern_workflow import parse_patterns_from_readme  # noqa: E402
+from legacy_readme import legacy_parse  # noqa: E402
+
+PROSE = [
+    "Handles bookings and payments for every customer. Uses the **aggregate pattern** for consistency.",
+    "Manages the catalog. Uses Aggregate and Domain Event patterns, and database-per-service.",
+    "Coordinates orders with a saga pattern and API Composition for queries, database per service.",
+]
+CLASSIC = ["(Saga, Aggregate, Domain Event)", "(CQRS, API Composition)", "(Aggregate)"]
+TEXT = [
+    "This project implements a microservices architecture generated from user stories.",
+    "Build all services with Maven (`mvn clean package` in each service folder).",
+    "",
+    "## Architecture",
+]
+
+
+def synthetic_readme(megabytes: float, bullet_ratio: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    lines, size = [], 0
+    while size < megabytes * 1024 * 1024:
+        if rng.random() < bullet_ratio:
+            name = f"Service{rng.randint(0, 500)} Service"
+            if rng.random() < 0.5:
+                line = f"- **{name}**: {rng.choice(PROSE)}"
+            else:
+                line = f"- {name} {rng.choice(CLASSIC)}"
+        else:
+            line = rng.choice(TEXT)
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def timed(fn, repeat: int) -> list:
+    out = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - start) * 1000)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mb", type=float, default=4.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--bullet-ratio", type=float, default=0.3)
+    args = parser.parse_args()
+
+    text = synthetic_readme(args.mb, args.bullet_ratio)
+    assert parse_patterns_from_readme(text) == legacy_parse(text), "parsers disagree"
+
+    old = timed(lambda: legacy_parse(text), args.repeat)
+    new = timed(lambda: parse_patterns_from_readme(text), args.repeat)
+    print(f"README: {len(text) / 1024 / 1024:.1f} MiB, {text.count(chr(10)) + 1} lines, bullet ratio {args.bullet_ratio}")
+    for name, runs in (("two-pass (reference)", old), ("compiled single-pass", new)):
+        print(f"{name:24s} median {statistics.median(runs):9.1f} ms   min {min(runs):9.1f} ms")
+    print(f"speedup: {statistics.median(old) / statistics.median(new):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
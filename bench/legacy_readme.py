@@ -0,0 +1,113 @@
+"""
+Reference README pattern parser: the two-pass parser that the compiled
+single-pass parse_patterns_from_readme replaced. bench_readme_patterns.py
+times both, and test/test_readme_patterns.py checks that they agree.
+"""
+import re
+
+from pattern_workflow import simplify_service_label
+
+
+def legacy_freeform(text: str) -> dict:
+    """
+    Parse prose like:
+      'Implements the Aggregate pattern and uses database-per-service for security.'
+      'Uses Aggregate and Domain Event patterns, and database-per-service.'
+      'Uses Aggregate, Saga, and Domain Event patterns, and database-per-service.'
+      'Uses Aggregate and API Composition patterns, and database-per-service.'
+    Returns a dict with flags.
+    """
+    t = text.lower()
+
+    # canonicalize variants
+    t = t.replace("domain events", "domain event")
+    t = t.replace("events", "event")  # careful but fine for our keywords
+    t = t.replace("api composition", "api composition")
+    t = t.replace("database per service", "database-per-service")
+
+    agg  = bool(re.search(r"\baggregate\b", t))
+    de   = bool(re.search(r"\bdomain\s*event\b", t))
+    saga = bool(re.search(r"\bsaga\b", t))
+    api  = bool(re.search(r"\bapi\s*composition\b", t))
+
+    # We don’t generate code for DB-per-service; track if you want it for docs/flags.
+    dbps = bool(re.search(r"\bdatabase-?per-?service\b", t))
+
+    return {
+        "aggregate": agg,
+        "events": de,
+        "cqrs": False,                # not mentioned in this README style
+        "saga": {"name": None} if saga else None,
+        "api_composition": api,
+        "database_per_service": dbps, # optional extra flag (harmless if unused)
+    }
+
+def legacy_parse(readme_text: str) -> dict:
+    """
+    Supports BOTH styles:
+      1) Bullets with parentheses:
+         - Booking Service (Saga, Aggregate, Domain Event)
+      2) Prose bullets with bold names:
+         - **Authentication Service**: Handles ... Implements the Aggregate pattern ...
+         - **Product Catalog Service**: ... Uses Aggregate and Domain Event patterns, and database-per-service.
+    Returns mapping: { simplified_service_label: pattern_flags_dict }
+    """
+    patterns_map = {}
+
+    lines = readme_text.splitlines()
+
+    # --- Pass A: prose bullets with bold names and colon ---
+    # e.g. "- **Authentication Service**: Handles ... Uses Aggregate and Domain Event patterns, and database-per-service."
+    prose_bullet = re.compile(
+        r"^\s*[-*•]\s*(?:\*\*|__)?\s*([A-Za-z0-9 &/_-]+?\s+Service)\s*(?:\*\*|__)?\s*:\s*(.+)$"
+    )
+
+    for line in lines:
+        m = prose_bullet.match(line)
+        if not m:
+            continue
+        raw_name = m.group(1).strip()
+        desc = m.group(2).strip()
+        name_key = simplify_service_label(raw_name)
+        pats = legacy_freeform(desc)
+
+        # Derive saga name if needed (first word of service)
+        if pats.get("saga") and pats["saga"]["name"] is None:
+            saga_name = raw_name.split()[0].title()
+            pats["saga"]["name"] = saga_name
+
+        patterns_map[name_key] = pats
+
+    # --- Pass B: classic "(...)" bullets (keep backward compatibility) ---
+    # e.g. "- Booking Service (Saga, Aggregate, Domain Event)"
+    classic_bullet = re.compile(r"^\s*[-*•]\s*(.+?)\s*\(([^)]+)\)\s*$")
+
+    for line in lines:
+        m = classic_bullet.match(line)
+        if not m:
+            continue
+        raw_name = m.group(1).strip()
+        raw_patterns = m.group(2).strip()
+        name_key = simplify_service_label(raw_name)
+        # If already captured in Pass A, merge rather than overwrite
+        existing = patterns_map.get(name_key, {
+            "aggregate": False, "events": False, "cqrs": False, "saga": None, "api_composition": False
+        })
+
+        tokens = [t.strip().lower() for t in re.split(r"[,\uFF0C]+", raw_patterns)]
+        for token in tokens:
+            if token == "aggregate":
+                existing["aggregate"] = True
+            elif token in ("domain event", "event"):
+                existing["events"] = True
+            elif token == "cqrs":
+                existing["cqrs"] = True
+            elif token == "api composition":
+                existing["api_composition"] = True
+            elif token == "saga":
+                if not existing.get("saga"):
+                    existing["saga"] = {"name": raw_name.split()[0].title()}
+
+        patterns_map[name_key] = existing
+
+    return patterns_map
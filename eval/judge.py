@@ -7,7 +7,6 @@ from llama_index.core.workflow import (
     Event
 )
 
-from llama_index.llms.openai import OpenAI
 from llama_index.core.schema import (
     NodeWithScore,
 )
@@ -25,6 +24,8 @@ from typing import Any
 
 from output import DalleOutput
 from utils import single_quote_to_double, to_dict
+from llm_clients import get_llm
+import llm_calls
 from prompts import (
     FIND_CONTEXT_TEXT,
     JUDGE_TEXT
@@ -57,7 +58,7 @@ class DalleJudge(Workflow):
         specs =  ev.specs
         user_stories =  ev.user_stories
         retriever = ev.retriever
-        llm = OpenAI(model="gpt-4.1")  # Use the appropriate model for your use case
+        llm = get_llm("openai", "gpt-4.1")  # Use the appropriate model for your use case
         microservice_list = ev.microservices_list
         #sllm = llm.as_structured_llm(output_cls=DalleOutput)
 
@@ -89,7 +90,9 @@ class DalleJudge(Workflow):
         )
 
         
-        output = program(
+        output = await llm_calls.acall_program(
+            program,
+            step="judge",
             specs=specs,
             context=str(context_response),
             user_stories=user_stories,
@@ -7,17 +7,10 @@ from llama_index.core.workflow import (
     Event
 )
 
-from llama_index.llms.mistralai import MistralAI
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.anthropic import Anthropic
-
 from llama_index.core.schema import (
+    MetadataMode,
     NodeWithScore,
 )
-from llama_index.core.response_synthesizers import (
-    get_response_synthesizer,
-    ResponseMode
-)
 
 
 from llama_index.core.prompts import RichPromptTemplate, PromptTemplate
@@ -26,10 +19,14 @@ from llama_index.core.program import LLMTextCompletionProgram
 import streamlit as st
 import json
 
-from typing import Any
+from typing import Any, Optional
 
 from output import DalleOutput, DalleOutputCode
 from utils import single_quote_to_double, single_quote_to_double_with_content, to_dict
+from llm_clients import llm_for, pool_stats
+from stream_zip import FileStreamParser, ZipStreamWriter
+from workspace import release_workspace, run_workspace
+import llm_calls
 from prompts import (
     EXTRACT_MICROSERVICES_TEXT,
     FIND_CONTEXT_TEXT,
@@ -64,6 +61,7 @@ class ContextRetrievedEvent(Event):
 class CodeGeneratedEvent(Event):
     """Get ready to generate final output with context and ms. list"""
     code: Any
+    zip_bytes: Optional[bytes] = None  # set in streaming mode, where files are zipped as they arrive
 
 
 CITATION_QA_TEMPLATE = PromptTemplate(
@@ -83,7 +81,8 @@ CITATION_QA_TEMPLATE = PromptTemplate(
 # --- Workflow Definitions ---
 import os 
 from dotenv import load_dotenv
-assert load_dotenv()
+from offline_llm import offline_enabled
+assert load_dotenv() or offline_enabled()
 
 class CitationQueryEngineWorkflow(Workflow):
     @step
@@ -99,7 +98,7 @@ class CitationQueryEngineWorkflow(Workflow):
             print("Retriever is empty!")
             return None
 
-        nodes = retriever.retrieve(query)
+        nodes = await retriever.aretrieve(query)
         st.write(f"✅ Retrieved {len(nodes)} nodes for context.")
         return RetrieverEvent(nodes=nodes)
 
@@ -110,21 +109,11 @@ class CitationQueryEngineWorkflow(Workflow):
     @step
     async def synthesize(self, ctx: Context, ev: CreateCitationsEvent) -> StopEvent:
         model = await ctx.store.get("model")
-        if model == "mistral":
-            llm = MistralAI(model="mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=9000)
-        elif model in ("claude", "anthropic"):
-            llm = Anthropic(model="claude-sonnet-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
-        else:
-            llm = OpenAI(model="gpt-4.1", temperature=0, timeout=9999.0)
+        llm = llm_for(model)
 
         query = await ctx.store.get("query", default=None)
-        synthesizer = get_response_synthesizer(
-            llm=llm,
-            text_qa_template=CITATION_QA_TEMPLATE,
-            response_mode=ResponseMode.TREE_SUMMARIZE,
-            use_async=True,
-        )
-        response = await synthesizer.asynthesize(query, nodes=ev.nodes)
+        texts = [n.node.get_content(metadata_mode=MetadataMode.LLM) for n in ev.nodes]
+        response = await llm_calls.asynthesize(llm, CITATION_QA_TEMPLATE, query, texts, step="synthesize_context")
         return StopEvent(result=response)
 
 class DalleWorkflow(Workflow):
@@ -134,14 +123,10 @@ class DalleWorkflow(Workflow):
         await ctx.store.set("user_stories", ev.user_stories)
         await ctx.store.set("retriever", ev.retriever)
         await ctx.store.set("model", ev.model)
+        await ctx.store.set("stream", bool(ev.get("stream", False)))
 
         model = await ctx.store.get("model")
-        if model == "mistral":
-            llm = MistralAI(model="mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=9000)
-        elif model in ("claude", "anthropic"):
-            llm = Anthropic(model="claude-sonnet-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
-        else:
-            llm = OpenAI(model="gpt-4.1", temperature=0, timeout=9999.0)
+        llm = llm_for(model)
         await ctx.store.set("llm", llm)
 
         print("The model being used is:", model)
@@ -151,7 +136,7 @@ class DalleWorkflow(Workflow):
         extract_template = RichPromptTemplate(EXTRACT_MICROSERVICES_TEXT)
         extract_query = extract_template.format(specs=ev.specs, user_stories=ev.user_stories)
 
-        resp = llm.complete(extract_query).text
+        resp = await llm_calls.acomplete(llm, extract_query, step="extract_microservices")
         try:
             resp_list = resp
         except (ValueError, SyntaxError):
@@ -169,12 +154,7 @@ class DalleWorkflow(Workflow):
         retriever = await ctx.store.get("retriever")
 
         model = await ctx.store.get("model")
-        if model == "mistral":
-            llm = MistralAI(model="mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=9000)
-        elif model in ("claude", "anthropic"):
-            llm = Anthropic(model="claude-sonnet-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
-        else:
-            llm = OpenAI(model="gpt-4.1", reasoning_effort="low", temperature=0, timeout=9999.0)
+        llm = llm_for(model, "context")
         
         #sllm = llm.as_structured_llm(output_cls=DalleOutput)
 
@@ -201,7 +181,9 @@ class DalleWorkflow(Workflow):
             verbose=True,
         )
         
-        output = program(
+        output = await llm_calls.acall_program(
+            program,
+            step="retrieve_context",
             specs=specs,
             context=str(context_response),
             user_stories=user_stories,
@@ -225,12 +207,7 @@ class DalleWorkflow(Workflow):
     async def generate_code(self, ctx: Context, ev: ContextRetrievedEvent) -> CodeGeneratedEvent:
         """Generate code snippets for each microservice based on the architecture."""
         model = await ctx.store.get("model")
-        if model == "mistral":
-            llm = MistralAI(model="codestral-2508", temperature=0, timeout=9999.0, max_tokens=9000)
-        elif model in ("claude", "anthropic"):
-            llm = Anthropic(model="claude-sonnet-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
-        else:
-            llm = OpenAI(model="gpt-4.1", reasoning_effort="medium", temperature=0, timeout=9999.0)
+        llm = llm_for(model, "code")
 
         program = LLMTextCompletionProgram.from_defaults(
             output_cls=DalleOutputCode,
@@ -238,8 +215,25 @@ class DalleWorkflow(Workflow):
             llm=llm,
             verbose=True,
         )
+
+        if await ctx.store.get("stream", default=False):
+            # Streaming mode: each {name, content} object goes into the ZIP as soon as it closes
+            prompt = program.prompt.format(llm=llm, input_json=ev.context)
+            parser = FileStreamParser()
+            buf = io.BytesIO()
+            with ZipStreamWriter(buf) as zw:
+                async for delta in llm_calls.astream_complete(llm, prompt, step="generate_code"):
+                    for path, content in parser.feed(delta):
+                        zw.add(path, content)
+                        st.write(f"📄 {path}")
+            if not parser.done:
+                st.warning("⚠️ Code stream ended before the JSON was complete; the ZIP may be partial.")
+            st.write(f"✅  Streamed {zw.count} generated files into the ZIP.")
+            return CodeGeneratedEvent(code=None, zip_bytes=buf.getvalue())
         
-        output = program(
+        output = await llm_calls.acall_program(
+            program,
+            step="generate_code",
             input_json=ev.context,
         )
 
@@ -256,18 +250,31 @@ class DalleWorkflow(Workflow):
           "files":   [ { "name": str (can include nested paths like 'a/b/c.txt'), "content": str } ] }
         Returns: StopEvent(result={"filename": "...zip", "zip_base64": "<base64-zip>"})
         """
-        # Parse the JSON produced by the previous step
+        if ev.zip_bytes is not None:
+            # Streaming mode already wrote every file into the archive
+            payload = {
+                "filename": "microservices_project.zip",
+                "zip_base64": base64.b64encode(ev.zip_bytes).decode("ascii"),
+            }
+            st.write("✅ Packaged microservices code as a ZIP.")
+            print("LLM client pool:", pool_stats())
+            return StopEvent(result={"result": payload, "json": await ctx.store.get("archi_json")})
+
+        # Parse the JSON produced by the previous step; the raw structure goes to this run's workspace
+        ws = await run_workspace(ctx, "dalle")
         try:
             structure = ev.code
             print("Generated code structure:", structure)
-            with open("debug_generated_code.txt", "w") as f:
-                f.write(str(structure))
+            ws.write_text("debug_generated_code.txt", str(structure))
             if isinstance(structure, str):
                 structure = json.loads(structure)
         except Exception as e:
+            await release_workspace(ctx, failed=True)
             st.error(f"❌ Could not parse generated code JSON: {e}")
             return StopEvent(result={"error": f"Invalid JSON from CodeGeneratedEvent: {e}"})
 
+        await release_workspace(ctx)
+
         # Helpers to write the file-tree directly into a ZIP (no temp files needed)
         buf = io.BytesIO()
         with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
@@ -316,5 +323,6 @@ class DalleWorkflow(Workflow):
             "zip_base64": zip_b64,
         }
         st.write("✅ Packaged microservices code as a ZIP.")
+        print("LLM client pool:", pool_stats())
         return StopEvent(result={"result": payload, "json": await ctx.store.get("archi_json")})
 
@@ -31,6 +31,7 @@ from typing import Any
 
 from output import DalleOutput, DalleOutputCode
 from utils import single_quote_to_double, single_quote_to_double_with_content, to_dict
+from workspace import release_workspace, run_workspace
 from prompts import (
     GENERATE_CODE_TEXT,
     GENERATE_PATTERN_CODE_TEXT,
@@ -46,7 +47,8 @@ import posixpath
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
-assert load_dotenv()
+from offline_llm import offline_enabled
+assert load_dotenv() or offline_enabled()
 
 
 # --- Workflow Events ---
@@ -242,18 +244,21 @@ class DalleCodeWorkflow(Workflow):
           "files":   [ { "name": str (can include nested paths like 'a/b/c.txt'), "content": str } ] }
         Returns: StopEvent(result={"filename": "...zip", "zip_base64": "<base64-zip>"})
         """
-        # Parse the JSON produced by the previous step
+        # Parse the JSON produced by the previous step; the raw structure goes to this run's workspace
+        ws = await run_workspace(ctx, "dalle-code")
         try:
             structure = ev.code
             print("Generated code structure:", structure)
-            with open("debug_generated_code.txt", "w") as f:
-                f.write(str(structure))
+            ws.write_text("debug_generated_code.txt", str(structure))
             if isinstance(structure, str):
                 structure = json.loads(structure)
         except Exception as e:
+            await release_workspace(ctx, failed=True)
             st.error(f"❌ Could not parse generated code JSON: {e}")
             return StopEvent(result={"error": f"Invalid JSON from CodeGeneratedEvent: {e}"})
 
+        await release_workspace(ctx)
+
         # Helpers to write the file-tree directly into a ZIP (no temp files needed)
         buf = io.BytesIO()
         with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
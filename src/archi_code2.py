@@ -6,11 +6,12 @@ from llama_index.core.workflow import (
     step,
 )
 
-from llama_index.llms.openai import OpenAI
+from llm_clients import configure, get_llm
+import llm_calls
 
 
-
-from llama_index.core.prompts import RichPromptTemplate, PromptTemplate
+from llama_index.core.prompts import RichPromptTemplate, PromptTemplate, ChatPromptTemplate
+from llama_index.core.llms import ChatMessage, MessageRole
 from llama_index.core.program import LLMTextCompletionProgram
 from llama_index.core import SimpleDirectoryReader
 
@@ -29,13 +30,19 @@ from input import (
     ComposeCodeGeneratedEvent,
     FrontendCodeGeneratedEvent
 )
-from output import DalleOutput, DalleOutputCode22
+from output import DalleOutput, DalleOutputCode2
 from utils import single_quote_to_double, single_quote_to_double_with_content, to_dict, _content
-from updates_utils import apply_project_update_from_json
+from updates_utils import apply_project_update_from_json, merge_update_plans
+from token_budget import TokenBudget, current_budget, use_budget
+from rate_limit import max_concurrency
+from prompt_cache import cached_prefix, prompt_cache_stats
+from project_tree import ProjectTree
+from workspace import release_workspace, run_workspace, use_workspace
 
 from utils import main as text_to_fs
 from prompts import (
-    GEN_CODE_FROM_MS,
+    GEN_CODE_FROM_MS_STATIC,
+    GEN_CODE_FROM_MS_INPUT,
     UPDATE_PLAN_SPEC,
     UPDATE_DATASTORE_PLAN_SPEC,
     UPDATE_COMPOSE_PLAN_SPEC,
@@ -50,12 +57,72 @@ import posixpath
 
 # Load environment variables from .env file
 from dotenv import load_dotenv
-assert load_dotenv()
+from offline_llm import offline_enabled
+assert load_dotenv() or offline_enabled()
 
 
 
 # --- Workflow Definitions ---
 
+PROJECT_EXTS = [
+    ".py", ".ts", ".tsx", ".js", ".json", ".yml", ".yaml", ".toml",
+    ".md", ".txt", ".go", ".java", ".cs", ".rs", ".php", ".html",
+    ".css", ".scss", ".sql", ".proto", ".graphql", ".dockerfile",
+    ".sh", ".env", ".ini", ".cfg", ".conf"
+]
+
+# Limit per-doc chars to keep the prompt safe; the token budget handles the total
+PER_DOC_LIMIT = 18_000
+
+
+def load_project_documents(project_root: Path) -> list[str]:
+    """Text of every project file (truncated to PER_DOC_LIMIT chars) for the plan prompts."""
+    documents = SimpleDirectoryReader(
+        input_dir=str(project_root),
+        recursive=True,
+        required_exts=PROJECT_EXTS,
+        errors="ignore",
+    ).load_data()
+    return [content[:PER_DOC_LIMIT] for d in documents if (content := _content(d))]
+
+
+def microservice_code_program(llm) -> LLMTextCompletionProgram:
+    """
+    GEN_CODE_FROM_MS as chat messages: the static instructions first (a cacheable
+    prefix, identical for every microservice), the microservice itself last.
+    """
+    return LLMTextCompletionProgram.from_defaults(
+        output_cls=DalleOutputCode2,
+        prompt=ChatPromptTemplate(message_templates=[
+            cached_prefix(GEN_CODE_FROM_MS_STATIC, llm),
+            ChatMessage(role=MessageRole.USER, content=GEN_CODE_FROM_MS_INPUT),
+        ]),
+        llm=llm,
+        verbose=True,
+    )
+
+
+async def plan_update(llm, template: RichPromptTemplate, step_name: str, documents: list[str], **kwargs) -> str:
+    """
+    Ask the LLM for a JSON update plan over the project documents.
+    Under a token budget with action "split" the documents are spread over
+    several requests whose action lists are merged.
+    """
+    budget = current_budget()
+    if budget is None:
+        groups = ["\n\n".join(documents)]
+    else:
+        overhead = template.format(project_documents="", **kwargs)
+        groups = budget.pack_documents(llm, documents, overhead, step=step_name)
+
+    outputs = []
+    for group in groups:
+        extract_query = template.format(project_documents=group, **kwargs)
+        print("Extract Query:", extract_query)
+        outputs.append(await llm_calls.acomplete(llm, extract_query, step=step_name))
+    return merge_update_plans(outputs)
+
+
 class DalleCodeWorkflow2(Workflow):
     @step
     async def start(self, ctx: Context, ev: StartEvent) -> ExtractMicroservice | None:
@@ -73,7 +140,10 @@ class DalleCodeWorkflow2(Workflow):
         await ctx.store.set("num_microservices", len(microservices))
         await ctx.store.set("patterns", patterns)
         await ctx.store.set("datastore", datastore)
-        
+        # Created here, before the fan-out, so every step of the run shares it
+        ws = await run_workspace(ctx, "code2")
+        print("Workspace:", ws.path)
+
 
         for microservice in microservices:
             ctx.send_event(ExtractMicroservice(microservice=microservice))
@@ -81,27 +151,24 @@ class DalleCodeWorkflow2(Workflow):
         return None
 
 
-    @step(num_workers=8)
+    @step(num_workers=max_concurrency())
     async def extract_microservices_code(self, ctx: Context, ev: ExtractMicroservice ) -> MicroservicesCodeExtractedEvent:
-        llm = OpenAI(model="gpt-4.1", timeout=9999.0, reasoning_effort="low", temperature=0)
+        llm = get_llm("openai", "gpt-4.1", timeout=9999.0, reasoning_effort="low", temperature=0)
         await ctx.store.set("llm", llm)
         
         try:
 
-            program = LLMTextCompletionProgram.from_defaults(
-                output_cls=DalleOutputCode2,
-                prompt_template_str=GEN_CODE_FROM_MS,
-                llm=llm,
-                verbose=True,
-            )
+            program = microservice_code_program(llm)
 
-            output = program(
+            output = await llm_calls.acall_program(
+                program,
+                step="extract_microservices_code",
                 microservice=ev.microservice,
             )
                 
             print(output)
-            with open(str(ev.microservice["name"]) +  ".txt", "w") as f:
-                f.write(str(output.code))
+            ws = await run_workspace(ctx)
+            ws.write_text(str(ev.microservice["name"]) + ".txt", str(output.code))
         except Exception as e:
             print(f"Error processing microservice {ev.microservice.get('name', 'unknown')}: {e}")
             return MicroservicesCodeExtractedEvent(microservices_list="")
@@ -120,58 +187,15 @@ class DalleCodeWorkflow2(Workflow):
         if result is None:
             return None
 
-        # Write each microservice’s code into the output folder (as before)
-        project_root = Path("./output_project")
+        # Write each microservice’s code into the run's output folder
+        ws = await run_workspace(ctx)
+        project_root = ws.file("output_project")
         
         for r in result:
             text_to_fs(r.microservices_list, root=project_root)
 
         # === NEW: Load the whole project as documents using SimpleDirectoryReader ===
-        # You can tweak `required_exts` to restrict what’s loaded.
-        documents = SimpleDirectoryReader(
-            input_dir=str(project_root),
-            recursive=True,
-            required_exts=[
-                ".py", ".ts", ".tsx", ".js", ".json", ".yml", ".yaml", ".toml",
-                ".md", ".txt", ".go", ".java", ".cs", ".rs", ".php", ".html",
-                ".css", ".scss", ".sql", ".proto", ".graphql", ".dockerfile",
-                ".sh", ".env", ".ini", ".cfg", ".conf"
-            ],
-            errors="ignore",
-        ).load_data()
-
-
-        # Limit per-doc bytes to keep the prompt safe; adjust as needed
-        PER_DOC_LIMIT = 18_000
-        project_documents = "\n\n".join(
-            (content[:PER_DOC_LIMIT] if (content := _content(d)) else "")
-            for d in documents
-        )
-
-        print("Project documents:", project_documents)
-
-        """
-        program = LLMTextCompletionProgram.from_defaults(
-            output_cls=DalleOutputCode2,  # code will contain the JSON string
-            prompt_template_str=(
-                "You are updating a microservices project with cross-cutting PATTERNS.\n"
-                "Project documents (truncated):\n{{project_documents}}\n\n"
-                "Patterns to implement:\n{{patterns}}\n\n"
-                "Focus only on API Gateway, CQRS, Saga and Event Sourcing patterns.\n\n"
-                "{{update_plan_spec}}\n"
-                "Return ONLY the JSON object."
-            ),
-            llm=llm,
-            verbose=True,
-        )
-
-        output = program(
-            patterns=patterns,
-            project_documents=project_documents,
-            update_plan_spec=UPDATE_PLAN_SPEC,
-        ).code
-        
-        """
+        documents = load_project_documents(project_root)
 
         # Run the model directly
         extract_template = RichPromptTemplate("You are updating a microservices project with cross-cutting PATTERNS.\n"
@@ -180,37 +204,31 @@ class DalleCodeWorkflow2(Workflow):
                 "Focus only on API Gateway, CQRS, Saga and Event Sourcing patterns.\n\n"
                 "{{update_plan_spec}}\n"
                 "Return ONLY the JSON object.")
-    
-        extract_query = extract_template.format(project_documents=project_documents, patterns=patterns, update_plan_spec=UPDATE_PLAN_SPEC)
-
-        print("Extract Query:", extract_query)
 
-        output = llm.complete(extract_query).text
+        output = await plan_update(
+            llm, extract_template, "generate_patterns_code", documents,
+            patterns=patterns, update_plan_spec=UPDATE_PLAN_SPEC,
+        )
         
 
         print("Patterns:", output)
     
         # Persist raw plan for audit/debug
-        plan_path = Path("patterns.plan.json")
-        with open(plan_path, "w", encoding="utf-8") as f:
-            f.write(str(output))
+        ws.write_text("patterns.plan.json", str(output))
 
         # Apply it to the project
         try:
             summary = apply_project_update_from_json(str(output), project_root)
         except Exception as e:
             # Persist the failure context and bubble up a structured error
-            with open("patterns.plan.error.txt", "w", encoding="utf-8") as f:
-                f.write(f"Failed to apply plan:\n{e}\n\nPLAN:\n{output}")
+            ws.write_text("patterns.plan.error.txt", f"Failed to apply plan:\n{e}\n\nPLAN:\n{output}")
             raise
 
         # Save summary for visibility
-        with open("patterns.apply-summary.json", "w", encoding="utf-8") as f:
-            json.dump(summary, f, indent=2)
+        ws.write_text("patterns.apply-summary.json", json.dumps(summary, indent=2))
 
         # Optionally also write the (LLM) code field as a text log
-        with open("patterns.txt", "w", encoding="utf-8") as f:
-            f.write(str(output))
+        ws.write_text("patterns.txt", str(output))
 
 
         return PatternsCodeGeneratedEvent(patterns=output)
@@ -224,36 +242,13 @@ class DalleCodeWorkflow2(Workflow):
         datastore_spec = await ctx.store.get("datastore")
         
 
-        # Materialize (again/safely) into ./output_project to ensure the folder is current
-        project_root = Path("./output_project")
+        # The project materialised by generate_patterns_code in this run's workspace
+        ws = await run_workspace(ctx)
+        project_root = ws.file("output_project")
        
 
         # Load repository as documents for context
-        documents = SimpleDirectoryReader(
-            input_dir=str(project_root),
-            recursive=True,
-            required_exts=[
-                ".py",".ts",".tsx",".js",".json",".yml",".yaml",".toml",
-                ".md",".txt",".go",".java",".cs",".rs",".php",".html",
-                ".css",".scss",".sql",".proto",".graphql",".dockerfile",
-                ".sh",".env",".ini",".cfg",".conf"
-            ],
-            errors="ignore",
-        ).load_data()
-
-        def _content(doc):
-            try:
-                return doc.get_content()
-            except Exception:
-                return getattr(doc, "text", "")
-
-        PER_DOC_LIMIT = 18_000
-        
-        
-        project_documents = "\n\n".join(
-            (content[:PER_DOC_LIMIT] if (content := _content(d)) else "")
-            for d in documents
-        )
+        documents = load_project_documents(project_root)
         """
         program = LLMTextCompletionProgram.from_defaults(
             output_cls=DalleOutputCode2,  # code will contain the JSON string
@@ -269,21 +264,19 @@ class DalleCodeWorkflow2(Workflow):
         ).code
         """
 
-        extract_query = RichPromptTemplate(UPDATE_DATASTORE_PLAN_SPEC).format(project_documents=project_documents, datastore=datastore_spec, update_plan_spec=UPDATE_PLAN_SPEC)
-
-        print("Extract Query:", extract_query)
-        output = llm.complete(extract_query).text
+        output = await plan_update(
+            llm, RichPromptTemplate(UPDATE_DATASTORE_PLAN_SPEC), "generate_datastore_code", documents,
+            datastore=datastore_spec, update_plan_spec=UPDATE_PLAN_SPEC,
+        )
         # Persist the plan
-        Path("datastore.plan.json").write_text(output, encoding="utf-8")
+        ws.write_text("datastore.plan.json", output)
 
         # Apply to the project
         summary = apply_project_update_from_json(output, project_root)
-        Path("datastore.apply-summary.json").write_text(
-            json.dumps(summary, indent=2), encoding="utf-8"
-        )
+        ws.write_text("datastore.apply-summary.json", json.dumps(summary, indent=2))
 
         # Also log the raw plan to a generic text file if you like symmetry with patterns
-        Path("datastore.txt").write_text(output, encoding="utf-8")
+        ws.write_text("datastore.txt", output)
 
         return DatastoreCodeGeneratedEvent(datastore=output)
     
@@ -294,53 +287,30 @@ class DalleCodeWorkflow2(Workflow):
         # Get shared state
         llm = await ctx.store.get("llm")
         
-        # Ensure latest code exists in ./output_project
-        project_root = Path("./output_project")
+        # The project materialised by generate_patterns_code in this run's workspace
+        ws = await run_workspace(ctx)
+        project_root = ws.file("output_project")
        
 
         # Load repository as documents for context
-        documents = SimpleDirectoryReader(
-            input_dir=str(project_root),
-            recursive=True,
-            required_exts=[
-                ".py",".ts",".tsx",".js",".json",".yml",".yaml",".toml",
-                ".md",".txt",".go",".java",".cs",".rs",".php",".html",
-                ".css",".scss",".sql",".proto",".graphql",".dockerfile",
-                ".sh",".env",".ini",".cfg",".conf"
-            ],
-            errors="ignore",
-        ).load_data()
-
-        def _content(doc):
-            try:
-                return doc.get_content()
-            except Exception:
-                return getattr(doc, "text", "")
-
-        PER_DOC_LIMIT = 18_000
-        
-        project_documents = "\n\n".join(
-            (content[:PER_DOC_LIMIT] if (content := _content(d)) else "")
-            for d in documents
-        )
-
-        extract_query = RichPromptTemplate(UPDATE_FRONTEND_PLAN_SPEC).format(project_documents=project_documents, update_plan_spec=UPDATE_PLAN_SPEC)
+        documents = load_project_documents(project_root)
 
         # Call the LLM and get raw JSON
-        output = llm.complete(extract_query).text
+        output = await plan_update(
+            llm, RichPromptTemplate(UPDATE_FRONTEND_PLAN_SPEC), "generate_frontend_code", documents,
+            update_plan_spec=UPDATE_PLAN_SPEC,
+        )
         
 
         # Persist the plan
-        Path("frontend.plan.json").write_text(output, encoding="utf-8")
+        ws.write_text("frontend.plan.json", output)
 
         # Apply to the project
         summary = apply_project_update_from_json(output, project_root)
-        Path("frontend.apply-summary.json").write_text(
-            json.dumps(summary, indent=2), encoding="utf-8"
-        )
+        ws.write_text("frontend.apply-summary.json", json.dumps(summary, indent=2))
 
         # Optional: mirror to a text log
-        Path("frontend.txt").write_text(output, encoding="utf-8")
+        ws.write_text("frontend.txt", output)
 
         return FrontendCodeGeneratedEvent(frontend=output)
 
@@ -350,57 +320,40 @@ class DalleCodeWorkflow2(Workflow):
     ) -> ComposeCodeGeneratedEvent | None:
         # Shared state
         llm = await ctx.store.get("llm")
-        project_root = Path("./output_project")
+        # The project materialised by generate_patterns_code in this run's workspace
+        ws = await run_workspace(ctx)
+        project_root = ws.file("output_project")
 
         # Load repository as documents for context
-        documents = SimpleDirectoryReader(
-            input_dir=str(project_root),
-            recursive=True,
-            required_exts=[
-                ".py",".ts",".tsx",".js",".json",".yml",".yaml",".toml",
-                ".md",".txt",".go",".java",".cs",".rs",".php",".html",
-                ".css",".scss",".sql",".proto",".graphql",".dockerfile",
-                ".sh",".env",".ini",".cfg",".conf"
-            ],
-            errors="ignore",
-        ).load_data()
-
-        def _content(doc):
-            try:
-                return doc.get_content()
-            except Exception:
-                return getattr(doc, "text", "")
-
-        PER_DOC_LIMIT = 18_000
-        project_documents = "\n\n".join(
-            (content[:PER_DOC_LIMIT] if (content := _content(d)) else "")
-            for d in documents
-        )
-
-        extract_query = RichPromptTemplate(UPDATE_COMPOSE_PLAN_SPEC).format(project_documents=project_documents, update_plan_spec=UPDATE_PLAN_SPEC)
-
+        documents = load_project_documents(project_root)
 
         # Call the LLM and get raw JSON
-        output = llm.complete(extract_query).text
+        output = await plan_update(
+            llm, RichPromptTemplate(UPDATE_COMPOSE_PLAN_SPEC), "generate_compose_code", documents,
+            update_plan_spec=UPDATE_PLAN_SPEC,
+        )
 
 
         # Persist the plan
-        Path("compose.plan.json").write_text(output, encoding="utf-8")
+        ws.write_text("compose.plan.json", output)
 
         # Apply to project
         summary = apply_project_update_from_json(output, project_root)
-        Path("compose.apply-summary.json").write_text(
-            json.dumps(summary, indent=2), encoding="utf-8"
-        )
+        ws.write_text("compose.apply-summary.json", json.dumps(summary, indent=2))
 
         # Optional: keep a plain text mirror
-        Path("compose.txt").write_text(output, encoding="utf-8")
+        ws.write_text("compose.txt", output)
 
         return ComposeCodeGeneratedEvent(code=output)
     @step
     async def final_step(self, ctx: Context, ev: ComposeCodeGeneratedEvent) -> StopEvent:
-        
-        return StopEvent(result="result")
+        # The workspace may be removed below: hand the project back as a ZIP
+        ws = await run_workspace(ctx)
+        blob = ProjectTree.from_dir(ws.file("output_project")).to_zip_bytes()
+        payload = {"filename": "microservices_project.zip", "zip_base64": base64.b64encode(blob).decode("ascii")}
+        if await release_workspace(ctx):
+            payload["workspace"] = str(ws.path)
+        return StopEvent(result=payload)
 
 
 
@@ -410,10 +363,19 @@ INPUT_JSON_EXAMPLE = """{'microservices': [{'name': 'Authentication Service', 'e
 
 import asyncio
 
-wf = DalleCodeWorkflow2(timeout=None)
-
 async def main():
-    res = await wf.run(input_json=INPUT_JSON_EXAMPLE)
-    print("Final result:", res)
-
-asyncio.run(main())
\ No newline at end of file
+    budget = TokenBudget.from_env()
+    with use_budget(budget), use_workspace("code2") as ws:
+        wf = DalleCodeWorkflow2(timeout=None)
+        res = await wf.run(input_json=INPUT_JSON_EXAMPLE)
+    # The workspace is usually gone by now: keep the ZIP and its ledger side by side, named by run
+    output = Path("results") / f"{ws.run_id}.zip"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(base64.b64decode(res["zip_base64"]))
+    print("Final result:", output, res.get("workspace", "(workspace removed)"))
+    print("Token ledger:", budget.write_ledger(output.with_suffix(".ledger.json")), budget.summary()["totals"])
+    print("Prompt cache:", prompt_cache_stats())
+
+if __name__ == "__main__":
+    configure()
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""
+Tail-latency control for LLM calls: per-step deadlines, retries with jittered
+exponential backoff and optional hedged requests.
+
+Clients are built with timeout=9999.0 and the workflows run with timeout=None,
+so a single stuck request could hang a run for hours. llm_calls now runs every
+async call through run_with_policy(step, make_call):
+
+  - deadline: each attempt is cancelled after the step's deadline
+    (LLM_DEADLINE_S, default 600s; per step via LLM_STEP_DEADLINES,
+    e.g. "judge=60,generate_code=900");
+  - retries: timeouts and transient errors (connection resets, 5xx,
+    overloaded) are retried up to LLM_RETRIES times (default 3), sleeping a
+    random time in [0, LLM_BACKOFF_S * 2**attempt] ("full jitter");
+    429s are handled by rate_limit.py and are not retried here. The SDK
+    clients are built with max_retries=0 (llm_clients.py), so these are the
+    only retries a request gets;
+  - hedging (LLM_HEDGE=1, or a step list "generate_files,judge"): when an
+    attempt is still running after the step's observed p95 latency, a
+    duplicate request is sent and whichever finishes first wins; the other
+    is cancelled. Hedging only starts once a step has HEDGE_MIN_SAMPLES
+    latencies. A losing request that completed anyway is passed to
+    on_discard, so the caller can still bill its tokens.
+
+Latencies are the provider call alone: llm_calls reports them with
+observe_latency(), so rate-limiter waits and backoff sleeps stay out of the
+percentiles that hedging and the router's SLOs are based on.
+
+Streaming calls (astream_complete) only go through the rate limiter: their
+deltas are consumed as they arrive and cannot be replayed. Per-step latency
+percentiles, retries, timeouts, hedges and hedge wins are available from
+policy_stats().
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+DEFAULT_DEADLINE_S = 600.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_S = 1.0
+HEDGE_MIN_SAMPLES = 10
+LATENCY_WINDOW = 200
+
+TRANSIENT_STATUS = {408, 409, 500, 502, 503, 504, 529}
+TRANSIENT_ERRORS = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "ServiceUnavailableError",
+    "OverloadedError",
+    "ConnectError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "ReadError",
+    "RemoteProtocolError",
+    "TimeoutError",
+}
+
+
+def _parse_map(raw: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            out[name.strip()] = float(value)
+    return out
+
+
+def deadline_for(step: Optional[str]) -> float:
+    per_step = _parse_map(os.getenv("LLM_STEP_DEADLINES", ""))
+    return per_step.get(step or "", float(os.getenv("LLM_DEADLINE_S", DEFAULT_DEADLINE_S)))
+
+
+def hedging_enabled(step: Optional[str]) -> bool:
+    raw = os.getenv("LLM_HEDGE", "").strip().lower()
+    if raw in ("", "0", "false", "off", "no"):
+        return False
+    if raw in ("1", "true", "on", "yes", "all"):
+        return True
+    return (step or "") in {s.strip() for s in raw.split(",")}
+
+
+def is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status in TRANSIENT_STATUS:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(exc).__mro__)
+
+
+class StepStats:
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def as_dict(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "p50_s": round(p50, 3) if p50 is not None else None,
+            "p95_s": round(p95, 3) if p95 is not None else None,
+        }
+
+
+_lock = threading.Lock()
+_stats: Dict[str, StepStats] = {}
+
+
+def _step_stats(step: Optional[str]) -> StepStats:
+    with _lock:
+        return _stats.setdefault(step or "", StepStats())
+
+
+def policy_stats() -> Dict[str, Dict[str, Any]]:
+    """Latency / retry / hedging counters per step."""
+    with _lock:
+        return {step: s.as_dict() for step, s in _stats.items()}
+
+
+def reset_policy_stats() -> None:
+    with _lock:
+        _stats.clear()
+
+
+def observe_latency(step: Optional[str], seconds: float) -> None:
+    """Record the provider time of one successful request of step."""
+    stats = _step_stats(step)
+    with _lock:
+        stats.latencies.append(seconds)
+
+
+async def _hedged(
+    stats: StepStats,
+    make_call: Callable[[], Awaitable[Any]],
+    hedge: bool,
+    on_discard: Optional[Callable[[Any], None]] = None,
+) -> Any:
+    """
+    Await make_call(); if it outlives the step's p95, race a duplicate against it.
+    A losing request that completed anyway is handed to on_discard.
+    """
+    delay = stats.percentile(0.95) if hedge and len(stats.latencies) >= HEDGE_MIN_SAMPLES else None
+    if delay is None:
+        return await make_call()
+
+    primary = asyncio.ensure_future(make_call())
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    with _lock:
+        stats.hedges += 1
+    backup = asyncio.ensure_future(make_call())
+    tasks = {primary, backup}
+    try:
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is backup:
+                        with _lock:
+                            stats.hedge_wins += 1
+                    other = primary if task is backup else backup
+                    if on_discard is not None and other.done() and not other.cancelled() \
+                            and other.exception() is None:
+                        on_discard(other.result())
+                    return task.result()
+        # Both failed: surface the primary's error
+        return primary.result()
+    finally:
+        for task in (primary, backup):
+            if not task.done():
+                task.cancel()
+
+
+async def run_with_policy(
+    step: Optional[str],
+    make_call: Callable[[], Awaitable[Any]],
+    on_discard: Optional[Callable[[Any], None]] = None,
+) -> Any:
+    """Await make_call() with the step's deadline, transient-error retries and hedging."""
+    stats = _step_stats(step)
+    deadline = deadline_for(step)
+    retries = int(os.getenv("LLM_RETRIES", DEFAULT_RETRIES))
+    backoff = float(os.getenv("LLM_BACKOFF_S", DEFAULT_BACKOFF_S))
+    hedge = hedging_enabled(step)
+
+    for attempt in range(retries + 1):
+        try:
+            result = await asyncio.wait_for(_hedged(stats, make_call, hedge, on_discard), timeout=deadline)
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            with _lock:
+                stats.errors += 1
+                stats.timeouts += int(timed_out)
+            if not is_transient(e) or attempt >= retries:
+                if timed_out:
+                    raise asyncio.TimeoutError(f"LLM call of step {step or '?'} exceeded its {deadline:.0f}s deadline") from e
+                raise
+            sleep = random.uniform(0, backoff * 2 ** attempt)
+            print(f"🔁 {step or 'LLM call'}: {type(e).__name__} ({'deadline' if timed_out else e}); "
+                  f"retry {attempt + 1}/{retries} in {sleep:.1f}s")
+            with _lock:
+                stats.retries += 1
+            await asyncio.sleep(sleep)
+            continue
+        with _lock:
+            stats.calls += 1
+        return result
+
+
+def run_with_policy_sync(step: Optional[str], call: Callable[[], Any]) -> Any:
+    """Blocking counterpart: transient-error retries only (a blocking call cannot be cancelled)."""
+    stats = _step_stats(step)
+    retries = int(os.getenv("LLM_RETRIES", DEFAULT_RETRIES))
+    backoff = float(os.getenv("LLM_BACKOFF_S", DEFAULT_BACKOFF_S))
+    for attempt in range(retries + 1):
+        try:
+            result = call()
+        except Exception as e:
+            with _lock:
+                stats.errors += 1
+            if not is_transient(e) or attempt >= retries:
+                raise
+            with _lock:
+                stats.retries += 1
+            time.sleep(random.uniform(0, backoff * 2 ** attempt))
+            continue
+        with _lock:
+            stats.calls += 1
+        return result
@@ -0,0 +1,135 @@
+"""
+Group the small entries of a CodegenWorkflow plan into multi-file requests.
+
+A plan asks for one FILE_PROMPT call per file, so a service with a dozen
+DTOs, events and repository interfaces pays a dozen round trips and sends the
+system prompt and RAG context a dozen times. With CODEGEN_BATCH_FILES > 1,
+generate_files sends the files estimated to be small together in one
+BATCH_FILE_PROMPT call whose JSON answer is split back per file:
+
+    batches, singles = group_small_files(plan["files"])
+    codes = parse_batch_response(answer, [f["path"] for f in batches[0]])
+    # {path: code} for every file the answer contained; the others are retried alone
+
+Sizes are estimated from the file name (DTO / event / repository / enum ...
+suffixes are small, services, controllers and sagas are not).
+CODEGEN_BATCH_SMALL_LINES sets which files count as small and
+CODEGEN_BATCH_MAX_LINES caps the estimated output of one batch.
+"""
+import json
+import os
+import re
+from typing import Dict, List, Tuple
+
+# Estimated lines of a generated file by class-name suffix; anything else is DEFAULT_LINES
+SIZE_BY_SUFFIX = {
+    "Repository": 15,
+    "Exception": 15,
+    "Enum": 15,
+    "Status": 15,
+    "Type": 15,
+    "Application": 15,
+    "Event": 25,
+    "Command": 25,
+    "Dto": 30,
+    "DTO": 30,
+    "Request": 30,
+    "Response": 30,
+}
+DEFAULT_LINES = 80
+
+
+def batch_files() -> int:
+    """Most files per multi-file request (CODEGEN_BATCH_FILES, default 1 = one call per file)."""
+    return max(1, int(os.getenv("CODEGEN_BATCH_FILES", "1")))
+
+
+def small_lines() -> int:
+    """Files estimated at most this many lines are batched (CODEGEN_BATCH_SMALL_LINES, default 40)."""
+    return int(os.getenv("CODEGEN_BATCH_SMALL_LINES", "40"))
+
+
+def max_batch_lines() -> int:
+    """Estimated output of one batch (CODEGEN_BATCH_MAX_LINES, default 200)."""
+    return int(os.getenv("CODEGEN_BATCH_MAX_LINES", "200"))
+
+
+def estimate_lines(f: dict) -> int:
+    stem = os.path.splitext(os.path.basename(f.get("path") or ""))[0]
+    for suffix, lines in SIZE_BY_SUFFIX.items():
+        if stem.endswith(suffix):
+            return lines
+    purpose = (f.get("purpose") or "").lower()
+    if re.search(r"\b(dto|enum|record|event|interface)\b", purpose):
+        return 30
+    return DEFAULT_LINES
+
+
+def group_small_files(planned: List[dict]) -> Tuple[List[List[dict]], List[dict]]:
+    """
+    Split plan entries into batches of small files (each of 2+ files) and the
+    files to generate one by one. Batches keep plan order.
+    """
+    limit, small, budget = batch_files(), small_lines(), max_batch_lines()
+    if limit < 2:
+        return [], list(planned)
+    batches: List[List[dict]] = []
+    singles: List[dict] = []
+    current: List[dict] = []
+    used = 0
+    for f in planned:
+        lines = estimate_lines(f)
+        if lines > small:
+            singles.append(f)
+            continue
+        if current and (len(current) >= limit or used + lines > budget):
+            batches.append(current)
+            current, used = [], 0
+        current.append(f)
+        used += lines
+    if current:
+        batches.append(current)
+    # A batch of one is just a single-file call
+    singles.extend(b[0] for b in batches if len(b) == 1)
+    return [b for b in batches if len(b) > 1], singles
+
+
+def _norm(path: str) -> str:
+    return path.strip().strip("/").replace("\\", "/")
+
+
+def parse_batch_response(text: str, paths: List[str]) -> Dict[str, str]:
+    """
+    {path: code} for the requested paths found in a {"files": [{"path", "code"}]}
+    answer. Unknown paths and empty code are dropped; unparseable text gives {}.
+    """
+    try:
+        data = json.loads(text)
+    except Exception:
+        i, j = text.find("{"), text.rfind("}")
+        try:
+            data = json.loads(text[i:j + 1]) if i != -1 and j != -1 else {}
+        except Exception:
+            return {}
+    entries = data.get("files") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return {}
+
+    wanted = {_norm(p): p for p in paths}
+    by_name: Dict[str, List[str]] = {}
+    for p in paths:
+        by_name.setdefault(os.path.basename(_norm(p)), []).append(p)
+
+    out: Dict[str, str] = {}
+    for e in entries:
+        if not isinstance(e, dict) or not isinstance(e.get("path"), str) or not isinstance(e.get("code"), str):
+            continue
+        key = _norm(e["path"])
+        path = wanted.get(key)
+        if path is None:
+            # the model may shorten or prefix paths; accept an unambiguous file name
+            same = by_name.get(os.path.basename(key), [])
+            path = same[0] if len(same) == 1 else None
+        if path is not None and e["code"].strip() and path not in out:
+            out[path] = e["code"].strip()
+    return out
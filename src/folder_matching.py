@@ -0,0 +1,197 @@
+"""
+Match service labels (from the README or an Archi payload) to project folders.
+
+The former matchers scored every label against every folder, re-tokenising
+the folder names each time, and let a later label silently take a folder an
+earlier one had claimed. FolderIndex tokenises the folders once and finds a
+label's candidates through inverted indexes; the pairs are then assigned
+optimally (highest total score, at most one label per folder):
+
+    index = FolderIndex(["order-service", "payment_service"])
+    index.score("Order", 0)                      # same score as before: 5 + shared words
+    match_labels_to_folders({"order": {...}}, folders)   # {"order-service": {...}}
+
+Scores are unchanged: +5 when one canonical key contains the other, +1 per
+shared word. A label that shares nothing with any folder stays unassigned.
+"""
+import re
+from typing import Dict, List, Set, Tuple
+
+_WORD = re.compile(r"[a-z]+")
+_NGRAM = 3
+
+
+def canonical_name(s: str) -> str:
+    return re.sub(r'[^a-z0-9]+', '', s.lower())
+
+
+def _label_key(label: str) -> str:
+    return canonical_name(re.sub(r'\bservice\b', '', label))
+
+
+def _ngrams(key: str) -> Set[str]:
+    return {key[i:i + _NGRAM] for i in range(len(key) - _NGRAM + 1)}
+
+
+class FolderIndex:
+    """Canonical keys, word sets and inverted indexes of the service folders, built once."""
+
+    def __init__(self, folders: List[str]):
+        self.folders = list(folders)
+        self.keys = [canonical_name(re.sub(r'-service$', '', f, flags=re.IGNORECASE)) for f in self.folders]
+        self.words = [set(_WORD.findall(f.replace('-', ' ').lower())) for f in self.folders]
+        self.by_word: Dict[str, Set[int]] = {}
+        self.by_ngram: Dict[str, Set[int]] = {}
+        self.short: Set[int] = set()  # keys too short for the n-gram index
+        for i, (key, words) in enumerate(zip(self.keys, self.words)):
+            for w in words:
+                self.by_word.setdefault(w, set()).add(i)
+            if len(key) < _NGRAM:
+                self.short.add(i)
+            for g in _ngrams(key):
+                self.by_ngram.setdefault(g, set()).add(i)
+
+    def candidates(self, label: str) -> Set[int]:
+        """Folders that can score above zero for label: a shared word or a shared n-gram of the keys."""
+        return self._candidates(_label_key(label), set(_WORD.findall(label.lower())))
+
+    def score(self, label: str, i: int) -> int:
+        return self._score(_label_key(label), set(_WORD.findall(label.lower())), i)
+
+    def scores(self, label: str) -> Dict[int, int]:
+        """{folder index: score} of every folder scoring above zero for label."""
+        key, words = _label_key(label), set(_WORD.findall(label.lower()))
+        out = {}
+        for i in self._candidates(key, words):
+            score = self._score(key, words, i)
+            if score > 0:
+                out[i] = score
+        return out
+
+    def _candidates(self, key: str, words: Set[str]) -> Set[int]:
+        found: Set[int] = set(self.short)
+        for w in words:
+            found |= self.by_word.get(w, set())
+        if len(key) < _NGRAM:
+            # a short key can be contained in any folder key
+            found.update(i for i, fkey in enumerate(self.keys) if key in fkey)
+        for g in _ngrams(key):
+            found |= self.by_ngram.get(g, set())
+        return found
+
+    def _score(self, key: str, words: Set[str], i: int) -> int:
+        fkey = self.keys[i]
+        score = 5 if key in fkey or fkey in key else 0
+        return score + len(words & self.words[i])
+
+
+def _hungarian(weights: List[List[int]]) -> List[int]:
+    """
+    Maximum-weight assignment of rows to distinct columns (rows <= cols).
+    Returns the column of every row. O(rows^2 * cols).
+    """
+    n, m = len(weights), len(weights[0])
+    INF = float("inf")
+    u, v = [0] * (n + 1), [0] * (m + 1)
+    owner = [0] * (m + 1)  # owner[j] = row (1-based) assigned to column j
+    way = [0] * (m + 1)
+    for row in range(1, n + 1):
+        owner[0] = row
+        j0 = 0
+        minv = [INF] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = owner[j0], INF, 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = -weights[i0 - 1][j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[owner[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if owner[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+    cols = [0] * n
+    for j in range(1, m + 1):
+        if owner[j]:
+            cols[owner[j] - 1] = j - 1
+    return cols
+
+
+def _components(edges: Dict[Tuple[int, int], int], n_labels: int) -> List[Tuple[List[int], List[int]]]:
+    """Connected components (labels, folders) of the label/folder candidate graph."""
+    parent = list(range(n_labels))
+    folder_label: Dict[int, int] = {}
+
+    def find(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for li, fi in edges:
+        if fi in folder_label:
+            parent[find(li)] = find(folder_label[fi])
+        else:
+            folder_label[fi] = li
+    groups: Dict[int, Tuple[Set[int], Set[int]]] = {}
+    for li, fi in edges:
+        labels, folders = groups.setdefault(find(li), (set(), set()))
+        labels.add(li)
+        folders.add(fi)
+    return [(sorted(labels), sorted(folders)) for labels, folders in groups.values()]
+
+
+def assign_labels(labels: List[str], folders: List[str]) -> Dict[str, str]:
+    """{label: folder} maximising the total score; ties go to earlier folders."""
+    index = FolderIndex(folders)
+    edges: Dict[Tuple[int, int], int] = {}
+    for li, label in enumerate(labels):
+        for fi, score in index.scores(label).items():
+            edges[(li, fi)] = score
+
+    out: Dict[str, str] = {}
+    for comp_labels, comp_folders in _components(edges, len(labels)):
+        # Scale scores so the folder-order tie-break can never outweigh one score point
+        scale = (len(comp_labels) + 1) * (len(comp_folders) + 1)
+        rank = {fi: k for k, fi in enumerate(comp_folders)}
+        rows, cols = (comp_labels, comp_folders) if len(comp_labels) <= len(comp_folders) else (comp_folders, comp_labels)
+        weights = []
+        for r in rows:
+            row = []
+            for c in cols:
+                li, fi = (r, c) if rows is comp_labels else (c, r)
+                score = edges.get((li, fi), 0)
+                row.append(score * scale - rank[fi] if score else 0)
+            weights.append(row)
+        for r, c in zip(rows, _hungarian(weights)):
+            li, fi = (r, cols[c]) if rows is comp_labels else (cols[c], r)
+            if (li, fi) in edges:
+                out[labels[li]] = folders[fi]
+    return out
+
+
+def match_labels_to_folders(label_map: dict, service_folders: List[str]) -> dict:
+    """
+    Align a mapping keyed by human-friendly labels (README or Archi service
+    names, simplified or not) to the folder names found in the project.
+
+    Returns: { folder_name: patterns_dict }
+    """
+    labels = list(label_map)
+    assigned = assign_labels(labels, list(service_folders))
+    # Folder order of the project, as the callers iterate services in that order
+    by_folder = {folder: label for label, folder in assigned.items()}
+    return {f: label_map[by_folder[f]] for f in service_folders if f in by_folder}
@@ -0,0 +1,123 @@
+"""
+Incremental refresh of the persisted GitHub RAG index.
+
+build_github_retriever could only load .cache/github_indexes/<owner>_<repo>_<branch>
+as it was or, with force_rebuild, download and re-embed the whole repository.
+GithubRepositoryReader gives every document the git blob SHA of its file as
+doc_id, so the persisted index already records which content it holds.
+refresh_index compares the branch's tree listing ({path: blob sha}) with
+it, fetches and embeds only the files whose SHA the index does not have and
+deletes the documents whose SHA left the tree:
+
+    client = GithubClient(github_token=...)
+    tree = await github_tree(client, owner, repo, "master")
+
+    async def fetch(files):
+        return await fetch_github_blobs(client, owner, repo, "master", files)
+
+    index = load_index_from_storage(StorageContext.from_defaults(persist_dir=...))
+    stats = await refresh_index(index, tree, fetch)
+    # {"added": 2, "changed": 1, "deleted": 1, "unchanged": 812}
+    index.storage_context.persist(persist_dir=...)
+
+Only GithubClient's getBranch / getTree / getBlob endpoints are used, so the
+refresh does not depend on which GithubRepositoryReader.load_data keywords
+the installed reader has. LocalRepositoryReader.tree() / load_data(file_paths=...)
+do the same for a checkout or archive.
+
+A changed file is a new SHA at a path the index already had; its old
+document is deleted. Blobs that make no document (not UTF-8) are added to
+the skipped set the caller keeps next to the index, so later refreshes do
+not download them again. github_tree only lists directories its descend
+predicate accepts, so excluded directories cost no getTree call.
+"""
+import asyncio
+import base64
+import hashlib
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from llama_index.core import Document
+
+from local_repo_reader import blob_document
+
+
+def indexed_files(index) -> Dict[str, str]:
+    """{blob sha: file path} of the documents in index."""
+    return {
+        doc_id: (info.metadata or {}).get("file_path", "")
+        for doc_id, info in index.ref_doc_info.items()
+    }
+
+
+def index_revision(index) -> str:
+    """Short hash of the blob SHAs in index: changes whenever refresh_index adds or drops content."""
+    digest = hashlib.sha256("\n".join(sorted(index.ref_doc_info)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+async def github_tree(client, owner: str, repo: str, branch: str,
+                      descend: Optional[Callable[[str], bool]] = None) -> Dict[str, str]:
+    """
+    {path: blob sha} of every file on branch (one getTree call per directory);
+    directories for which descend(path) is False are not listed.
+    """
+    head = await client.get_branch(owner, repo, branch)
+    files: Dict[str, str] = {}
+    stack = [(head.commit.commit.tree.sha, "")]
+    while stack:
+        tree_sha, prefix = stack.pop()
+        listing = await client.get_tree(owner, repo, tree_sha)
+        for obj in listing.tree:
+            path = prefix + obj.path
+            if obj.type == "tree":
+                if descend is None or descend(path):
+                    stack.append((obj.sha, path + "/"))
+            elif obj.type == "blob":
+                files[path] = obj.sha
+    return files
+
+
+async def fetch_github_blobs(client, owner: str, repo: str, branch: str, files: Dict[str, str],
+                             concurrency: int = 5) -> List[Document]:
+    """Documents of files ({path: blob sha}), as GithubRepositoryReader would build them."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch(path: str, sha: str):
+        async with sem:
+            blob = await client.get_blob(owner, repo, sha)
+        if blob is None:
+            return None
+        url = f"https://github.com/{owner}/{repo}/blob/{branch}/{path}"
+        return blob_document(path, sha, base64.b64decode(blob.content), url)
+
+    docs = await asyncio.gather(*(fetch(path, sha) for path, sha in sorted(files.items())))
+    return [d for d in docs if d is not None]
+
+
+async def refresh_index(index, tree: Dict[str, str],
+                        fetch: Callable[[Dict[str, str]], Awaitable[List[Document]]],
+                        skipped: Optional[Set[str]] = None) -> Dict[str, int]:
+    """
+    Bring index up to date with tree ({path: blob sha}), fetching and embedding only new SHAs.
+    skipped holds the SHAs known to make no document; it is updated in place.
+    """
+    skipped = skipped if skipped is not None else set()
+    known = indexed_files(index)
+    live = set(tree.values())
+    missing = {path: sha for path, sha in tree.items() if sha not in known and sha not in skipped}
+    new_docs = await fetch(missing) if missing else []
+    skipped.intersection_update(live)
+    skipped.update(set(missing.values()) - {doc.doc_id for doc in new_docs})
+
+    new_paths = {doc.metadata.get("file_path") for doc in new_docs}
+    stale = [sha for sha in known if sha not in live]
+    stats = {"added": 0, "changed": 0, "deleted": 0, "unchanged": len(live & set(known))}
+    for sha in stale:
+        index.delete_ref_doc(sha, delete_from_docstore=True)
+        if known[sha] not in new_paths:
+            stats["deleted"] += 1
+    old_paths = set(known.values())
+    for doc in new_docs:
+        index.insert(doc)
+        stats["changed" if doc.metadata.get("file_path") in old_paths else "added"] += 1
+    return stats
@@ -0,0 +1,257 @@
+"""
+Java-aware chunking for the reference-implementation index.
+
+The ftgo index was split by the default sentence splitter, so retrieved
+nodes were windows of raw files: half a class, the license header, thirty
+imports. JavaNodeParser splits .java files on type and member boundaries
+instead. Each chunk holds whole fields and methods of one type, under the
+package line and the type declaration (annotations included), and stops
+near max_chars. License headers, imports and the type's Javadoc are
+dropped. Other files go through the sentence splitter as before:
+
+    index = VectorStoreIndex.from_documents(docs, transformations=index_transformations())
+    node.metadata  # {"package": "net.chrisrichardson.ftgo.orderservice.sagas.createorder",
+                   #  "class_name": "CreateOrderSaga", "kind": "class",
+                   #  "annotations": "", "members": "CreateOrderSaga, getSagaDefinition", ...}
+
+JAVA_CHUNK_MAX_CHARS sets the target chunk size (default 1500). A single
+member longer than four times that is cut at line boundaries.
+"""
+import os
+import re
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+from llama_index.core.node_parser import NodeParser, SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode
+from pydantic import Field
+
+_PACKAGE = re.compile(r"^\s*package\s+([\w.]+)\s*;", re.MULTILINE)
+_TYPE_DECL = re.compile(r"(?<![\w.$])(class|interface|enum|record)\s+([A-Za-z_$][\w$]*)")
+_ANNOTATION = re.compile(r"@\s*(?!interface\b)([\w.]+)\s*(\((?:[^()]|\([^()]*\))*\))?")
+_CALL = re.compile(r"([A-Za-z_$][\w$]*)\s*\(")
+_BLANK_RUNS = re.compile(r"\n\s*\n(\s*\n)+")
+
+
+class JavaChunk(NamedTuple):
+    text: str
+    metadata: dict
+
+
+def max_chunk_chars() -> int:
+    return max(200, int(os.getenv("JAVA_CHUNK_MAX_CHARS", "1500")))
+
+
+def _mask(src: str) -> str:
+    """src with comment and literal contents blanked (same length, newlines kept)."""
+    out = list(src)
+    n = len(src)
+
+    def blank(a: int, b: int) -> None:
+        for k in range(a, min(b, n)):
+            if out[k] != "\n":
+                out[k] = " "
+
+    i = 0
+    while i < n:
+        c = src[i]
+        if c == "/" and src.startswith("//", i):
+            j = src.find("\n", i)
+            j = n if j < 0 else j
+            blank(i, j)
+            i = j
+        elif c == "/" and src.startswith("/*", i):
+            j = src.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            blank(i, j)
+            i = j
+        elif c == '"' and src.startswith('"""', i):
+            j = src.find('"""', i + 3)
+            j = n if j < 0 else j + 3
+            blank(i + 3, j - 3)
+            i = j
+        elif c in "\"'":
+            j = i + 1
+            while j < n and src[j] != c and src[j] != "\n":
+                j += 2 if src[j] == "\\" else 1
+            blank(i + 1, j)
+            i = j + 1
+        else:
+            i += 1
+    return "".join(out)
+
+
+def _assigns(masked: str) -> bool:
+    """An '=' outside parentheses: a field initializer rather than a declaration header."""
+    depth = 0
+    for k, c in enumerate(masked):
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth = max(0, depth - 1)
+        elif c == "=" and depth == 0:
+            prev = masked[k - 1] if k else ""
+            nxt = masked[k + 1] if k + 1 < len(masked) else ""
+            if nxt != "=" and prev not in "=<>!":
+                return True
+    return False
+
+
+def _segments(masked: str, start: int, end: int) -> List[Tuple[int, Optional[int], int]]:
+    """
+    Top-level declarations of masked[start:end] as (start, opening brace or
+    None, end): each ends at a ';' or at the '}' closing its block.
+    """
+    segs = []
+    depth = parens = 0
+    seg, opener = start, None
+    for i in range(start, end):
+        c = masked[i]
+        if c == "(":
+            parens += 1
+        elif c == ")":
+            parens = max(0, parens - 1)
+        elif c == "{":
+            if depth == 0 and parens == 0 and opener is None:
+                opener = i
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth < 0:
+                break
+            if depth == 0 and parens == 0 and opener is not None and not _assigns(masked[seg:opener]):
+                segs.append((seg, opener, i + 1))
+                seg, opener = i + 1, None
+        elif c == ";" and depth == 0 and parens == 0:
+            segs.append((seg, opener, i + 1))
+            seg, opener = i + 1, None
+    if masked[seg:end].strip():
+        segs.append((seg, opener, end))
+    return segs
+
+
+def _code_start(masked: str, start: int, end: int) -> int:
+    """First position of code in [start, end), skipping whitespace and comments (blanked in masked)."""
+    m = re.compile(r"\S").search(masked, start, end)
+    return m.start() if m else end
+
+
+def _clean(text: str) -> str:
+    return _BLANK_RUNS.sub("\n\n", text.strip("\n")).rstrip()
+
+
+def _split_lines(text: str, limit: int) -> List[str]:
+    parts, cur = [], ""
+    for line in text.splitlines(keepends=True):
+        if cur and len(cur) + len(line) > limit:
+            parts.append(cur.rstrip())
+            cur = ""
+        cur += line
+    if cur.strip():
+        parts.append(cur.rstrip())
+    return parts
+
+
+def _type_chunks(src: str, masked: str, seg: Tuple[int, int, int], package: str,
+                 outer: str, max_chars: int) -> List[JavaChunk]:
+    start, opener, end = seg
+    decl_start = _code_start(masked, start, opener)
+    header = masked[decl_start:opener]
+    found = _TYPE_DECL.search(_ANNOTATION.sub(lambda m: " " * len(m.group(0)), header))
+    kind, name = found.groups()
+    if header[found.start() - 1:found.start()] == "@":
+        kind = "annotation"
+    class_name = f"{outer}.{name}" if outer else name
+    decl = " ".join(src[decl_start:opener].split())
+    annotations = [m.group(1) for m in _ANNOTATION.finditer(header[:found.start()])]
+
+    chunks: List[JavaChunk] = []
+    members: List[Tuple[str, str]] = []  # (method name or "", text)
+    for mseg in _segments(masked, opener + 1, end - 1):
+        mstart, mopener, mend = mseg
+        mheader = masked[mstart:mopener if mopener is not None else mend]
+        bare = _ANNOTATION.sub(lambda m: " " * len(m.group(0)), mheader)
+        if mopener is not None and _TYPE_DECL.search(bare) and not _assigns(bare):
+            chunks.extend(_type_chunks(src, masked, mseg, package, class_name, max_chars))
+            continue
+        call = _CALL.search(bare)
+        method = call.group(1) if call and not _assigns(bare[:call.start()]) else ""
+        text = _clean(src[mstart:mend])
+        if text and text != ";":
+            members.append((method, text))
+
+    prefix = f"package {package};\n\n" if package else ""
+    opening = f"{prefix}{decl} {{\n"
+    budget = max(max_chars - len(opening) - 2, 1)
+
+    groups: List[List[Tuple[str, str]]] = []
+    size = 0
+    for method, text in members:
+        pieces = _split_lines(text, budget) if len(text) > 4 * max_chars else [text]
+        for piece in pieces:
+            if groups and groups[-1] and size + len(piece) + 2 <= budget:
+                groups[-1].append((method, piece))
+                size += len(piece) + 2
+            else:
+                groups.append([(method, piece)])
+                size = len(piece)
+    own = [
+        JavaChunk(
+            text=opening + "\n\n".join(t for _, t in group) + "\n}",
+            metadata={
+                "package": package,
+                "class_name": class_name,
+                "kind": kind,
+                "annotations": ", ".join(annotations),
+                "members": ", ".join(dict.fromkeys(m for m, _ in group if m)),
+            },
+        )
+        for group in (groups or [[]])
+    ]
+    return own + chunks
+
+
+def java_chunks(src: str, max_chars: Optional[int] = None) -> List[JavaChunk]:
+    """Chunks of every type declared in a Java source file; [] when none is found."""
+    max_chars = max_chars or max_chunk_chars()
+    masked = _mask(src)
+    m = _PACKAGE.search(masked)
+    package = m.group(1) if m else ""
+    chunks: List[JavaChunk] = []
+    for seg in _segments(masked, 0, len(masked)):
+        start, opener, _ = seg
+        if opener is None:
+            continue  # package, imports
+        if _TYPE_DECL.search(_ANNOTATION.sub(lambda a: " " * len(a.group(0)), masked[start:opener])):
+            chunks.extend(_type_chunks(src, masked, seg, package, "", max_chars))
+    return chunks
+
+
+class JavaNodeParser(NodeParser):
+    """Splits .java documents on type and member boundaries; other files use the fallback splitter."""
+
+    max_chars: int = Field(default_factory=max_chunk_chars, description="Target chunk size in characters.")
+    fallback: NodeParser = Field(default_factory=SentenceSplitter, description="Parser for non-Java files.")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "JavaNodeParser"
+
+    def _parse_nodes(self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any) -> List[BaseNode]:
+        out: List[BaseNode] = []
+        for node in nodes:
+            if node.metadata.get("file_path", "").endswith(".java"):
+                chunks = java_chunks(node.get_content(), self.max_chars)
+                if chunks:
+                    built = build_nodes_from_splits([c.text for c in chunks], node, id_func=self.id_func)
+                    for n, c in zip(built, chunks):
+                        n.metadata.update(c.metadata)
+                    out.extend(built)
+                    continue
+            out.extend(self.fallback._parse_nodes([node], show_progress=show_progress, **kwargs))
+        return out
+
+
+def index_transformations() -> List[NodeParser]:
+    """Transformations used to build and update the reference-implementation index."""
+    return [JavaNodeParser()]
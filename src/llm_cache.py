@@ -0,0 +1,116 @@
+"""
+Content-addressed on-disk cache of LLM responses.
+
+Entries are keyed by a SHA-256 over (provider, model, temperature, rendered
+prompt or messages, output schema) and stored as one JSON file each under
+.cache/llm_responses/<2-char prefix>/<key>.json, so re-running main_batch.py or
+eval/judge.py over the same inputs needs no network at all.
+
+Modes (env LLM_CACHE_MODE, or set_cache_mode()):
+  off     - bypass the cache (default)
+  read    - read-through: serve hits, call the LLM on a miss and store the result
+  record  - record-only: always call the LLM and (over)write the entry
+  replay  - strict-replay: serve hits, raise CacheMiss on a miss
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+MODES = ("off", "read", "record", "replay")
+
+
+class CacheMiss(RuntimeError):
+    """Raised in strict-replay mode when a request has no recorded response."""
+
+
+def llm_identity(llm) -> Dict[str, Any]:
+    """Provider, model and temperature of a LlamaIndex LLM, as used in cache keys."""
+    try:
+        model = llm.metadata.model_name
+    except Exception:
+        model = getattr(llm, "model", None)
+    return {
+        "provider": type(llm).__name__,
+        "model": model,
+        "temperature": getattr(llm, "temperature", None),
+    }
+
+
+class LLMCache:
+    def __init__(self, root: Path, mode: str = "off"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode!r} (expected one of {MODES})")
+        self.root = Path(root)
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def key(self, llm, request: Any, schema: Optional[dict] = None) -> str:
+        blob = json.dumps(
+            {**llm_identity(llm), "request": request, "schema": schema},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the stored response for key, honouring the current mode."""
+        if self.mode in ("off", "record"):
+            return None
+        p = self._path(key)
+        if p.exists():
+            with self._lock:
+                self.stats["hits"] += 1
+            return json.loads(p.read_text(encoding="utf-8"))["response"]
+        with self._lock:
+            self.stats["misses"] += 1
+        if self.mode == "replay":
+            raise CacheMiss(f"No recorded LLM response for key {key} (strict replay mode)")
+        return None
+
+    def put(self, key: str, response: Any, meta: Optional[dict] = None) -> None:
+        if self.mode not in ("read", "record"):
+            return
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        record = {"key": key, "created_at": time.time(), "meta": meta or {}, "response": response}
+        # Write-then-rename so concurrent readers never see a half-written entry
+        tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, p)
+        with self._lock:
+            self.stats["writes"] += 1
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_cache() -> LLMCache:
+    """Process-wide cache configured from LLM_CACHE_MODE / LLM_CACHE_DIR."""
+    global _cache
+    if _cache is None:
+        _cache = LLMCache(
+            root=Path(os.getenv("LLM_CACHE_DIR", ".cache/llm_responses")),
+            mode=os.getenv("LLM_CACHE_MODE", "off").strip().lower() or "off",
+        )
+    return _cache
+
+
+def set_cache_mode(mode: str, root: Optional[str] = None) -> LLMCache:
+    """Reconfigure the process-wide cache (used by the batch / judge CLIs)."""
+    global _cache
+    _cache = LLMCache(root=Path(root or os.getenv("LLM_CACHE_DIR", ".cache/llm_responses")), mode=mode)
+    return _cache
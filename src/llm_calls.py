@@ -0,0 +1,365 @@
+"""
+Single entry point for every LLM call made by the workflows.
+
+Steps call these helpers instead of llm.complete / llm.achat / program(...)
+directly, so cross-cutting behaviour (the on-disk response cache in
+llm_cache.py, the pre-flight token budget in token_budget.py, the
+provider rate limiter in rate_limit.py, the deadline / retry / hedging
+policy in call_policy.py and the SLO failover router in llm_router.py) sits
+under all of them in one place.
+
+    text = complete(llm, prompt, step="extract_microservices")
+    text = await achat(llm, [sysm, usr], step="generate_files")
+    output = await acall_program(program, step="retrieve_context", specs=..., ...)
+
+Workflow steps are coroutines, so they must use the async variants
+(acomplete / achat / acall_program): the sync ones block the event loop and
+serialise fan-out steps such as DalleCodeWorkflow2.extract_microservices_code.
+"""
+import asyncio
+import copy
+import json
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+from call_policy import is_transient, observe_latency, run_with_policy, run_with_policy_sync
+from llm_cache import get_cache, llm_identity
+from llm_router import enabled as failover_enabled, get_router
+from prompt_cache import for_llm, step_scope
+from rate_limit import MAX_RATE_LIMIT_RETRIES, governor_for, is_rate_limit_error, retry_after_of
+from token_budget import count_tokens, current_budget, predicted_output_tokens
+
+
+def _messages_request(messages: List[Any]) -> List[dict]:
+    return [{"role": str(getattr(m.role, "value", m.role)), "content": m.content} for m in messages]
+
+
+def _program_request(program, kwargs: dict):
+    llm = program._llm
+    prompt = program.prompt.format(llm=llm, **kwargs)
+    return llm, {"prompt": prompt}, program.output_cls.model_json_schema()
+
+
+def _record(budget, llm, step: Optional[str], prompt: str, output: str, cached: bool = False) -> None:
+    if budget is not None:
+        budget.record(llm, step, prompt, output, cached=cached)
+
+
+def _store(cache, key: Optional[str], llm, answered, response: Any, step: Optional[str]) -> None:
+    """
+    Cache response under the requested model's key, the one the next lookup
+    builds; when the router failed over, the model that answered is kept in the meta.
+    """
+    if key is None:
+        return
+    meta: dict = {"step": step}
+    if answered is not llm:
+        meta["answered_by"] = llm_identity(answered)
+    cache.put(key, response, meta=meta)
+
+
+def _fit_target(budget, llm, step: Optional[str]):
+    """
+    The client whose limits the prompt is fitted to: the failover candidate
+    with the smallest prompt limit, since the router may send it to any of them.
+    """
+    if not failover_enabled():
+        return llm
+    return min(get_router().candidates(llm, step), key=lambda c: budget.prompt_limit(c, step))
+
+
+def _size(result: Any) -> int:
+    return count_tokens(result if isinstance(result, str) else result.model_dump_json())
+
+
+def _rate_limited(gov, exc: Exception, attempt: int) -> bool:
+    """Back off after a 429; False when the error is not a 429 or retries are used up."""
+    if gov is None or not is_rate_limit_error(exc) or attempt >= MAX_RATE_LIMIT_RETRIES:
+        return False
+    pause = gov.on_rate_limited(retry_after_of(exc))
+    print(f"⏳ {gov.provider} rate limited, retrying in {pause:.1f}s ({attempt + 1}/{MAX_RATE_LIMIT_RETRIES})")
+    return True
+
+
+def _send(llm, prompt: str, call: Callable[[Any], Any], step: Optional[str] = None) -> Tuple[Any, Any]:
+    """
+    Run call(llm) under the router, the step's retry policy and the provider's
+    rate limiter (sync). Returns (client that answered, result).
+    """
+    targets = get_router().route(llm, step)
+    for i, target in enumerate(targets):
+        try:
+            return target, run_with_policy_sync(step, lambda t=target: _governed(t, prompt, call, step))
+        except Exception as e:
+            if not _fail_over(step, targets, i, e):
+                raise
+
+
+def _governed(llm, prompt: str, call: Callable[[Any], Any], step: Optional[str]) -> Any:
+    gov = governor_for(llm)
+    reserved = count_tokens(prompt) + predicted_output_tokens(llm)
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        if gov is not None:
+            gov.acquire_sync(reserved)
+        start = time.perf_counter()
+        try:
+            with step_scope(step):
+                result = call(llm)
+        except Exception as e:
+            get_router().observe(llm, step, time.perf_counter() - start, ok=False)
+            if gov is not None:
+                gov.settle(reserved, 0)
+            if _rate_limited(gov, e, attempt):
+                continue
+            raise
+        elapsed = time.perf_counter() - start
+        get_router().observe(llm, step, elapsed, ok=True)
+        observe_latency(step, elapsed)
+        if gov is not None:
+            gov.settle(reserved, count_tokens(prompt) + _size(result))
+        return result
+
+
+async def _asend(
+    llm, prompt: str, call: Callable[[Any], Awaitable[Any]], step: Optional[str] = None
+) -> Tuple[Any, Any]:
+    """
+    Await call(llm) under the router, the step's deadline/retry/hedging policy
+    and the rate limiter. Returns (client that answered, result).
+    """
+    targets = get_router().route(llm, step)
+    for i, target in enumerate(targets):
+        try:
+            return target, await run_with_policy(
+                step,
+                lambda t=target: _agoverned(t, prompt, call, step),
+                on_discard=lambda result, t=target: _bill_unused(t, step, prompt, _size(result)),
+            )
+        except Exception as e:
+            if not _fail_over(step, targets, i, e):
+                raise
+
+
+async def _agoverned(llm, prompt: str, call: Callable[[Any], Awaitable[Any]], step: Optional[str]) -> Any:
+    """Await call(llm) under the provider's rate limiter, retrying on 429."""
+    gov = governor_for(llm)
+    reserved = count_tokens(prompt) + predicted_output_tokens(llm)
+    for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+        if gov is not None:
+            await gov.acquire(reserved)
+        start = time.perf_counter()
+        try:
+            with step_scope(step):
+                result = await call(llm)
+        except asyncio.CancelledError:
+            # Deadline or a winning hedge: count it as slow, not as an error. The
+            # prompt was sent and is billed; the output so far is unknown
+            get_router().observe(llm, step, time.perf_counter() - start, ok=True)
+            _bill_unused(llm, step, prompt, 0, estimated=True)
+            raise
+        except Exception as e:
+            get_router().observe(llm, step, time.perf_counter() - start, ok=False)
+            if gov is not None:
+                gov.settle(reserved, 0)
+            if _rate_limited(gov, e, attempt):
+                continue
+            raise
+        elapsed = time.perf_counter() - start
+        get_router().observe(llm, step, elapsed, ok=True)
+        observe_latency(step, elapsed)
+        if gov is not None:
+            gov.settle(reserved, count_tokens(prompt) + _size(result))
+        return result
+
+
+def _bill_unused(llm, step: Optional[str], prompt: str, output_tokens: int, estimated: bool = False) -> None:
+    """Ledger entry for a request whose answer is thrown away (see call_policy hedging)."""
+    budget = current_budget()
+    if budget is not None:
+        budget.record_unused(llm, step, count_tokens(prompt), output_tokens, estimated=estimated)
+
+
+def _fail_over(step: Optional[str], targets: List[Any], i: int, exc: Exception) -> bool:
+    """After the retries on targets[i] are used up on a transient error, move to the next client."""
+    if i + 1 >= len(targets) or not (is_transient(exc) or is_rate_limit_error(exc)):
+        return False
+    router = get_router()
+    router.log(step, targets[i], targets[i + 1], f"error: {type(exc).__name__}", router.health(targets[i], step))
+    return True
+
+
+def _with_llm(program, llm):
+    """program itself, or a shallow copy that sends through llm (for failover)."""
+    if llm is program._llm:
+        return program
+    routed = copy.copy(program)
+    routed._llm = llm
+    templates = getattr(program.prompt, "message_templates", None)
+    if templates is not None and for_llm(templates, llm) is not templates:
+        routed._prompt = program.prompt.model_copy(update={"message_templates": for_llm(templates, llm)})
+    return routed
+
+
+def complete(llm, prompt: str, step: Optional[str] = None) -> str:
+    """llm.complete(prompt).text, served from the response cache when possible."""
+    budget = current_budget()
+    if budget is not None:
+        prompt = budget.fit_text(_fit_target(budget, llm, step), prompt, step)
+    cache = get_cache()
+    key = cache.key(llm, {"prompt": prompt}) if cache.enabled else None
+    hit = cache.get(key) if key is not None else None
+    if hit is not None:
+        _record(budget, llm, step, prompt, hit, cached=True)
+        return hit
+    answered, text = _send(llm, prompt, lambda target: target.complete(prompt).text, step)
+    _store(cache, key, llm, answered, text, step)
+    _record(budget, answered, step, prompt, text)
+    return text
+
+
+async def acomplete(llm, prompt: str, step: Optional[str] = None) -> str:
+    """Async counterpart of complete()."""
+    budget = current_budget()
+    if budget is not None:
+        prompt = budget.fit_text(_fit_target(budget, llm, step), prompt, step)
+    cache = get_cache()
+    key = cache.key(llm, {"prompt": prompt}) if cache.enabled else None
+    hit = cache.get(key) if key is not None else None
+    if hit is not None:
+        _record(budget, llm, step, prompt, hit, cached=True)
+        return hit
+
+    async def call(target):
+        return (await target.acomplete(prompt)).text
+
+    answered, text = await _asend(llm, prompt, call, step)
+    _store(cache, key, llm, answered, text, step)
+    _record(budget, answered, step, prompt, text)
+    return text
+
+
+async def achat(llm, messages: List[Any], step: Optional[str] = None) -> str:
+    """(await llm.achat(messages)).message.content, served from the cache when possible."""
+    budget = current_budget()
+    if budget is not None:
+        messages = budget.fit_messages(_fit_target(budget, llm, step), messages, step)
+    prompt = "\n".join(m.content or "" for m in messages)
+    cache = get_cache()
+    key = cache.key(llm, {"messages": _messages_request(messages)}) if cache.enabled else None
+    hit = cache.get(key) if key is not None else None
+    if hit is not None:
+        _record(budget, llm, step, prompt, hit, cached=True)
+        return hit
+
+    async def call(target):
+        return (await target.achat(messages=for_llm(messages, target))).message.content
+
+    answered, text = await _asend(llm, prompt, call, step)
+    _store(cache, key, llm, answered, text, step)
+    _record(budget, answered, step, prompt, text)
+    return text
+
+
+def call_program(program, step: Optional[str] = None, **kwargs):
+    """program(**kwargs) for an LLMTextCompletionProgram, cached on the rendered prompt + schema."""
+    budget = current_budget()
+    if budget is not None:
+        kwargs = budget.fit_program_kwargs(program, kwargs, step, llm=_fit_target(budget, program._llm, step))
+    llm, request, schema = _program_request(program, kwargs)
+    cache = get_cache()
+    key = cache.key(llm, request, schema) if cache.enabled else None
+    hit = cache.get(key) if key is not None else None
+    if hit is not None:
+        _record(budget, llm, step, request["prompt"], json.dumps(hit), cached=True)
+        return program.output_cls.model_validate(hit)
+    answered, output = _send(llm, request["prompt"], lambda target: _with_llm(program, target)(**kwargs), step)
+    dumped = output.model_dump_json()
+    _store(cache, key, llm, answered, json.loads(dumped), step)
+    _record(budget, answered, step, request["prompt"], dumped)
+    return output
+
+
+async def acall_program(program, step: Optional[str] = None, **kwargs):
+    """Async counterpart of call_program() (program.acall)."""
+    budget = current_budget()
+    if budget is not None:
+        kwargs = budget.fit_program_kwargs(program, kwargs, step, llm=_fit_target(budget, program._llm, step))
+    llm, request, schema = _program_request(program, kwargs)
+    cache = get_cache()
+    key = cache.key(llm, request, schema) if cache.enabled else None
+    hit = cache.get(key) if key is not None else None
+    if hit is not None:
+        _record(budget, llm, step, request["prompt"], json.dumps(hit), cached=True)
+        return program.output_cls.model_validate(hit)
+    answered, output = await _asend(
+        llm, request["prompt"], lambda target: _with_llm(program, target).acall(**kwargs), step
+    )
+    dumped = output.model_dump_json()
+    _store(cache, key, llm, answered, json.loads(dumped), step)
+    _record(budget, answered, step, request["prompt"], dumped)
+    return output
+
+
+async def astream_complete(llm, prompt: str, step: Optional[str] = None) -> AsyncIterator[str]:
+    """Yield text deltas of llm.astream_complete(prompt); a cache hit is replayed as one delta."""
+    budget = current_budget()
+    if budget is not None:
+        prompt = budget.fit_text(_fit_target(budget, llm, step), prompt, step)
+    cache = get_cache()
+    key = cache.key(llm, {"prompt": prompt}) if cache.enabled else None
+    if key is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            _record(budget, llm, step, prompt, hit, cached=True)
+            yield hit
+            return
+    # Deltas may already have reached the caller when a stream fails, so a 429
+    # here only feeds the limiter; it is not retried (the router still picks the client)
+    answered = get_router().route(llm, step)[0]
+    gov = governor_for(answered)
+    reserved = count_tokens(prompt) + predicted_output_tokens(answered)
+    if gov is not None:
+        await gov.acquire(reserved)
+    parts: List[str] = []
+    try:
+        async for chunk in await answered.astream_complete(prompt):
+            delta = chunk.delta or ""
+            parts.append(delta)
+            yield delta
+    except Exception as e:
+        if gov is not None and is_rate_limit_error(e):
+            gov.on_rate_limited(retry_after_of(e))
+        raise
+    finally:
+        if gov is not None:
+            gov.settle(reserved, count_tokens(prompt) + count_tokens("".join(parts)))
+    text = "".join(parts)
+    _store(cache, key, llm, answered, text, step)
+    _record(budget, answered, step, prompt, text)
+
+
+async def asynthesize(llm, template, query: str, texts: List[str], step: Optional[str] = None) -> str:
+    """
+    Tree-summarize texts into an answer to query, as
+    get_response_synthesizer(response_mode=TREE_SUMMARIZE) does, but with
+    every request sent through acomplete. template takes context_str and
+    query_str; under a "split" budget each level is packed into requests
+    that fit and the answers are summarized again until one is left.
+    """
+    budget = current_budget()
+
+    def pack(chunks: List[str]) -> List[str]:
+        if budget is None:
+            return ["\n\n".join(chunks)]
+        return budget.pack_documents(llm, chunks, template.format(context_str="", query_str=query), step)
+
+    answers = texts
+    while True:
+        groups = pack(answers)
+        if 1 < len(answers) <= len(groups):
+            groups = ["\n\n".join(answers)]  # no progress: send the level as one request
+        answers = list(await asyncio.gather(
+            *(acomplete(llm, template.format(context_str=g, query_str=query), step) for g in groups)
+        ))
+        if len(answers) == 1:
+            return answers[0]
@@ -0,0 +1,189 @@
+"""
+Process-wide registry of LLM clients.
+
+Every workflow step used to build its own OpenAI / MistralAI / Anthropic
+object, and each of those opens its own HTTP client, so every step paid for
+connection setup and TLS again. get_llm() hands out one shared instance per
+(provider, model, params), which keeps the keep-alive pools warm across steps,
+workflows and concurrent Streamlit sessions (they all live in one process).
+Their HTTP clients report rate-limit headers to the shared limiter (rate_limit.py)
+and make no retries of their own: llm_calls is the only retry layer.
+
+With LLM_OFFLINE=1 (or the "offline" provider) every client is an OfflineLLM
+(offline_llm.py). Importing this module changes no global state: entry points
+call configure() once, which loads .env and, offline, makes the offline LLM
+and embeddings the LlamaIndex defaults.
+
+Usage:
+    configure()                                  # once, in main.py / main_batch.py / CLIs
+    llm = llm_for(model_choice, "code")          # per-step preset
+    llm = get_llm("openai", "gpt-4.1", temperature=0, timeout=9999.0)
+    print(pool_stats())                          # {'hits': .., 'misses': .., 'clients': ..}
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, Tuple
+
+import openai
+from dotenv import load_dotenv
+from llama_index.llms.mistralai import MistralAI
+from llama_index.llms.openai import OpenAI
+from llama_index.llms.anthropic import Anthropic
+
+from offline_llm import OFFLINE, OfflineLLM, install as install_offline, offline_enabled
+from rate_limit import attach_header_hooks, header_hooks
+
+
+PROVIDERS = {
+    "openai": OpenAI,
+    "mistral": MistralAI,
+    "anthropic": Anthropic,
+}
+
+# Env var holding each provider's key; part of the registry key so a key
+# entered in the Streamlit UI never reuses a client built with another one.
+API_KEY_ENV = {
+    "openai": "OPENAI_API_KEY",
+    "mistral": "MISTRAL_API_KEY",
+    "anthropic": "ANTHROPIC_API_KEY",
+}
+
+# Names accepted from the UI / CLI / MODEL env var for each provider
+PROVIDER_ALIASES = {
+    "claude": "anthropic",
+}
+
+# Per-step model choices of the workflows: provider -> role -> (model, params).
+# "default" is used for any role a provider does not override.
+PRESETS: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]] = {
+    "mistral": {
+        "default": ("mistral-large-2411", {"temperature": 0, "timeout": 9999.0, "max_tokens": 9000}),
+        "code": ("codestral-2508", {"temperature": 0, "timeout": 9999.0, "max_tokens": 9000}),
+    },
+    "anthropic": {
+        "default": ("claude-sonnet-4-5", {"temperature": 1.0, "max_tokens": 64000, "timeout": 9999.0}),
+    },
+    "openai": {
+        "default": ("gpt-4.1", {"temperature": 0, "timeout": 9999.0}),
+        "context": ("gpt-4.1", {"reasoning_effort": "low", "temperature": 0, "timeout": 9999.0}),
+        "code": ("gpt-4.1", {"reasoning_effort": "medium", "temperature": 0, "timeout": 9999.0}),
+    },
+}
+
+# Retries belong to llm_calls (rate_limit's 429 handling and call_policy's
+# LLM_RETRIES); SDK-level retries would multiply with them, so they are off
+# unless a caller passes max_retries explicitly.
+SDK_PARAMS = {"max_retries": 0}
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[str, str, str, str], Any] = {}
+_roles: Dict[int, str] = {}  # id(llm) -> preset role it was handed out for
+_stats = {"hits": 0, "misses": 0}
+
+
+def normalize_provider(name: str) -> str:
+    """Map 'claude', 'anthropic/claude-haiku-4-5', 'OpenAI' ... to a registry provider key."""
+    p = (name or "openai").strip().lower().split("/", 1)[0]
+    p = PROVIDER_ALIASES.get(p, p)
+    return p if p in PROVIDERS or p == OFFLINE else "openai"
+
+
+def _key(provider: str, model: str, params: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    api_key = params.get("api_key") or os.getenv(API_KEY_ENV[provider], "")
+    key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return provider, model, json.dumps(params, sort_keys=True, default=str), key_id
+
+
+def _http_clients(provider: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    httpx clients reporting rate-limit headers to rate_limit (OpenAI accepts them as params).
+
+    Built from the SDK's own httpx subclasses so they keep its connection
+    limits, 600s read timeout and redirect handling (plain httpx times out after 5s).
+    """
+    if provider != "openai" or "http_client" in params or "async_http_client" in params:
+        return {}
+    hook, ahook = header_hooks(provider)
+    return {
+        "http_client": openai.DefaultHttpxClient(event_hooks={"response": [hook]}),
+        "async_http_client": openai.DefaultAsyncHttpxClient(event_hooks={"response": [ahook]}),
+    }
+
+
+def get_llm(provider: str, model: str, **params):
+    """Return the shared LLM for (provider, model, params), creating it on first use."""
+    provider = normalize_provider(provider)
+    if provider == OFFLINE or offline_enabled():
+        return _offline_llm(provider, model, params)
+    key = _key(provider, model, params)
+    with _lock:
+        llm = _clients.get(key)
+        if llm is not None:
+            _stats["hits"] += 1
+            return llm
+        _stats["misses"] += 1
+        llm = PROVIDERS[provider](model=model, **{**SDK_PARAMS, **params}, **_http_clients(provider, params))
+        attach_header_hooks(llm, provider)
+        _clients[key] = llm
+        return llm
+
+
+def _offline_llm(provider: str, model: str, params: Dict[str, Any]):
+    """Shared OfflineLLM standing in for (provider, model)."""
+    name = OFFLINE if provider == OFFLINE else f"{OFFLINE}/{provider}/{model}"
+    key = (OFFLINE, name, json.dumps(params, sort_keys=True, default=str), "")
+    with _lock:
+        llm = _clients.get(key)
+        if llm is not None:
+            _stats["hits"] += 1
+            return llm
+        _stats["misses"] += 1
+        llm = OfflineLLM.from_env(name, max_tokens=params.get("max_tokens"))
+        _clients[key] = llm
+        return llm
+
+
+def llm_for(model_choice: str, role: str = "default"):
+    """Return the shared LLM a workflow step uses for the user-selected provider."""
+    provider = normalize_provider(model_choice)
+    presets = PRESETS.get(provider, PRESETS["openai"])
+    model, params = presets.get(role, presets["default"])
+    llm = get_llm(provider, model, **params)
+    with _lock:
+        _roles.setdefault(id(llm), role)
+    return llm
+
+
+def role_of(llm) -> str:
+    """Preset role an LLM was obtained for via llm_for ("default" for direct get_llm clients)."""
+    with _lock:
+        return _roles.get(id(llm), "default")
+
+
+def has_credentials(provider: str) -> bool:
+    env = API_KEY_ENV.get(normalize_provider(provider))
+    return bool(env and os.getenv(env))
+
+
+def pool_stats() -> Dict[str, int]:
+    """Hit/miss counters of the registry plus the number of live clients."""
+    with _lock:
+        return {**_stats, "clients": len(_clients)}
+
+
+def reset_pool() -> None:
+    """Drop every cached client (e.g. after rotating API keys)."""
+    with _lock:
+        _clients.clear()
+        _roles.clear()
+        _stats["hits"] = 0
+        _stats["misses"] = 0
+
+
+def configure() -> None:
+    """Load .env and, with LLM_OFFLINE=1, install the offline LLM and embeddings as LlamaIndex defaults."""
+    load_dotenv()
+    if offline_enabled():
+        install_offline(get_llm(OFFLINE, OFFLINE))
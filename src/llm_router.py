@@ -0,0 +1,187 @@
+"""
+Latency-SLO driven provider failover for individual LLM calls.
+
+The UI / MODEL env var pick one provider for a whole run, so a degraded
+provider slows every step. llm_calls asks route(llm, step) which client to
+use for each call:
+
+  - the router keeps a rolling window (last WINDOW_S seconds) of latency and
+    success per (provider, model, step), fed by observe();
+  - the requested client is used unless it breaches the step's SLO: p95
+    latency above LLM_SLO_P95_S (default 120s; per step via LLM_STEP_SLOS,
+    e.g. "generate_code=300") or error rate above LLM_SLO_ERROR_RATE
+    (default 0.25), measured over at least MIN_SAMPLES calls;
+  - it then fails over to the same preset role (llm_clients.PRESETS) of
+    another provider the step allows and has an API key for, preferring
+    healthy candidates. A breach expires with its samples, after which the
+    primary is probed again.
+
+Failover is off by default, so a run answers with the model it asked for.
+LLM_FAILOVER_STEPS ("generate_code=anthropic|mistral,plan_service=") turns
+it on for the listed steps only, with the providers each may use;
+LLM_FAILOVER=1 turns it on for every step except PINNED_STEPS (the judge
+must stay on one model for comparable scores), LLM_FAILOVER=0 disables it.
+
+Every failover is appended to LLM_ROUTING_LOG (default
+.cache/routing_decisions.jsonl) with the SLO figures that triggered it, and
+llm_calls caches and bills the answer under the model that actually gave it,
+so benchmark runs can report which model answered.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from llm_cache import llm_identity
+from llm_clients import PRESETS, has_credentials, llm_for, role_of
+from rate_limit import PROVIDER_OF_CLASS
+
+
+WINDOW_S = 300.0
+MIN_SAMPLES = 5
+DEFAULT_SLO_P95_S = 120.0
+DEFAULT_SLO_ERROR_RATE = 0.25
+
+PINNED_STEPS = {"judge"}
+
+_Key = Tuple[str, str, str]
+
+
+def _failover_flag() -> Optional[bool]:
+    raw = os.getenv("LLM_FAILOVER", "").strip().lower()
+    if not raw:
+        return None
+    return raw not in ("0", "false", "off", "no")
+
+
+def enabled() -> bool:
+    flag = _failover_flag()
+    return bool(os.getenv("LLM_FAILOVER_STEPS", "").strip()) if flag is None else flag
+
+
+def _parse_map(raw: str) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            out[name.strip()] = value.strip()
+    return out
+
+
+def slo_for(step: Optional[str]) -> Tuple[float, float]:
+    per_step = _parse_map(os.getenv("LLM_STEP_SLOS", ""))
+    p95 = float(per_step.get(step or "", os.getenv("LLM_SLO_P95_S", DEFAULT_SLO_P95_S)))
+    return p95, float(os.getenv("LLM_SLO_ERROR_RATE", DEFAULT_SLO_ERROR_RATE))
+
+
+def allowed_providers(step: Optional[str]) -> List[str]:
+    per_step = _parse_map(os.getenv("LLM_FAILOVER_STEPS", ""))
+    if (step or "") in per_step:
+        return [p for p in per_step[step or ""].split("|") if p in PRESETS]
+    if (step or "") in PINNED_STEPS or not _failover_flag():
+        return []
+    return list(PRESETS)
+
+
+def provider_of(llm) -> Optional[str]:
+    return PROVIDER_OF_CLASS.get(type(llm).__name__)
+
+
+class Router:
+    def __init__(self):
+        self._samples: Dict[_Key, Deque[Tuple[float, float, bool]]] = {}
+        self._lock = threading.Lock()
+        self.decisions: Dict[str, int] = {}
+
+    def _key(self, llm, step: Optional[str]) -> _Key:
+        return provider_of(llm) or type(llm).__name__, str(llm_identity(llm)["model"]), step or ""
+
+    def observe(self, llm, step: Optional[str], latency: float, ok: bool) -> None:
+        now = time.time()
+        with self._lock:
+            window = self._samples.setdefault(self._key(llm, step), deque(maxlen=500))
+            window.append((now, latency, ok))
+
+    def health(self, llm, step: Optional[str]) -> Dict[str, Any]:
+        """Rolling p95 latency / error rate of llm on step and whether it breaches the SLO."""
+        cutoff = time.time() - WINDOW_S
+        with self._lock:
+            window = self._samples.get(self._key(llm, step), deque())
+            while window and window[0][0] < cutoff:
+                window.popleft()
+            samples = list(window)
+        slo_p95, slo_err = slo_for(step)
+        if len(samples) < MIN_SAMPLES:
+            return {"samples": len(samples), "p95_s": None, "error_rate": None, "breach": False}
+        latencies = sorted(lat for _, lat, ok in samples if ok)
+        p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None
+        error_rate = sum(1 for _, _, ok in samples if not ok) / len(samples)
+        breach = error_rate > slo_err or (p95 is not None and p95 > slo_p95)
+        return {"samples": len(samples), "p95_s": p95, "error_rate": round(error_rate, 3), "breach": breach}
+
+    def candidates(self, llm, step: Optional[str]) -> List[Any]:
+        """llm followed by equivalent clients of the other providers the step allows."""
+        current = provider_of(llm)
+        if current is None:
+            return [llm]
+        role = role_of(llm)
+        out = [llm]
+        for provider in allowed_providers(step):
+            if provider != current and has_credentials(provider):
+                out.append(llm_for(provider, role))
+        return out
+
+    def route(self, llm, step: Optional[str]) -> List[Any]:
+        """Clients to try for this call, best first: the requested one unless it breaches its SLO."""
+        if not enabled():
+            return [llm]
+        candidates = self.candidates(llm, step)
+        if len(candidates) == 1:
+            return candidates
+        primary = self.health(llm, step)
+        if not primary["breach"]:
+            return candidates
+        healthy = [c for c in candidates[1:] if not self.health(c, step)["breach"]]
+        if not healthy:
+            return candidates
+        chosen = healthy[0]
+        self.log(step, llm, chosen, "slo_breach", primary)
+        return [chosen] + [c for c in candidates if c is not chosen]
+
+    def log(self, step: Optional[str], requested, chosen, reason: str, health: Dict[str, Any]) -> None:
+        req, cho = llm_identity(requested), llm_identity(chosen)
+        label = f"{provider_of(requested)}/{req['model']} -> {provider_of(chosen)}/{cho['model']}"
+        with self._lock:
+            self.decisions[label] = self.decisions.get(label, 0) + 1
+        print(f"🔀 {step or 'LLM call'}: {label} ({reason}, {health})")
+        record = {
+            "ts": time.time(),
+            "step": step,
+            "requested": {"provider": provider_of(requested), "model": req["model"]},
+            "chosen": {"provider": provider_of(chosen), "model": cho["model"]},
+            "reason": reason,
+            "primary_health": health,
+        }
+        path = Path(os.getenv("LLM_ROUTING_LOG", ".cache/routing_decisions.jsonl"))
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock, open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not write routing log {path}: {e}")
+
+
+_router = Router()
+
+
+def get_router() -> Router:
+    return _router
+
+
+def routing_stats() -> Dict[str, int]:
+    """Number of failovers per 'provider/model -> provider/model'."""
+    with _router._lock:
+        return dict(_router.decisions)
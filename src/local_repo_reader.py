@@ -0,0 +1,192 @@
+"""
+Read a reference repository from disk instead of the GitHub API.
+
+build_github_retriever could only ingest through GithubRepositoryReader: it
+needs a token, fetches one blob per request and cannot run on air-gapped
+hosts. LocalRepositoryReader reads a checkout, a tarball or a zip download
+of the same repository and returns the documents GithubRepositoryReader
+would: the git blob SHA of the file as doc_id and file_path / file_name /
+url metadata, so the persisted index has the same format and either source
+can refresh it (tree() lists {path: blob sha}, load_data(file_paths=...)
+reads just those files; see github_index.refresh_index):
+
+    reader = LocalRepositoryReader("vendor/ftgo-application.tar.gz",
+                                   owner="microservices-patterns", repo="ftgo-application",
+                                   filter_file_extensions=([".png", ".svg"], FilterType.EXCLUDE))
+    docs = reader.load_data(branch="master")
+
+Directory and extension filters take the same (list, FilterType) tuples as
+GithubRepositoryReader. Files of a checkout are read in parallel
+(LOCAL_REPO_WORKERS threads, default 8); an archive is a single stream and
+is read in order. The top-level folder of an archive (ftgo-application-master/)
+is stripped.
+"""
+import hashlib
+import os
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from llama_index.core import Document
+from llama_index.readers.github import GithubRepositoryReader
+
+FilterType = GithubRepositoryReader.FilterType
+
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA git (and the GitHub tree API) gives a blob with this content."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _extension(path: str) -> str:
+    # Same rule as the GitHub reader: "json" never matches, ".json" does
+    return f".{os.path.splitext(path)[1][1:].lower()}"
+
+
+def reader_workers() -> int:
+    return max(1, int(os.getenv("LOCAL_REPO_WORKERS", "8")))
+
+
+def allowed_path(path: str, filter_directories: Optional[Tuple[List[str], FilterType]] = None,
+                 filter_file_extensions: Optional[Tuple[List[str], FilterType]] = None) -> bool:
+    """Filter rules of GithubRepositoryReader for a file path relative to the repo root."""
+    if filter_directories is not None:
+        dirs, kind = filter_directories
+        inside = any(path.startswith(d) for d in dirs)
+        if inside != (kind == FilterType.INCLUDE):
+            return False
+    if filter_file_extensions is not None:
+        exts, kind = filter_file_extensions
+        if (_extension(path) in exts) != (kind == FilterType.INCLUDE):
+            return False
+    return True
+
+
+def allowed_dir(path: str, filter_directories: Optional[Tuple[List[str], FilterType]] = None) -> bool:
+    """False when no file under the directory path can pass filter_directories (prune it)."""
+    if filter_directories is None:
+        return True
+    dirs, kind = filter_directories
+    prefix = path.rstrip("/") + "/"
+    if kind == FilterType.INCLUDE:
+        return any(prefix.startswith(d) or d.startswith(prefix) for d in dirs)
+    return not any(prefix.startswith(d) for d in dirs)
+
+
+def blob_document(path: str, sha: str, data: bytes, url: str) -> Optional[Document]:
+    """The Document GithubRepositoryReader makes of a blob; None when it is not UTF-8 text."""
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return Document(
+        text=text,
+        doc_id=sha,
+        metadata={"file_path": path, "file_name": path.rsplit("/", 1)[-1], "url": url},
+    )
+
+
+class LocalRepositoryReader:
+    """GithubRepositoryReader.load_data() over a local checkout or archive."""
+
+    def __init__(
+        self,
+        source,
+        owner: str = "",
+        repo: str = "",
+        filter_directories: Optional[Tuple[List[str], FilterType]] = None,
+        filter_file_extensions: Optional[Tuple[List[str], FilterType]] = None,
+        max_workers: Optional[int] = None,
+    ):
+        self.source = Path(source)
+        if not self.source.exists():
+            raise FileNotFoundError(f"Reference repository not found: {self.source}")
+        self.owner = owner
+        self.repo = repo
+        self.filter_directories = filter_directories
+        self.filter_file_extensions = filter_file_extensions
+        self.max_workers = max_workers or reader_workers()
+
+    def allowed(self, path: str) -> bool:
+        return allowed_path(path, self.filter_directories, self.filter_file_extensions)
+
+    def _url(self, path: str, branch: Optional[str]) -> str:
+        if self.owner and self.repo:
+            return f"https://github.com/{self.owner}/{self.repo}/blob/{branch or 'master'}/{path}"
+        return (self.source / path).resolve().as_uri() if self.source.is_dir() else f"{self.source.name}!/{path}"
+
+    def _document(self, path: str, data: bytes, branch: Optional[str],
+                  file_exists_callback: Optional[Callable[[str], bool]]) -> Optional[Document]:
+        sha = git_blob_sha(data)
+        if file_exists_callback is not None and file_exists_callback(sha):
+            return None
+        return blob_document(path, sha, data, self._url(path, branch))
+
+    def _checkout_files(self) -> Iterator[str]:
+        for dirpath, dirnames, filenames in os.walk(self.source):
+            rel = Path(dirpath).relative_to(self.source).as_posix()
+            prefix = "" if rel == "." else rel + "/"
+            dirnames[:] = sorted(d for d in dirnames if d != ".git")
+            for name in sorted(filenames):
+                if self.allowed(prefix + name):
+                    yield prefix + name
+
+    def _allowed_member(self, path: str) -> bool:
+        # A tarball of a checkout may carry its .git folder
+        return not (path.startswith(".git/") or "/.git/" in path) and self.allowed(path)
+
+    def _archive_files(self) -> Iterator[Tuple[str, bytes]]:
+        if zipfile.is_zipfile(self.source):
+            with zipfile.ZipFile(self.source) as zf:
+                infos = [i for i in zf.infolist() if not i.is_dir()]
+                root = _common_root([_member_name(i.filename) for i in infos])
+                for info in infos:
+                    path = _member_name(info.filename)[len(root):]
+                    if self._allowed_member(path):
+                        yield path, zf.read(info)
+            return
+        with tarfile.open(self.source, "r:*") as tf:
+            members = [m for m in tf.getmembers() if m.isfile()]
+            root = _common_root([_member_name(m.name) for m in members])
+            for member in members:
+                path = _member_name(member.name)[len(root):]
+                if self._allowed_member(path):
+                    yield path, tf.extractfile(member).read()
+
+    def _read_all(self, read: Callable[[str, bytes], Any], file_paths: Optional[List[str]] = None) -> List[Any]:
+        """read(path, data) over the allowed files (only file_paths when given)."""
+        wanted = set(file_paths) if file_paths is not None else None
+        if self.source.is_dir():
+            paths = [p for p in self._checkout_files() if wanted is None or p in wanted]
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                return list(pool.map(lambda path: read(path, (self.source / path).read_bytes()), paths))
+        return [read(path, data) for path, data in self._archive_files() if wanted is None or path in wanted]
+
+    def tree(self) -> Dict[str, str]:
+        """{path: git blob sha} of the allowed files, like the GitHub tree listing."""
+        return dict(self._read_all(lambda path, data: (path, git_blob_sha(data))))
+
+    def load_data(self, branch: Optional[str] = None,
+                  file_exists_callback: Optional[Callable[[str], bool]] = None,
+                  file_paths: Optional[List[str]] = None) -> List[Document]:
+        """
+        Documents of the allowed files (only file_paths when given);
+        file_exists_callback(sha) returning True skips a file.
+        """
+        docs = self._read_all(lambda path, data: self._document(path, data, branch, file_exists_callback), file_paths)
+        return [d for d in docs if d is not None]
+
+
+def _member_name(name: str) -> str:
+    # tar czf repo.tgz . stores ./src/...
+    return name[2:] if name.startswith("./") else name
+
+
+def _common_root(names: List[str]) -> str:
+    """'repo-master/' when every archive member lives under that one folder, else ''."""
+    tops = {n.split("/", 1)[0] for n in names}
+    if len(tops) == 1 and all("/" in n for n in names):
+        return tops.pop() + "/"
+    return ""
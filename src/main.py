@@ -24,11 +24,17 @@ from llama_index.core import VectorStoreIndex
 import qdrant_client
 
 from archi import DalleWorkflow
+from llm_clients import configure
+from offline_llm import index_dir
+from token_budget import TokenBudget, use_budget
+from workspace import use_workspace
+from pathlib import Path
 
 
 
 # Apply nest_asyncio to allow running asyncio event loops within Streamlit's event loop
 nest_asyncio.apply()
+configure()
 
 
 
@@ -78,19 +84,20 @@ def get_retrievers():
     # assume you have a persist_dir or vector_store prepared
     # e.g.:
     # index_sito = VectorStoreIndex.from_vector_store(my_vector_store)
-    lock_file = os.path.join("./archi", ".lock")
+    archi_dir = index_dir()
+    lock_file = os.path.join(archi_dir, ".lock")
     if os.path.exists(lock_file):
         os.remove(lock_file)
 
-    os.makedirs("./archi", exist_ok=True)
-    client = qdrant_client.AsyncQdrantClient(path="./archi")
+    os.makedirs(archi_dir, exist_ok=True)
+    client = qdrant_client.AsyncQdrantClient(path=archi_dir)
 
     vector_store = QdrantVectorStore(aclient=client, collection_name="micro", use_async=True)
     
     index_sito = VectorStoreIndex.from_vector_store(vector_store)
 
     # load or build the “libro” index from disk
-    persist_dir = "./archi/persist"
+    persist_dir = os.path.join(archi_dir, "persist")
     if os.path.exists(persist_dir):
         storage = StorageContext.from_defaults(persist_dir=persist_dir)
         index_libro = load_index_from_storage(storage)
@@ -122,6 +129,7 @@ async def main():
         api_key = st.text_input("Enter your API Key:", type="password")
     with colmodel:
         model_choice = st.selectbox("Select LLM Model:", ["openai", "mistral", "claude"])
+    stream_code = st.checkbox("Stream code generation (show files as they are generated)", value=False)
 
     col1, col2 = st.columns(2)
     with col1:
@@ -158,26 +166,43 @@ async def main():
             
                 # With nest_asyncio applied, we can use asyncio.run directly
                 retriever = get_retrievers()
-                wf = DalleWorkflow(timeout=None)
-                res = await wf.run(model=model_choice, specs=specs_input, user_stories=user_stories_input, retriever=retriever)
+                budget = TokenBudget.from_env()
+                # One workspace per session run, finished even when the run raises;
+                # the output ZIP is written into it, so it never outlives the run
+                with use_budget(budget), use_workspace("ui") as ws:
+                    wf = DalleWorkflow(timeout=None)
+                    res = await wf.run(model=model_choice, specs=specs_input, user_stories=user_stories_input, retriever=retriever, stream=stream_code)
                 
                
-                print(res)
+                    print(res)
 
-                res = await add_pattern(zip_json=res["result"], archi_payload=res["json"])
+                    res = await add_pattern(
+                        zip_json=res["result"], archi_payload=res["json"], output=ws.file("augmented_project.zip")
+                    )
+                    for service, error in res.get("service_errors", {}).items():
+                        st.warning(f"⚠️ Patterns could not be added to {service}: {error}")
 
-                st.success("🎉 Workflow completed successfully!")
-                
-                st.subheader("Generated Architecture")
-                
-                
-                if isinstance(res, dict) and "zip_base64" in res:
-                    import base64
+                    # Per-run ledger: concurrent sessions never share a path
+                    ledger = budget.write_ledger(ws.file("token_ledger.json"))
+                    st.write(f"🧮 Tokens used: {budget.summary()['totals']}")
+
+                    st.success("🎉 Workflow completed successfully!")
+
+                    st.subheader("Generated Architecture")
+
+                    if isinstance(res, dict) and "zip_path" in res:
+                        # st.download_button keeps its payload in memory either way: read the ZIP once
+                        st.download_button(
+                            "Download ZIP",
+                            data=Path(res["zip_path"]).read_bytes(),
+                            file_name=res.get("filename", "project.zip"),
+                            mime="application/zip",
+                        )
                     st.download_button(
-                        "Download ZIP",
-                        data=base64.b64decode(res["zip_base64"]),
-                        file_name=res.get("filename", "project.zip"),
-                        mime="application/zip",
+                        "Download token ledger",
+                        data=ledger.read_bytes(),
+                        file_name="token_ledger.json",
+                        mime="application/json",
                     )
                 
             except Exception as e:
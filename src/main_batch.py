@@ -30,11 +30,20 @@ from llama_index.core import VectorStoreIndex
 import qdrant_client
 
 # Ensure environment is loaded
-assert load_dotenv()
+from offline_llm import index_dir, offline_enabled
+assert load_dotenv() or offline_enabled()
 
 # Import the workflow and utilities
 from test import DalleWorkflow
 from utils import to_dict
+from llm_cache import MODES as CACHE_MODES, get_cache, set_cache_mode
+from llm_clients import configure
+from token_budget import TokenBudget, use_budget
+from workspace import use_workspace
+from rate_limit import limiter_stats
+from call_policy import policy_stats
+from llm_router import routing_stats
+from prompt_cache import prompt_cache_stats
 
 
 def extract_section_from_input(file_path: Path, section_name: str) -> Optional[str]:
@@ -162,13 +171,20 @@ async def process_input_file(
         
         # Run the workflow
         try:
-            workflow = DalleWorkflow(timeout=None)
-            output = await workflow.run(
-                specs=specs,
-                user_stories=user_stories,
-                retriever=retriever,
-                model=model
-            )
+            budget = TokenBudget.from_env()
+            try:
+                # The run's scratch files go away even when it raises
+                with use_budget(budget), use_workspace(folder_name):
+                    workflow = DalleWorkflow(timeout=None)
+                    output = await workflow.run(
+                        specs=specs,
+                        user_stories=user_stories,
+                        retriever=retriever,
+                        model=model
+                    )
+            finally:
+                result["tokens"] = budget.summary()["totals"]
+                budget.write_ledger(output_dir / f"{folder_name}.ledger.json")
             
             result["status"] = "success"
             result["output"] = to_dict(output) if output else None
@@ -201,7 +217,8 @@ async def main(
     output_dir: Optional[str] = None,
     max_depth: int = 3,
     model: str = "openai",
-    retriever=None
+    retriever=None,
+    concurrency: int = 1
 ):
     """
     Main batch processing function.
@@ -212,6 +229,8 @@ async def main(
         max_depth: Maximum directory depth to search
         model: LLM model to use
         retriever: Optional retriever instance
+        concurrency: Projects processed at the same time; the shared rate
+            limiter keeps them within the provider quota
     """
     # Setup paths
     dataset_path: Path
@@ -240,18 +259,22 @@ async def main(
     
     print(f"📁 Found {len(input_files)} input files to process\n")
     
-    # Process each file
-    results = []
-    for input_file, folder_name in input_files:
-        result = await process_input_file(
-            input_file,
-            folder_name,
-            output_path,
-            retriever=retriever,
-            model=model
-        )
-        results.append(result)
-        print()
+    # Process the files, up to `concurrency` at a time (results keep input order)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(input_file: Path, folder_name: str) -> Dict:
+        async with semaphore:
+            result = await process_input_file(
+                input_file,
+                folder_name,
+                output_path,
+                retriever=retriever,
+                model=model
+            )
+            print()
+            return result
+
+    results = await asyncio.gather(*(run_one(f, name) for f, name in input_files))
     
     # Save summary
     summary = {
@@ -259,6 +282,9 @@ async def main(
         "successful": sum(1 for r in results if r["status"] == "success"),
         "skipped": sum(1 for r in results if r["status"] == "skipped"),
         "errors": sum(1 for r in results if r["status"] == "error"),
+        "llm_steps": policy_stats(),
+        "failovers": routing_stats(),
+        "prompt_cache": prompt_cache_stats(),
         "results": results
     }
     
@@ -273,6 +299,15 @@ async def main(
     print(f"Skipped:        {summary['skipped']}")
     print(f"Errors:         {summary['errors']}")
     print(f"Results saved to: {output_path}")
+    print(f"Tokens used:    {sum(r.get('tokens', {}).get('tokens', 0) for r in results)} "
+          f"(~${sum(r.get('tokens', {}).get('cost_usd', 0.0) for r in results):.2f})")
+    print(f"Rate limiter:   {limiter_stats()}")
+    print(f"Failovers:      {routing_stats() or 'none'}")
+    print(f"Prompt cache:   {prompt_cache_stats() or 'no usage reported'}")
+    for step_name, stats in policy_stats().items():
+        print(f"  {step_name or '?'}: {stats}")
+    if get_cache().enabled:
+        print(f"LLM cache ({get_cache().mode}): {get_cache().stats}")
     print("="*60)
 
 
@@ -307,27 +342,46 @@ if __name__ == "__main__":
         choices=["openai", "anthropic", "mistral"],
         help="LLM model to use (default: openai)"
     )
+    parser.add_argument(
+        "--cache-mode",
+        type=str,
+        default=None,
+        choices=CACHE_MODES,
+        help="LLM response cache: off, read (read-through), record (record-only), "
+             "replay (strict, fails on a miss). Default: $LLM_CACHE_MODE or off"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of projects processed concurrently (default: 1). "
+             "LLM calls stay within the provider rate limits (RATE_LIMIT_<PROVIDER>_RPM/TPM)"
+    )
     
     args = parser.parse_args()
+    configure()
+    if args.cache_mode:
+        set_cache_mode(args.cache_mode)
 
     
     # load or build the “sito” index
     # assume you have a persist_dir or vector_store prepared
     # e.g.:
     # index_sito = VectorStoreIndex.from_vector_store(my_vector_store)
-    lock_file = os.path.join("./archi", ".lock")
+    archi_dir = index_dir()
+    lock_file = os.path.join(archi_dir, ".lock")
     if os.path.exists(lock_file):
         os.remove(lock_file)
 
-    os.makedirs("./archi", exist_ok=True)
-    client = qdrant_client.AsyncQdrantClient(path="./archi")
+    os.makedirs(archi_dir, exist_ok=True)
+    client = qdrant_client.AsyncQdrantClient(path=archi_dir)
 
     vector_store = QdrantVectorStore(aclient=client, collection_name="micro", use_async=True)
     
     index_sito = VectorStoreIndex.from_vector_store(vector_store)
 
     # load or build the “libro” index from disk
-    persist_dir = "./archi/persist"
+    persist_dir = os.path.join(archi_dir, "persist")
     if os.path.exists(persist_dir):
         storage = StorageContext.from_defaults(persist_dir=persist_dir)
         index_libro = load_index_from_storage(storage)
@@ -355,5 +409,6 @@ if __name__ == "__main__":
         output_dir=args.output,
         max_depth=args.depth,
         retriever=retriever,
-        model=args.model
+        model=args.model,
+        concurrency=args.concurrency
     ))
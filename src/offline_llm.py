@@ -0,0 +1,493 @@
+"""
+Offline, deterministic stand-ins for the LLM and embedding providers.
+
+Every workflow needs API keys, network LLMs and OpenAI embeddings, so the
+pipeline around the model calls (parsing, retrieval, zipping, applying update
+plans, writing files) could not be benchmarked on its own. With LLM_OFFLINE=1
+(in the environment or .env) or MODEL=offline, llm_clients hands out an
+OfflineLLM for every provider / model and sets Settings.llm /
+Settings.embed_model, so DalleWorkflow, CodegenWorkflow, DalleCodeWorkflow2
+and main.get_retrievers run unchanged without any network access.
+
+OfflineLLM recognises the prompts of the repo and answers with well-formed
+templated output:
+
+    DalleOutput / DalleOutputCode / DalleOutputCode2 programs   -> matching JSON
+    UPDATE_PLAN_SPEC plans                                      -> {"version": "1", "actions": [...]}
+    PLAN_PROMPT / FILE_PROMPT (pattern_workflow)                -> file list / Java stub
+    BATCH_FILE_PROMPT (pattern_workflow)                        -> {"files": [{"path", "code"}]}
+    QueryFusionRetriever query generation                       -> one query per line
+    any other structured-output program                         -> JSON synthesized from its schema
+
+Responses only depend on the prompt. A file in OFFLINE_FIXTURES_DIR named
+<sha256 of the prompt>.txt, or <kind>.txt / <kind>.json (kind as returned by
+prompt_kind()), replaces the template.
+
+Provider timing is simulated with OFFLINE_LATENCY_S (time to first token) and
+OFFLINE_TOKENS_PER_S (output rate, 0 = instant); streaming calls yield their
+text in chunks at that rate. HashEmbedding maps texts to fixed vectors by
+feature-hashing their words (OFFLINE_EMBED_DIM, default 256), so similar texts
+still retrieve each other. index_dir() keeps their indexes apart from the
+OpenAI-embedded ones.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.base.llms.generic_utils import completion_response_to_chat_response
+
+
+OFFLINE = "offline"
+
+STREAM_CHUNK_CHARS = 64
+DEFAULT_EMBED_DIM = 256
+
+# Architecture used by the templated DalleOutput / DalleOutputCode answers
+SERVICES = ("User Service", "Catalog Service", "Order Service")
+
+
+def offline_enabled() -> bool:
+    """True when LLM_OFFLINE is set or MODEL names the offline provider."""
+    if os.getenv("LLM_OFFLINE", "").strip().lower() in ("1", "true", "on", "yes"):
+        return True
+    return os.getenv("MODEL", "").strip().lower().startswith(OFFLINE)
+
+
+def index_dir() -> str:
+    """
+    Directory of the Qdrant / persisted retrieval indexes (ARCHI_INDEX_DIR).
+    Defaults to ./archi-offline when offline, since ./archi holds OpenAI
+    embeddings that hash embeddings cannot query.
+    """
+    return os.getenv("ARCHI_INDEX_DIR") or ("./archi-offline" if offline_enabled() else "./archi")
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "service"
+
+
+def _class_name(name: str) -> str:
+    return "".join(w.capitalize() for w in re.findall(r"[a-z0-9]+", name.lower())) or "Offline"
+
+
+def _match(pattern: str, text: str, default: str) -> str:
+    m = re.search(pattern, text)
+    return m.group(1).strip() if m else default
+
+
+# ---- prompt recognition ----
+
+def prompt_kind(prompt: str) -> str:
+    """Which of the repo's prompts this is; selects the template and fixture name."""
+    text = prompt.replace("{{", "{").replace("}}", "}")
+    if '"title": "DalleOutputCode2"' in text:
+        return "microservice_code"
+    if '"title": "DalleOutputCode"' in text:
+        return "code_tree"
+    if '"title": "DalleOutput"' in text:
+        return "architecture"
+    if '"version": "1"' in text and '"op":"write"' in text:
+        return "update_plan"
+    if "propose a list of Java files" in text:
+        return "file_plan"
+    if "Generate the full Java source code for this file" in text:
+        return "java_file"
+    if "Generate the full Java source code for each of the files" in text:
+        return "java_files"
+    if "search queries, one on each line" in text:
+        return "queries"
+    if "The microservice list is:" in text:
+        return "microservice_list"
+    if "Here's a JSON schema to follow:" in text:
+        return "schema"
+    return "text"
+
+
+# ---- templates ----
+
+def _java(package: str, name: str, doc: str) -> str:
+    return (
+        f"package {package};\n\n"
+        f"/** {doc} */\n"
+        f"public class {name} {{\n"
+        f"    // TODO: implement\n"
+        f"}}\n"
+    )
+
+
+def _architecture() -> Dict[str, Any]:
+    microservices = []
+    for i, name in enumerate(SERVICES):
+        resource = "/" + _slug(name).split("-")[0] + "s"
+        microservices.append({
+            "name": name,
+            "endpoints": [
+                {"name": resource, "method": "GET", "inputs": ["id"], "outputs": ["item"],
+                 "description": f"Reads one item of the {name}."},
+                {"name": resource, "method": "POST", "inputs": ["payload"], "outputs": ["id"],
+                 "description": f"Creates an item in the {name}."},
+            ],
+            "user_stories": [str(2 * i + 1), str(2 * i + 2)],
+            "parameters": ["id", "created_at"],
+            "description": f"{name} of the offline architecture.",
+        })
+    return {
+        "microservices": microservices,
+        "patterns": [
+            {"group_name": "Order saga", "implementation_pattern": "saga",
+             "involved_microservices": ["Order Service", "Catalog Service"],
+             "explaination": "Orders reserve catalog stock across services."},
+            {"group_name": "Private data", "implementation_pattern": "database per service",
+             "involved_microservices": list(SERVICES),
+             "explaination": "Every service owns its data."},
+        ],
+        "datastore": [
+            {"datastore_name": _slug(name).replace("-", "_") + "_db", "associated_microservices": [name],
+             "description": f"Tables of the {name}."}
+            for name in SERVICES
+        ],
+    }
+
+
+def _service_files(name: str) -> List[Tuple[str, str]]:
+    """(path relative to the service folder, content) of a minimal Spring Boot service."""
+    slug, cls = _slug(name), _class_name(name)
+    package = "com.example." + slug.replace("-", "")
+    src = "src/main/java/" + package.replace(".", "/")
+    return [
+        ("pom.xml", f"<project>\n  <artifactId>{slug}</artifactId>\n</project>\n"),
+        (f"{src}/{cls}Application.java", _java(package, f"{cls}Application", f"Entry point of {name}.")),
+        (f"{src}/{cls}Controller.java", _java(package, f"{cls}Controller", f"REST endpoints of {name}.")),
+    ]
+
+
+def _code_tree() -> Dict[str, Any]:
+    return {
+        "folders": [
+            {"name": _slug(name), "folders": [],
+             "files": [{"name": path, "content": content} for path, content in _service_files(name)]}
+            for name in SERVICES
+        ],
+        "files": [
+            {"name": "README.md", "content": "# Offline project\n\n" + "".join(f"- **{n}**\n" for n in SERVICES)},
+            {"name": "docker-compose.yml", "content": "services: {}\n"},
+        ],
+    }
+
+
+def _microservice_code(prompt: str) -> Dict[str, Any]:
+    name = _match(r"The input is .*?['\"]name['\"]:\s*['\"]([^'\"]+)", prompt.replace("\n", " "), "Offline Service")
+    sections = []
+    for path, content in _service_files(name):
+        lang = path.rsplit(".", 1)[-1]
+        sections.append(f"{_slug(name)}/{path}\n----------\n```{lang}\n{content}```\n")
+    return {"code": "\n".join(sections)}
+
+
+_PLAN_TARGETS = (
+    ("DATASTORES", "db/schema.sql", "CREATE TABLE items (id BIGINT PRIMARY KEY);\n"),
+    ("Dockerizing", "docker-compose.yml", "services: {}\n"),
+    ("TEST FRONTEND", "frontend/index.html", "<!doctype html>\n<title>Offline frontend</title>\n"),
+    ("PATTERNS", "patterns/README.md", "# Patterns\n\nApplied offline.\n"),
+)
+
+
+def _update_plan(prompt: str) -> Dict[str, Any]:
+    for marker, path, content in _PLAN_TARGETS:
+        if marker in prompt:
+            break
+    else:
+        path, content = f"offline/{_digest(prompt)[:8]}.md", "Offline update.\n"
+    actions: List[Dict[str, Any]] = []
+    if "/" in path:
+        actions.append({"op": "mkdir", "path": path.rsplit("/", 1)[0]})
+    actions.append({"op": "write", "path": path, "content": content, "encoding": "utf-8", "if_exists": "overwrite"})
+    return {"version": "1", "actions": actions, "notes": "offline plan"}
+
+
+def _file_plan(prompt: str) -> Dict[str, Any]:
+    package = _match(r"- Package: (\S+)", prompt, "com.example")
+    cls = _class_name(_match(r"- Service Name: (.+)", prompt, "Offline"))
+    base = package.replace(".", "/")
+    return {"files": [
+        {"path": f"{base}/{cls}Application.java", "purpose": "Spring Boot entry point"},
+        {"path": f"{base}/web/{cls}Controller.java", "purpose": "REST controller"},
+        {"path": f"{base}/service/{cls}Service.java", "purpose": "Business logic"},
+        {"path": f"{base}/repository/{cls}Repository.java", "purpose": "Persistence"},
+    ]}
+
+
+def _java_file(prompt: str) -> str:
+    relpath = _match(r"File path: (.+)", prompt, "Offline.java")
+    package = _match(r"- Package root: (\S+)", prompt, "com.example")
+    purpose = _match(r"- Purpose: (.+)", prompt, "Generated offline")
+    parent = Path(relpath).parent.as_posix()
+    if parent not in ("", "."):
+        package = parent.replace("/", ".")
+    return _java(package, Path(relpath).stem, purpose)
+
+
+def _java_files(prompt: str) -> Dict[str, Any]:
+    package = _match(r"- Package root: (\S+)", prompt, "com.example")
+    listed = re.findall(r"^- (\S+\.java): (.*)$", prompt.split("Files:", 1)[-1], flags=re.M)
+    return {"files": [
+        {"path": path, "code": _java_file(f"- Package root: {package}\n- Purpose: {purpose}\nFile path: {path}")}
+        for path, purpose in listed
+    ]}
+
+
+def _queries(prompt: str) -> str:
+    n = int(_match(r"Generate (\d+) search queries", prompt, "3"))
+    query = _match(r"Query: (.+)", prompt, "microservices")
+    return "\n".join(f"{query} (aspect {i + 1})" for i in range(n))
+
+
+def _from_schema(schema: Dict[str, Any], defs: Dict[str, Any], depth: int = 0) -> Any:
+    """Minimal instance of a JSON schema (one item per list)."""
+    if "$ref" in schema:
+        schema = defs.get(schema["$ref"].rsplit("/", 1)[-1], {})
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"] or schema[key]
+            return _from_schema(options[0], defs, depth)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object" or "properties" in schema:
+        return {k: _from_schema(v, defs, depth + 1) for k, v in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [] if depth > 6 else [_from_schema(schema.get("items", {}), defs, depth + 1)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return True
+    return "offline"
+
+
+def _schema_instance(prompt: str) -> Any:
+    text = prompt.replace("{{", "{").replace("}}", "}")
+    start = text.find("{", text.find("Here's a JSON schema to follow:"))
+    try:
+        schema, _ = json.JSONDecoder().raw_decode(text[start:])
+    except ValueError:
+        return {}
+    return _from_schema(schema, schema.get("$defs", {}))
+
+
+def _microservice_list() -> str:
+    items = ",\n".join(
+        f'    {{ name: "{name}", description: "{name} of the offline architecture", user_stories: ["{i + 1}"] }}'
+        for i, name in enumerate(SERVICES)
+    )
+    return "{\n" + items + "\n}"
+
+
+def templated_response(prompt: str) -> str:
+    kind = prompt_kind(prompt)
+    if kind == "architecture":
+        return json.dumps(_architecture())
+    if kind == "code_tree":
+        return json.dumps(_code_tree())
+    if kind == "microservice_code":
+        return json.dumps(_microservice_code(prompt))
+    if kind == "update_plan":
+        return json.dumps(_update_plan(prompt))
+    if kind == "file_plan":
+        return json.dumps(_file_plan(prompt))
+    if kind == "java_file":
+        return _java_file(prompt)
+    if kind == "java_files":
+        return json.dumps(_java_files(prompt))
+    if kind == "queries":
+        return _queries(prompt)
+    if kind == "microservice_list":
+        return _microservice_list()
+    if kind == "schema":
+        return json.dumps(_schema_instance(prompt))
+    return (
+        f"Offline answer {_digest(prompt)[:12]}: use database per service for every microservice "
+        "and a saga for operations spanning several services."
+    )
+
+
+# ---- LLM ----
+
+class OfflineLLM(CustomLLM):
+    """Deterministic local LLM answering the repo's prompts from fixtures or templates."""
+
+    model: str = "offline"
+    max_tokens: Optional[int] = None
+    context_window: int = 128_000
+    latency_s: float = 0.0
+    tokens_per_s: float = 0.0
+    fixtures_dir: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, model: str = OFFLINE, max_tokens: Optional[int] = None) -> "OfflineLLM":
+        return cls(
+            model=model,
+            max_tokens=max_tokens,
+            latency_s=float(os.getenv("OFFLINE_LATENCY_S", 0)),
+            tokens_per_s=float(os.getenv("OFFLINE_TOKENS_PER_S", 0)),
+            fixtures_dir=os.getenv("OFFLINE_FIXTURES_DIR") or None,
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OfflineLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.max_tokens or 4096,
+            is_chat_model=False,
+            model_name=self.model,
+        )
+
+    def respond(self, prompt: str) -> str:
+        """Fixture for this prompt / its kind if present, else the templated answer."""
+        if self.fixtures_dir:
+            root = Path(self.fixtures_dir)
+            for name in (f"{_digest(prompt)}.txt", f"{prompt_kind(prompt)}.txt", f"{prompt_kind(prompt)}.json"):
+                if (root / name).is_file():
+                    return (root / name).read_text(encoding="utf-8")
+        return templated_response(prompt)
+
+    def _delay(self, text: str) -> float:
+        return self.latency_s + (_tokens(text) / self.tokens_per_s if self.tokens_per_s > 0 else 0.0)
+
+    def _response(self, prompt: str, text: str, delta: Optional[str] = None) -> CompletionResponse:
+        usage = {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(text)}
+        return CompletionResponse(text=text, delta=delta, raw={"model": self.model, "usage": usage})
+
+    def _chunks(self, text: str) -> List[str]:
+        return [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self.respond(prompt)
+        time.sleep(self._delay(text))
+        return self._response(prompt, text)
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        text = self.respond(prompt)
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.latency_s)
+            so_far = ""
+            for chunk in self._chunks(text):
+                time.sleep(self._delay(chunk) - self.latency_s)
+                so_far += chunk
+                yield self._response(prompt, so_far, delta=chunk)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = self.respond(prompt)
+        await asyncio.sleep(self._delay(text))
+        return self._response(prompt, text)
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        text = self.respond(prompt)
+
+        async def gen() -> CompletionResponseAsyncGen:
+            await asyncio.sleep(self.latency_s)
+            so_far = ""
+            for chunk in self._chunks(text):
+                await asyncio.sleep(self._delay(chunk) - self.latency_s)
+                so_far += chunk
+                yield self._response(prompt, so_far, delta=chunk)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        # CustomLLM.achat would block the event loop in the sync complete()
+        response = await self.acomplete(self.messages_to_prompt(messages), formatted=True)
+        return completion_response_to_chat_response(response)
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        responses = await self.astream_complete(self.messages_to_prompt(messages), formatted=True)
+
+        async def gen() -> ChatResponseAsyncGen:
+            content = ""
+            async for r in responses:
+                content += r.delta or ""
+                yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=r.delta, raw=r.raw)
+
+        return gen()
+
+
+# ---- embeddings ----
+
+class HashEmbedding(BaseEmbedding):
+    """Feature-hashed bag-of-words vectors: deterministic, local, unit length."""
+
+    model_name: str = "offline-hash"
+    embed_dim: int = DEFAULT_EMBED_DIM
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashEmbedding"
+
+    def _embed(self, text: str) -> List[float]:
+        vec = [0.0] * self.embed_dim
+        words = re.findall(r"\w+", (text or "").lower()) or [text or ""]
+        for word in words:
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+            vec[h % self.embed_dim] += 1.0 if h >> 63 else -1.0
+        norm = math.sqrt(sum(v * v for v in vec))
+        if not norm:
+            vec[0], norm = 1.0, 1.0
+        return [v / norm for v in vec]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+
+def install(llm: OfflineLLM) -> None:
+    """Make llm and HashEmbedding the LlamaIndex defaults (retrievers, synthesizers, indexes)."""
+    Settings.llm = llm
+    Settings.embed_model = HashEmbedding(embed_dim=int(os.getenv("OFFLINE_EMBED_DIM", DEFAULT_EMBED_DIM)))
@@ -6,7 +6,7 @@ Key points:
 - Steps pass data via Event payloads (dicts), not Event subclasses — prevents attribute errors like _cancel_flag.
 - Consumes StartEvent (engine kickoff), returns StopEvent (terminal).
 - In-memory input (base64 ZIP via --payload-stdin/--payload-json).
-- In-memory output (base64 ZIP to stdout/file).
+- Output ZIP streamed to a file or writable sink (base64 only through base64_payload()).
 - Optional pattern inference from README bullet lines.
 - Model chosen via MODEL env var: openai/<model> or ollama/<model>.
 """
@@ -20,9 +20,12 @@ import re
 import sys
 import json
 import shutil
+import tempfile
+import time
 import zipfile
 import base64
-from typing import Dict, Any, List, Optional, Tuple, Union
+import hashlib
+from typing import BinaryIO, Dict, Any, List, Optional, Tuple, Union
 from pathlib import Path
 from dataclasses import dataclass
 from enum import Enum
@@ -35,13 +38,26 @@ try:
     from llama_index.core.workflow import Workflow, step, Event, StartEvent, StopEvent
     from llama_index.embeddings.openai import OpenAIEmbedding
     from llama_index.readers.github import GithubRepositoryReader, GithubClient
-    from llama_index.llms.openai import OpenAI
-    from llama_index.llms.anthropic import Anthropic
-    from llama_index.llms.mistralai import MistralAI
     from llama_index.core.llms import ChatMessage, MessageRole
 except ImportError as e:
     print(f"Warning: Some llama_index imports failed ({e}). Functionality may be limited.")
 
+from llm_clients import configure, get_llm, pool_stats
+from call_policy import policy_stats
+from rate_limit import max_concurrency
+from prompt_cache import cached_prefix, prompt_cache_stats
+from project_tree import ProjectTree
+from project_manifest import ProjectManifest, package_of
+from file_batches import group_small_files, parse_batch_response
+from plan_cache import get_plan_cache, plan_cache_stats
+from llm_cache import llm_identity
+from folder_matching import match_labels_to_folders
+from rag_cache import aretrieve, get_rag_cache, rag_cache_stats
+from github_index import fetch_github_blobs, github_tree, index_revision, refresh_index
+from local_repo_reader import LocalRepositoryReader, allowed_dir, allowed_path
+from java_chunks import index_transformations
+import llm_calls
+
 # Apply nest_asyncio to allow nested event loops
 nest_asyncio.apply()
 
@@ -91,12 +107,7 @@ def zip_dir_to_bytes(src_dir: Path) -> bytes:
 # ==========================
 
 def find_services(root: Path) -> List[Path]:
-    services = []
-    for p in root.iterdir():
-        if p.is_dir() and (p / "src/main/java").exists():
-            if list(p.rglob("*Application.java")):
-                services.append(p)
-    return services
+    return [Path(root) / name for name in ProjectManifest.scan(Path(root)).services]
 
 
 def pkg_from_application(app_java: Path) -> str:
@@ -106,8 +117,11 @@ def pkg_from_application(app_java: Path) -> str:
 
 
 def detect_package(service_dir: Path) -> str:
-    app = next(service_dir.rglob("*Application.java"))
-    return pkg_from_application(app)
+    service_dir = Path(service_dir)
+    apps = [a for e in ProjectManifest.scan(service_dir).folders.values() for a in e.applications]
+    if not apps:
+        raise FileNotFoundError(f"No *Application.java under {service_dir}")
+    return package_of(min(apps))
 
 
 def infer_service_name(folder_name: str) -> str:
@@ -142,9 +156,6 @@ def merge_cfg(defaults: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, A
 # Note: CLI entrypoint removed. Use add_pattern(zip_json, archi_payload=...) programmatically.
 # ==========================
 
-def canonical_name(s: str) -> str:
-    return re.sub(r'[^a-z0-9]+', '', s.lower())
-
 def simplify_service_label(s: str) -> str:
     """Normalize a service display name like 'Authentication Service' → 'authentication'."""
     s = s.strip()
@@ -156,6 +167,26 @@ def simplify_service_label(s: str) -> str:
     s = re.sub(r"\s+", " ", s)
     return s.strip().lower()
 
+# Every pattern keyword in one alternation, matched on the lowercased description.
+# Equivalent to the former replace-then-search sequence: "domain events" and
+# "domainevents" count as domain event, "database per service" (single spaces)
+# as database-per-service.
+_PATTERN_KEYWORDS = re.compile(
+    r"\b(?:(?P<aggregate>aggregate)"
+    r"|(?P<events>domain\s*events?)"
+    r"|(?P<saga>saga)"
+    r"|(?P<api_composition>api\s*composition)"
+    r"|(?P<database_per_service>database(?:-?per-?service| per service)))\b"
+)
+
+# Both bullet grammars in one regex: after the bullet, each lookahead tries one
+# grammar independently, so a line can match either, both or neither
+_PROSE_REST = r"\s*(?:\*\*|__)?\s*(?P<prose_name>[A-Za-z0-9 &/_-]+?\s+Service)\s*(?:\*\*|__)?\s*:\s*(?P<prose_desc>.+)$"
+_CLASSIC_REST = r"\s*(?P<classic_name>.+?)\s*\((?P<classic_patterns>[^)]+)\)\s*$"
+_BULLET_LINE = re.compile(rf"\s*[-*•](?=(?:{_PROSE_REST})?)(?=(?:{_CLASSIC_REST})?)")
+_PATTERN_SEPARATORS = re.compile(r"[,\uFF0C]+")
+
+
 def _extract_patterns_freeform(text: str) -> dict:
     """
     Parse prose like:
@@ -165,29 +196,15 @@ def _extract_patterns_freeform(text: str) -> dict:
       'Uses Aggregate and API Composition patterns, and database-per-service.'
     Returns a dict with flags.
     """
-    t = text.lower()
-
-    # canonicalize variants
-    t = t.replace("domain events", "domain event")
-    t = t.replace("events", "event")  # careful but fine for our keywords
-    t = t.replace("api composition", "api composition")
-    t = t.replace("database per service", "database-per-service")
-
-    agg  = bool(re.search(r"\baggregate\b", t))
-    de   = bool(re.search(r"\bdomain\s*event\b", t))
-    saga = bool(re.search(r"\bsaga\b", t))
-    api  = bool(re.search(r"\bapi\s*composition\b", t))
-
-    # We don’t generate code for DB-per-service; track if you want it for docs/flags.
-    dbps = bool(re.search(r"\bdatabase-?per-?service\b", t))
-
+    found = {m.lastgroup for m in _PATTERN_KEYWORDS.finditer(text.lower())}
     return {
-        "aggregate": agg,
-        "events": de,
+        "aggregate": "aggregate" in found,
+        "events": "events" in found,
         "cqrs": False,                # not mentioned in this README style
-        "saga": {"name": None} if saga else None,
-        "api_composition": api,
-        "database_per_service": dbps, # optional extra flag (harmless if unused)
+        "saga": {"name": None} if "saga" in found else None,
+        "api_composition": "api_composition" in found,
+        # We don’t generate code for DB-per-service; track if you want it for docs/flags.
+        "database_per_service": "database_per_service" in found,
     }
 
 def parse_patterns_from_readme(readme_text: str) -> dict:
@@ -199,51 +216,47 @@ def parse_patterns_from_readme(readme_text: str) -> dict:
          - **Authentication Service**: Handles ... Implements the Aggregate pattern ...
          - **Product Catalog Service**: ... Uses Aggregate and Domain Event patterns, and database-per-service.
     Returns mapping: { simplified_service_label: pattern_flags_dict }
+
+    The README is read in one pass with _BULLET_LINE; prose bullets are applied
+    first and classic "(...)" bullets are merged into them afterwards, as the
+    former two-pass parser did.
     """
     patterns_map = {}
-
-    lines = readme_text.splitlines()
-
-    # --- Pass A: prose bullets with bold names and colon ---
-    # e.g. "- **Authentication Service**: Handles ... Uses Aggregate and Domain Event patterns, and database-per-service."
-    prose_bullet = re.compile(
-        r"^\s*[-*•]\s*(?:\*\*|__)?\s*([A-Za-z0-9 &/_-]+?\s+Service)\s*(?:\*\*|__)?\s*:\s*(.+)$"
-    )
-
-    for line in lines:
-        m = prose_bullet.match(line)
-        if not m:
+    classic = []
+    labels: Dict[str, str] = {}  # raw service name -> simplified label (names repeat across bullets)
+    match = _BULLET_LINE.match
+
+    def label(raw_name: str) -> str:
+        key = labels.get(raw_name)
+        if key is None:
+            key = labels[raw_name] = simplify_service_label(raw_name)
+        return key
+
+    for line in readme_text.splitlines():
+        m = match(line)
+        if m is None:
             continue
-        raw_name = m.group(1).strip()
-        desc = m.group(2).strip()
-        name_key = simplify_service_label(raw_name)
-        pats = _extract_patterns_freeform(desc)
-
-        # Derive saga name if needed (first word of service)
-        if pats.get("saga") and pats["saga"]["name"] is None:
-            saga_name = raw_name.split()[0].title()
-            pats["saga"]["name"] = saga_name
-
-        patterns_map[name_key] = pats
-
-    # --- Pass B: classic "(...)" bullets (keep backward compatibility) ---
-    # e.g. "- Booking Service (Saga, Aggregate, Domain Event)"
-    classic_bullet = re.compile(r"^\s*[-*•]\s*(.+?)\s*\(([^)]+)\)\s*$")
-
-    for line in lines:
-        m = classic_bullet.match(line)
-        if not m:
-            continue
-        raw_name = m.group(1).strip()
-        raw_patterns = m.group(2).strip()
-        name_key = simplify_service_label(raw_name)
-        # If already captured in Pass A, merge rather than overwrite
+        if m.group("prose_name") is not None:
+            # e.g. "- **Authentication Service**: Handles ... Uses Aggregate and Domain Event patterns."
+            raw_name = m.group("prose_name").strip()
+            pats = _extract_patterns_freeform(m.group("prose_desc").strip())
+            # Derive saga name if needed (first word of service)
+            if pats.get("saga") and pats["saga"]["name"] is None:
+                pats["saga"]["name"] = raw_name.split()[0].title()
+            patterns_map[label(raw_name)] = pats
+        if m.group("classic_name") is not None:
+            # e.g. "- Booking Service (Saga, Aggregate, Domain Event)"
+            classic.append((m.group("classic_name").strip(), m.group("classic_patterns").strip()))
+
+    for raw_name, raw_patterns in classic:
+        name_key = label(raw_name)
+        # If already captured from a prose bullet, merge rather than overwrite
         existing = patterns_map.get(name_key, {
             "aggregate": False, "events": False, "cqrs": False, "saga": None, "api_composition": False
         })
 
-        tokens = [t.strip().lower() for t in re.split(r"[,\uFF0C]+", raw_patterns)]
-        for token in tokens:
+        for token in _PATTERN_SEPARATORS.split(raw_patterns):
+            token = token.strip().lower()
             if token == "aggregate":
                 existing["aggregate"] = True
             elif token in ("domain event", "event"):
@@ -338,66 +351,6 @@ def load_patterns_from_archi(archi_json: dict) -> dict:
 
     return out
 
-def match_labels_to_folders(label_map: dict, service_folders: List[str]) -> dict:
-    """
-    Best-effort align a mapping keyed by human-friendly labels (or simplified labels)
-    to actual folder names found in the project.
-
-    Returns: { folder_name: patterns_dict }
-    """
-    folder_keys = {}
-    for f in service_folders:
-        base = re.sub(r'-service$', '', f, flags=re.IGNORECASE)
-        folder_keys[f] = canonical_name(base)
-
-    assigned = {}
-    for label, pats in label_map.items():
-        # label might already be simplified; derive a canonical key
-        key = canonical_name(re.sub(r'\bservice\b', '', label))
-        best = None
-        best_score = -1
-        for folder, fkey in folder_keys.items():
-            score = 0
-            if key in fkey or fkey in key:
-                score += 5
-            toks_l = set(re.findall(r'[a-z]+', label.lower()))
-            toks_f = set(re.findall(r'[a-z]+', folder.replace('-', ' ').lower()))
-            score += len(toks_l & toks_f)
-            if score > best_score:
-                best, best_score = folder, score
-        if best:
-            assigned[best] = pats
-    return assigned
-
-def match_readme_to_folders(readme_map: dict, service_folders: List[str]) -> dict:
-    """
-    Align README labels to actual service folders (best-effort fuzzy match).
-    Returns: { folder_name: patterns_dict }
-    """
-    folder_keys = {}
-    for f in service_folders:
-        base = re.sub(r'-service$', '', f, flags=re.IGNORECASE)
-        folder_keys[f] = canonical_name(base)
-
-    assigned = {}
-    for label, pats in readme_map.items():
-        key = canonical_name(re.sub(r'\bservice\b', '', label))
-        best = None
-        best_score = -1
-        for folder, fkey in folder_keys.items():
-            score = 0
-            if key in fkey or fkey in key:
-                score += 5
-            toks_l = set(re.findall(r'[a-z]+', label.lower()))
-            toks_f = set(re.findall(r'[a-z]+', folder.replace('-', ' ').lower()))
-            score += len(toks_l & toks_f)
-            if score > best_score:
-                best, best_score = folder, score
-        if best:
-            assigned[best] = pats
-    return assigned
-
-
 # ==========================
 # LLM settings & prompts
 # ==========================
@@ -420,35 +373,68 @@ Context:
 
 Return JSON: {{ "files": [ {{"path": "path/ToFile.java", "purpose": "..."}}, ... ] }}"""
 
+# Per-file variables (purpose, path) go last so the prompt prefix stays cacheable
 FILE_PROMPT = """Generate the full Java source code for this file.
+Return ONLY the Java code (no markdown).
 
 Constraints:
 - Package root: {package}
 - Patterns: {patterns}
 - Purpose: {purpose}
-Return ONLY the Java code (no markdown).
 
 File path: {relpath}"""
 
-assert load_dotenv()
+# Several small files in one call (see file_batches.py); {files} is "- path: purpose" per line
+BATCH_FILE_PROMPT = """Generate the full Java source code for each of the files listed below.
+Return ONLY JSON: {{ "files": [ {{"path": "<path as listed>", "code": "<Java source>"}}, ... ] }}
+
+Constraints:
+- Package root: {package}
+- Patterns: {patterns}
+
+Files:
+{files}"""
+
+# Bump when plan parsing changes; prompt text changes already produce new plan cache keys
+PLAN_CACHE_VERSION = "1"
+
+
+def plan_prompt_version() -> str:
+    return hashlib.sha256((PLAN_CACHE_VERSION + SYSTEM_PROMPT + PLAN_PROMPT).encode("utf-8")).hexdigest()[:16]
+
+
+from offline_llm import offline_enabled
+assert load_dotenv() or offline_enabled()
 
 def init_llm_from_env():
     model = os.getenv("MODEL", "openai/gpt-4.1")
+    # Clients come from the shared registry so repeated add_pattern runs reuse their pools
     if model.startswith("openai"):
-        Settings.llm = OpenAI(model="gpt-4.1", temperature=0, timeout=9999.0)
+        Settings.llm = get_llm("openai", "gpt-4.1", temperature=0, timeout=9999.0)
     elif model.startswith("mistral"):
-        Settings.llm = MistralAI(model="mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=19000)
+        Settings.llm = get_llm("mistral", "mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=19000)
     elif model.startswith("anthropic") or model.startswith("claude"):
         # anthropic/<model> or claude/<model>
-        Settings.llm = Anthropic(model="claude-haiku-4-5",temperature=1.0, max_tokens=64000, timeout=9999.0)
+        Settings.llm = get_llm("anthropic", "claude-haiku-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
     else:
-        Settings.llm = OpenAI(model="gpt-4.1", temperature=0, timeout=9999.0)
+        Settings.llm = get_llm("openai", "gpt-4.1", temperature=0, timeout=9999.0)
     
     print("The model being used is:", model)
 
 
+def service_concurrency() -> int:
+    """Services add_pattern processes at once (CODEGEN_SERVICE_CONCURRENCY, default LLM_MAX_CONCURRENCY; 1 = sequential)."""
+    return max(1, int(os.getenv("CODEGEN_SERVICE_CONCURRENCY", max_concurrency())))
+
+
+def file_concurrency() -> int:
+    """Files of one service generated at once (CODEGEN_FILE_CONCURRENCY, default LLM_MAX_CONCURRENCY)."""
+    return max(1, int(os.getenv("CODEGEN_FILE_CONCURRENCY", max_concurrency())))
+
+
 # Optional: GitHub RAG support
 GITHUB_RETRIEVER = None
+GITHUB_INDEX_ID: Optional[str] = None  # "<owner>/<repo>@<branch>:<revision>", the RAG cache's index key
 
 async def build_github_retriever(
     github_token: Optional[str],
@@ -456,7 +442,9 @@ async def build_github_retriever(
     repo: str = "ftgo-application",
     branch: str = "master",
     include_dirs: Optional[List[str]] = None,
-    force_rebuild: bool = False
+    force_rebuild: bool = False,
+    refresh: Optional[bool] = None,
+    local_path: Optional[str] = None,
 ):
     """Build and return a LlamaIndex retriever for a GitHub repository.
 
@@ -474,35 +462,24 @@ async def build_github_retriever(
         branch: Branch name
         include_dirs: List of directories to include (None for all)
         force_rebuild: If True, rebuild index even if cached version exists
+        refresh: If True, update a cached index in place, embedding only added or
+            changed files and dropping deleted ones (default: GITHUB_INDEX_REFRESH)
+        local_path: Checkout, tarball or zip of the repository to read from disk
+            instead of the GitHub API; no token needed (default: REFERENCE_REPO_PATH)
     """
-    global GITHUB_RETRIEVER
-    if not github_token:
-        raise ValueError("github_token is required to read private or API-rate-limited repos")
+    global GITHUB_RETRIEVER, GITHUB_INDEX_ID
+    if local_path is None:
+        local_path = os.getenv("REFERENCE_REPO_PATH") or None
+    if not github_token and not local_path:
+        raise ValueError("github_token is required to read private or API-rate-limited repos (or pass local_path)")
         
     # Setup cache directory
     cache_dir = Path(".cache/github_indexes")
     cache_dir.mkdir(parents=True, exist_ok=True)
     persist_dir = cache_dir / f"{owner}_{repo}_{branch}"
     
-    # Try to load cached index if it exists and force_rebuild is False
-    if not force_rebuild and persist_dir.exists():
-        try:
-            print(f"Loading cached index from {persist_dir}")
-            # Ensure embeddings are configured
-            openai_api_key = os.getenv("OPENAI_API_KEY")
-            if openai_api_key:
-                Settings.embed_model = OpenAIEmbedding(api_key=openai_api_key)
-            # Load the index from disk using the storage context
-            storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
-            index = load_index_from_storage(storage_context)
-            retriever = index.as_retriever(similarity_top_k=5)
-            GITHUB_RETRIEVER = retriever
-            print("Successfully loaded cached index")
-            return retriever
-        except Exception as e:
-            print(f"Failed to load cached index: {e}, rebuilding...")
-
-    github_client = GithubClient(github_token=github_token, verbose=False)
+    if refresh is None:
+        refresh = os.getenv("GITHUB_INDEX_REFRESH", "0").strip().lower() in ("1", "true", "incremental")
 
     # Default filters: include no specific directories (read whole repo) but exclude binary/docs
     filter_directories: Tuple[List[str], GithubRepositoryReader.FilterType]
@@ -526,27 +503,90 @@ async def build_github_retriever(
         GithubRepositoryReader.FilterType.EXCLUDE,
     )
 
-    reader = GithubRepositoryReader(
-        github_client=github_client,
-        owner=owner,
-        repo=repo,
-        use_parser=False,
-        verbose=True,
-        filter_directories=filter_directories,
-        filter_file_extensions=filter_file_extensions,
-    )
+    if local_path:
+        # Same documents (blob SHA ids, same metadata) read from disk in parallel
+        reader = LocalRepositoryReader(
+            local_path,
+            owner=owner,
+            repo=repo,
+            filter_directories=filter_directories,
+            filter_file_extensions=filter_file_extensions,
+        )
+    else:
+        github_client = GithubClient(github_token=github_token, verbose=False)
+        reader = GithubRepositoryReader(
+            github_client=github_client,
+            owner=owner,
+            repo=repo,
+            use_parser=False,
+            verbose=True,
+            filter_directories=filter_directories,
+            filter_file_extensions=filter_file_extensions,
+        )
+    source = local_path or "GitHub API"
 
-    print(f"Loading repository {owner}/{repo} (branch={branch}) via GitHub API")
+    # Try to load cached index if it exists and force_rebuild is False
+    if not force_rebuild and persist_dir.exists():
+        try:
+            print(f"Loading cached index from {persist_dir}")
+            # Ensure embeddings are configured
+            openai_api_key = os.getenv("OPENAI_API_KEY")
+            if openai_api_key and not offline_enabled():
+                Settings.embed_model = OpenAIEmbedding(api_key=openai_api_key)
+            # Load the index from disk using the storage context
+            storage_context = StorageContext.from_defaults(persist_dir=str(persist_dir))
+            index = load_index_from_storage(storage_context, transformations=index_transformations())
+            loaded_id = f"{owner}/{repo}@{branch}:{index_revision(index)}"
+            if refresh:
+                # Fetch the tree listing and re-embed only files whose blob SHA changed
+                print(f"Refreshing index from {owner}/{repo} (branch={branch}) via {source}")
+                if local_path:
+                    tree = await asyncio.to_thread(reader.tree)
+
+                    async def fetch(files):
+                        return await asyncio.to_thread(reader.load_data, branch, file_paths=list(files))
+                else:
+                    listing = await github_tree(
+                        github_client, owner, repo, branch, descend=lambda d: allowed_dir(d, filter_directories)
+                    )
+                    tree = {
+                        path: sha for path, sha in listing.items()
+                        if allowed_path(path, filter_directories, filter_file_extensions)
+                    }
+
+                    async def fetch(files):
+                        return await fetch_github_blobs(github_client, owner, repo, branch, files)
+                # Blobs that are not UTF-8 text make no document: remember them to skip their download
+                skipped_file = persist_dir / "skipped_blobs.json"
+                skipped = set(json.loads(skipped_file.read_text())) if skipped_file.exists() else set()
+                seen = set(skipped)
+                stats = await refresh_index(index, tree, fetch, skipped)
+                print(f"Index refresh: {stats}")
+                if skipped != seen:
+                    skipped_file.write_text(json.dumps(sorted(skipped)))
+                if stats["added"] or stats["changed"] or stats["deleted"]:
+                    index.storage_context.persist(persist_dir=str(persist_dir))
+                    get_rag_cache().drop_index(loaded_id)
+            retriever = index.as_retriever(similarity_top_k=5)
+            GITHUB_RETRIEVER = retriever
+            GITHUB_INDEX_ID = f"{owner}/{repo}@{branch}:{index_revision(index)}"
+            print("Successfully loaded cached index")
+            return retriever
+        except Exception as e:
+            print(f"Failed to load cached index: {e}, rebuilding...")
+
+    print(f"Loading repository {owner}/{repo} (branch={branch}) via {source}")
     documents = reader.load_data(branch=branch)
     print(f"Loaded {len(documents)} documents from GitHub repository")
 
     # Ensure embeddings are configured (use OPENAI_API_KEY if set)
     openai_api_key = os.getenv("OPENAI_API_KEY")
-    if openai_api_key:
+    if openai_api_key and not offline_enabled():
         Settings.embed_model = OpenAIEmbedding(api_key=openai_api_key)
 
     # Build an in-memory vector index
-    index = VectorStoreIndex.from_documents(documents)
+    # Java files are chunked on type/member boundaries (java_chunks), the rest by sentences
+    index = VectorStoreIndex.from_documents(documents, transformations=index_transformations())
     
     # Save the index to disk for future use
     try:
@@ -558,6 +598,7 @@ async def build_github_retriever(
     
     retriever = index.as_retriever(similarity_top_k=5)
     GITHUB_RETRIEVER = retriever
+    GITHUB_INDEX_ID = f"{owner}/{repo}@{branch}:{index_revision(index)}"
     return retriever
 
 # ==========================
@@ -582,6 +623,7 @@ class PlanRequestEvent(Event):
     patterns: dict
     readme: str
     output_service_dir: str
+    project: Optional[Any] = None  # ProjectTree to write into; output_service_dir is then relative to it
 
 
 class PlanResultEvent(Event):
@@ -594,6 +636,7 @@ class FilesResultEvent(Event):
     """Codegen output: rendered files (path+code) + original request."""
     files: list  # [{ "path": "...", "code": "..." }]
     req: PlanRequestEvent
+    failed: list = []  # [{ "path": "...", "error": "..." }] files whose generation failed
 
 
 class ExamplesRetrievedEvent(Event):
@@ -628,11 +671,22 @@ class CodegenWorkflow(Workflow):
             patterns=ev.patterns,
             readme=ev.readme,
             output_service_dir=ev.output_service_dir,
+            project=ev.get("project"),
         )
 
     @step()
     async def plan_service(self, ev: PlanRequestEvent) -> PlanResultEvent:
+        # Identical inputs give the plan of a previous run without an LLM call
         llm = Settings.llm
+        cache = get_plan_cache()
+        key = cache.key(
+            ev.service_name, ev.package, ev.patterns, ev.readme, plan_prompt_version(), llm_identity(llm)
+        )
+        plan = cache.get(key)
+        if plan is not None:
+            print(f"Plan cache hit for {ev.service_name} ({len(plan.get('files', []))} files)")
+            return PlanResultEvent(plan=plan, req=ev)
+
         sysm = ChatMessage(
             role=MessageRole.SYSTEM,
             content=SYSTEM_PROMPT.format(
@@ -650,14 +704,15 @@ class CodegenWorkflow(Workflow):
                 readme=ev.readme,
             ),
         )
-        resp = await llm.achat(messages=[sysm, usr])
-        txt = resp.message.content
+        txt = await llm_calls.achat(llm, [sysm, usr], step="plan_service")
         try:
             plan = json.loads(txt)
             print("Plan:", plan)
         except Exception:
             i, j = txt.find("{"), txt.rfind("}")
             plan = json.loads(txt[i:j + 1]) if i != -1 and j != -1 else {"files": []}
+        if plan.get("files"):
+            cache.put(key, plan, meta={"service_name": ev.service_name, "package": ev.package})
         return PlanResultEvent(plan=plan, req=ev)
 
     @step()
@@ -670,15 +725,20 @@ class CodegenWorkflow(Workflow):
         rag_context = ""
         if GITHUB_RETRIEVER:
             try:
-                # Build a single query describing the service and its patterns
+                # Build a single query describing the service and its patterns; identical
+                # queries against the same index content share one (async, cached) retrieval
                 query = f"Examples for service {ev.req.service_name} with patterns: {json.dumps(ev.req.patterns)}"
-                nodes = GITHUB_RETRIEVER.retrieve(query)
+                if GITHUB_INDEX_ID:
+                    nodes = await get_rag_cache().get_or_retrieve(GITHUB_INDEX_ID, GITHUB_RETRIEVER, query)
+                else:  # a retriever set without build_github_retriever has no index identity to cache on
+                    nodes = await aretrieve(GITHUB_RETRIEVER, query)
                 if nodes:
                     rag_context = "\n\nRelevant examples from reference implementation:\n"
                     for node in nodes:
                         # node may be NodeWithScore or similar; try .text then .node_text
                         text = getattr(node, 'text', None) or getattr(node, 'node_text', None) or str(node)
-                        rag_context += f"\n{text}\n"
+                        path = (getattr(node, 'metadata', None) or {}).get("file_path")
+                        rag_context += f"\n// {path}\n{text}\n" if path else f"\n{text}\n"
             except Exception as e:
                 print(f"Warning: GitHub RAG retrieval failed: {e}")
         return ExamplesRetrievedEvent(plan=ev.plan, req=ev.req, rag_context=rag_context)
@@ -686,21 +746,26 @@ class CodegenWorkflow(Workflow):
     @step()
     async def generate_files(self, ev: ExamplesRetrievedEvent) -> FilesResultEvent:
         llm = Settings.llm
-        out = []
-        for f in ev.plan.get("files", []):
+        # Instructions and the single rag_context retrieved earlier are identical for
+        # every file of the service: send them first, as a cacheable prefix
+        sysm = ChatMessage(
+            role=MessageRole.SYSTEM,
+            content=SYSTEM_PROMPT.format(
+                package=ev.req.package,
+                service_name=ev.req.service_name,
+                patterns=json.dumps(ev.req.patterns),
+            ),
+        )
+        shared = [sysm]
+        if ev.rag_context:
+            shared.append(cached_prefix(ev.rag_context.strip(), llm))
+
+        # Files are independent: generate them concurrently, bounded by the semaphore
+        sem = asyncio.Semaphore(file_concurrency())
+
+        async def gen_file(f: dict) -> dict:
             relpath = f.get("path")
             purpose = f.get("purpose", "")
-            # Use the single rag_context retrieved earlier (possibly empty)
-            rag_context = ev.rag_context or ""
-            
-            sysm = ChatMessage(
-                role=MessageRole.SYSTEM,
-                content=SYSTEM_PROMPT.format(
-                    package=ev.req.package,
-                    service_name=ev.req.service_name,
-                    patterns=json.dumps(ev.req.patterns),
-                ) + rag_context,
-            )
             usr = ChatMessage(
                 role=MessageRole.USER,
                 content=FILE_PROMPT.format(
@@ -710,22 +775,81 @@ class CodegenWorkflow(Workflow):
                     relpath=relpath,
                 ),
             )
-            resp = await llm.achat(messages=[sysm, usr])
+            async with sem:
+                code = (await llm_calls.achat(llm, [*shared, usr], step="generate_files")).strip()
             print("Generated file:", relpath)
-            code = resp.message.content.strip()
-            out.append({"path": relpath, "code": code})
-        return FilesResultEvent(files=out, req=ev.req)
+            return {"path": relpath, "code": code}
+
+        async def gen_batch(batch: List[dict]) -> List[Union[dict, BaseException]]:
+            paths = [f.get("path") for f in batch]
+            usr = ChatMessage(
+                role=MessageRole.USER,
+                content=BATCH_FILE_PROMPT.format(
+                    package=ev.req.package,
+                    patterns=json.dumps(ev.req.patterns),
+                    files="\n".join(f"- {f.get('path')}: {f.get('purpose', '')}" for f in batch),
+                ),
+            )
+            try:
+                async with sem:
+                    txt = await llm_calls.achat(llm, [*shared, usr], step="generate_files")
+                codes = parse_batch_response(txt, paths)
+            except Exception as e:
+                print(f"⚠️ Batch of {len(batch)} files failed ({e}), generating them one by one")
+                codes = {}
+            missing = [f for f in batch if f.get("path") not in codes]
+            if missing:
+                print(f"Batch answer lacked {len(missing)}/{len(batch)} files, generating them one by one")
+            retried = iter(await asyncio.gather(*(gen_file(f) for f in missing), return_exceptions=True))
+            out = []
+            for f in batch:
+                if f.get("path") in codes:
+                    print("Generated file:", f.get("path"))
+                    out.append({"path": f.get("path"), "code": codes[f.get("path")]})
+                else:
+                    out.append(next(retried))
+            return out
+
+        planned = ev.plan.get("files", [])
+        batches, singles = group_small_files(planned)
+        if batches:
+            print(f"Batching {sum(len(b) for b in batches)} small files into {len(batches)} requests")
+        batched, single = await asyncio.gather(
+            asyncio.gather(*(gen_batch(b) for b in batches)),
+            asyncio.gather(*(gen_file(f) for f in singles), return_exceptions=True),
+        )
+        by_id = {id(f): res for f, res in zip(singles, single)}
+        for b, res in zip(batches, batched):
+            by_id.update({id(f): r for f, r in zip(b, res)})
+
+        # results keep plan order; a failed file is reported and skipped, the others are kept
+        out, failed = [], []
+        for f in planned:
+            res = by_id[id(f)]
+            if isinstance(res, BaseException):
+                print(f"⚠️ Could not generate {f.get('path')}: {res}")
+                failed.append({"path": f.get("path"), "error": str(res)})
+            else:
+                out.append(res)
+        return FilesResultEvent(files=out, req=ev.req, failed=failed)
 
     @step()
     async def write_files(self, ev: FilesResultEvent) -> StopEvent:
+        project: Optional[ProjectTree] = ev.req.project
         root = Path(ev.req.output_service_dir) / "src/main/java"
         print("Writing files to:", root)
+        if ev.failed:
+            print(f"⚠️ {len(ev.failed)} planned file(s) of {ev.req.service_name} were not generated:",
+                  [f["path"] for f in ev.failed])
         for f in ev.files:
             dst = root / f["path"]
-            dst.parent.mkdir(parents=True, exist_ok=True)
             code = f["code"]
             if not code.lstrip().startswith("package "):
                 code = f"package {ev.req.package};\n\n" + code
+            if project is not None:
+                project.write(dst.as_posix(), code)
+                continue
+            dst.parent.mkdir(parents=True, exist_ok=True)
             dst.write_text(code, encoding="utf-8")
         return StopEvent(status="ok")
 
@@ -760,82 +884,154 @@ def process_payload(payload: dict, work_dir: Path):
 
 
 
-# ==========================
-# CLI
-# ==========================
-
-async def add_pattern(zip_json, archi_payload: Optional[dict] = None):
-    # Prepare working copy
-    output_dir = Path("output_project")
-    work = Path("old_project_work")
-    process_payload(zip_json, work)
-
-    # Load README and discover services
-    # Read README (kept for context) and discover service folders
-    readme = read_text_if_exists(work, "Readme.md")
-    services = find_services(work)
-
-    # Prefer Archi JSON payload when provided (in-memory). Otherwise fall back to README parsing.
-    if archi_payload:
-        archi_map = load_patterns_from_archi(archi_payload)
-        print("Using in-memory Archi payload to derive patterns")
-        readme_assignments = match_labels_to_folders(archi_map, [s.name for s in services]) if archi_map else {}
+def write_output_zip(project: ProjectTree, output: Union[str, Path, BinaryIO, None]) -> dict:
+    """
+    Stream project's archive into output: a path, a writable binary file object
+    (seekable or not), or None for a new temporary file. Returns
+    {"filename", "zip_path"} for paths and {"filename", "zip_file"} for file objects.
+    The caller owns the file: a temporary one must be removed by the caller
+    (or pass a path inside a run workspace, which is removed with it).
+    """
+    if output is None:
+        fd, output = tempfile.mkstemp(prefix="augmented_project-", suffix=".zip")
+        os.close(fd)
+    if isinstance(output, (str, Path)):
+        with open(output, "wb") as f:
+            project.write_zip(f)
+        return {"filename": "augmented_project.zip", "zip_path": str(output)}
+    project.write_zip(output)
+    output.flush()
+    return {"filename": "augmented_project.zip", "zip_file": output}
+
+
+def base64_payload(result: dict) -> dict:
+    """
+    Transport adapter: the {"filename", "zip_base64"} form of an add_pattern
+    result, for JSON callers. Reads the archive back from zip_path, or from
+    zip_file when that is a readable, seekable file.
+    """
+    if "zip_base64" in result:
+        return result
+    out = {k: v for k, v in result.items() if k not in ("zip_path", "zip_file")}
+    if "zip_path" in result:
+        blob = Path(result["zip_path"]).read_bytes()
     else:
-        # Optionally derive patterns from README (fallback to roles for non-matched)
-        readme_patterns = parse_patterns_from_readme(readme)
-        print("README patterns:", readme_patterns)
-        readme_assignments = match_readme_to_folders(readme_patterns, [s.name for s in services]) if readme_patterns else {}
-    roles: dict = {"defaults": {}, "services": {}}
-
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    copy_tree(work, output_dir)
-
-    # Init LLM
-    init_llm_from_env()
-
-    # Optional: build a GitHub retriever for RAG if token provided
-    github_token = os.getenv("GITHUB_TOKEN")
-    if github_token:
-        try:
-            await build_github_retriever(github_token, owner="microservices-patterns", repo="ftgo-application", branch="master")
-            print("GitHub retriever built and available as GITHUB_RETRIEVER")
-        except Exception as e:
-            print(f"Could not build GitHub retriever: {e}")
-
-    # Run per service
-    for svc in services:
-        cfg = (readme_assignments.get(svc.name)) \
-              or merge_cfg(roles.get("defaults", {}), roles.get("services", {}).get(svc.name, {}))
-
-        package = detect_package(output_dir / svc.name)
-        service_name = infer_service_name(svc.name)
-
-        req = {
-            "service_dir": str(svc),
-            "package": package,
-            "service_name": service_name,
-            "patterns": cfg,
-            "readme": readme,
-            "output_service_dir": str(output_dir / svc.name),
-        }
+        f = result["zip_file"]
+        if not (getattr(f, "readable", lambda: False)() and getattr(f, "seekable", lambda: False)()):
+            raise ValueError("zip_file was written to a write-only sink; it cannot be read back as base64")
+        f.seek(0)
+        blob = f.read()
+    out["zip_base64"] = base64_encode(blob)
+    return out
 
-        print("Processing service:", svc.name, "with config:", json.dumps(cfg))
-        print("req:", req)
-        wf = CodegenWorkflow(timeout=1200)
-        # Start the workflow by emitting a StartEvent with our request as payload
-        await wf.run(**req)
 
+# ==========================
+# CLI
+# ==========================
 
-    # In-memory base64 JSON output (optional)
-    
-    blob = zip_dir_to_bytes(output_dir)
-    payload = {"filename": "augmented_project.zip", "zip_base64": base64_encode(blob)}
+async def add_pattern(
+    zip_json,
+    archi_payload: Optional[dict] = None,
+    output: Union[str, Path, BinaryIO, None] = None,
+):
+    """
+    Add the patterns to every service of the project in zip_json ({"zip_bytes": ...}
+    or {"zip_base64": ...}). The augmented archive is streamed to output (see
+    write_output_zip); with the default output=None it goes to a temporary file
+    the caller must remove. Use base64_payload() on the result for the base64 form.
+    """
+    # The project is edited in memory: the ZIP is read once and written back once
+    raw = zip_json.get("zip_bytes")
+    if raw is None:
+        b64 = zip_json.get("zip_base64", "")
+        if not b64:
+            raise SystemExit("payload JSON missing 'zip_base64'")
+        raw = base64_decode(b64)
+    with ProjectTree.from_zip_bytes(raw) as project:
+        # Read README (kept for context) and discover service folders
+        readme = project.read_text("Readme.md", default="")
+        services = project.find_services()
+
+        # Prefer Archi JSON payload when provided (in-memory). Otherwise fall back to README parsing.
+        if archi_payload:
+            archi_map = load_patterns_from_archi(archi_payload)
+            print("Using in-memory Archi payload to derive patterns")
+            readme_assignments = match_labels_to_folders(archi_map, services) if archi_map else {}
+        else:
+            # Optionally derive patterns from README (fallback to roles for non-matched)
+            readme_patterns = parse_patterns_from_readme(readme)
+            print("README patterns:", readme_patterns)
+            readme_assignments = match_labels_to_folders(readme_patterns, services) if readme_patterns else {}
+        roles: dict = {"defaults": {}, "services": {}}
+
+        # Init LLM
+        init_llm_from_env()
+
+        # Optional: build a GitHub retriever for RAG if a token or a local copy of the repo is provided
+        github_token = os.getenv("GITHUB_TOKEN")
+        if github_token or os.getenv("REFERENCE_REPO_PATH"):
+            try:
+                await build_github_retriever(github_token, owner="microservices-patterns", repo="ftgo-application", branch="master")
+                print("GitHub retriever built and available as GITHUB_RETRIEVER")
+            except Exception as e:
+                print(f"Could not build GitHub retriever: {e}")
+
+        # Run per service: each service is an independent plan+generate pipeline,
+        # so they run concurrently (bounded by service_concurrency())
+        sem = asyncio.Semaphore(service_concurrency())
+        done = 0
+
+        async def run_service(svc: str) -> None:
+            nonlocal done
+            cfg = (readme_assignments.get(svc)) \
+                  or merge_cfg(roles.get("defaults", {}), roles.get("services", {}).get(svc, {}))
+
+            package = project.detect_package(svc)
+            service_name = infer_service_name(svc)
+
+            req = {
+                "service_dir": svc,
+                "package": package,
+                "service_name": service_name,
+                "patterns": cfg,
+                "readme": readme,
+                "output_service_dir": svc,
+            }
+
+            async with sem:
+                print("Processing service:", svc, "with config:", json.dumps(cfg))
+                print("req:", req)
+                start = time.perf_counter()
+                wf = CodegenWorkflow(timeout=1200)
+                try:
+                    # Start the workflow by emitting a StartEvent with our request as payload
+                    await wf.run(**req, project=project)
+                except Exception as e:
+                    done += 1
+                    print(f"❌ [{done}/{len(services)}] {svc} failed after {time.perf_counter() - start:.1f}s: {e}")
+                    raise
+                done += 1
+                print(f"✅ [{done}/{len(services)}] {svc} done in {time.perf_counter() - start:.1f}s")
+
+        results = await asyncio.gather(*(run_service(svc) for svc in services), return_exceptions=True)
+        # A failed service keeps its original code; the others are still packaged
+        errors = {svc: f"{type(r).__name__}: {r}" for svc, r in zip(services, results) if isinstance(r, BaseException)}
+
+        print("LLM client pool:", pool_stats())
+        print("LLM call latency:", policy_stats())
+        print("Prompt cache:", prompt_cache_stats())
+        print("Plan cache:", plan_cache_stats())
+        print("RAG cache:", rag_cache_stats())
+        # The archive is written straight to the output, never held as bytes or base64
+        payload = write_output_zip(project, output)
+        if errors:
+            payload["service_errors"] = errors
     
-    return payload
+        return payload
 
 
 if __name__ == "__main__":
+    configure()
     # Create new event loop for async operations
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
@@ -0,0 +1,158 @@
+"""
+Persistent cache of CodegenWorkflow file plans.
+
+plan_service asks the LLM for a file plan on every run, even when nothing it
+depends on changed. Plans are stored as one JSON file each under
+.cache/plans/<2-char prefix>/<key>.json, keyed by a hash of the service name,
+package, pattern flags, README, the prompt version and the model that wrote
+the plan (llm_cache.llm_identity), so a repeat run (for instance while
+iterating on file generation only) goes straight to retrieval and generation:
+
+    cache = get_plan_cache()
+    key = cache.key(service_name=..., package=..., patterns=..., readme=...,
+                    prompt_version=..., model=llm_identity(llm))
+    plan = cache.get(key)          # None on a miss
+    cache.put(key, plan)
+
+This is not llm_cache.LLMCache: that cache is off by default and its
+record / replay modes apply to every LLM call of a benchmark run, whereas
+plans are cached on by default, only once they parse into a non-empty file
+list, and need a TTL and per-service invalidation. Both key on llm_identity,
+so neither serves one model's answer to another.
+
+Modes (env PLAN_CACHE, or set_plan_cache()):
+  on       - serve hits, store new plans (default)
+  refresh  - always re-plan and overwrite the entry
+  off      - bypass the cache
+
+PLAN_CACHE_TTL_S expires entries older than that many seconds (0 = never);
+invalidate() / clear() drop entries explicitly.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+MODES = ("on", "refresh", "off")
+
+
+class PlanCache:
+    def __init__(self, root: Path, mode: str = "on", ttl_s: float = 0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown plan cache mode: {mode!r} (expected one of {MODES})")
+        self.root = Path(root)
+        self.mode = mode
+        self.ttl_s = ttl_s
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "expired": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += n
+
+    def key(
+        self, service_name: str, package: str, patterns: Any, readme: str, prompt_version: str, model: Any
+    ) -> str:
+        blob = json.dumps(
+            {
+                "service_name": service_name,
+                "package": package,
+                "patterns": patterns,
+                "readme": readme,
+                "prompt_version": prompt_version,
+                "model": model,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored plan for key, or None on a miss (always None unless mode is "on")."""
+        if self.mode != "on":
+            return None
+        p = self._path(key)
+        try:
+            record = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._count("misses")
+            return None
+        if self.ttl_s and time.time() - record.get("created_at", 0) > self.ttl_s:
+            p.unlink(missing_ok=True)
+            self._count("expired")
+            self._count("misses")
+            return None
+        self._count("hits")
+        return record["plan"]
+
+    def put(self, key: str, plan: Dict[str, Any], meta: Optional[dict] = None) -> None:
+        if self.mode == "off":
+            return
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        record = {"key": key, "created_at": time.time(), "meta": meta or {}, "plan": plan}
+        # Write-then-rename so concurrent services never read a half-written entry
+        tmp = p.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(record, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, p)
+        self._count("writes")
+
+    def invalidate(self, key: Optional[str] = None, service_name: Optional[str] = None) -> int:
+        """Drop one entry by key, or every entry planned for service_name. Returns how many were removed."""
+        if key is not None:
+            paths = [self._path(key)]
+        else:
+            paths = list(self.root.glob("*/*.json")) if self.root.exists() else []
+        removed = 0
+        for p in paths:
+            if service_name is not None:
+                try:
+                    meta = json.loads(p.read_text(encoding="utf-8")).get("meta", {})
+                except (OSError, ValueError):
+                    continue
+                if meta.get("service_name") != service_name:
+                    continue
+            if p.exists():
+                p.unlink()
+                removed += 1
+        self._count("invalidated", removed)
+        return removed
+
+    def clear(self) -> int:
+        """Drop every cached plan."""
+        return self.invalidate()
+
+
+_cache: Optional[PlanCache] = None
+
+
+def get_plan_cache() -> PlanCache:
+    """Process-wide plan cache configured from PLAN_CACHE / PLAN_CACHE_DIR / PLAN_CACHE_TTL_S."""
+    global _cache
+    if _cache is None:
+        _cache = PlanCache(
+            root=Path(os.getenv("PLAN_CACHE_DIR", ".cache/plans")),
+            mode=os.getenv("PLAN_CACHE", "on").strip().lower() or "on",
+            ttl_s=float(os.getenv("PLAN_CACHE_TTL_S", "0")),
+        )
+    return _cache
+
+
+def set_plan_cache(mode: str, root: Optional[str] = None, ttl_s: float = 0.0) -> PlanCache:
+    """Reconfigure the process-wide plan cache."""
+    global _cache
+    _cache = PlanCache(root=Path(root or os.getenv("PLAN_CACHE_DIR", ".cache/plans")), mode=mode, ttl_s=ttl_s)
+    return _cache
+
+
+def plan_cache_stats() -> Dict[str, Any]:
+    cache = get_plan_cache()
+    lookups = cache.stats["hits"] + cache.stats["misses"]
+    return {"mode": cache.mode, **cache.stats, "hit_rate": round(cache.stats["hits"] / lookups, 3) if lookups else None}
@@ -0,0 +1,105 @@
+"""
+Single-pass manifest of a generated microservices project.
+
+find_services used to rglob("*Application.java") once per top-level folder,
+detect_package rglob'ed the service again and add_pattern repeated it for
+the output copy: many full walks on TrainTicket-sized monorepos. A
+ProjectManifest is built by one os.scandir walk (or from the path list of an
+in-memory ProjectTree) and answers every discovery question:
+
+    manifest = ProjectManifest.scan(Path("output_project"))
+    for svc in manifest.services.values():
+        print(svc.name, svc.package, len(svc.files))
+
+A service is a top-level folder with a src/main/java directory and at least
+one *Application.java below it; its package is the one of the first
+(sorted) *Application.java, as detect_package reported it.
+"""
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+JAVA_ROOT = "src/main/java"
+APPLICATION_SUFFIX = "Application.java"
+
+
+@dataclass
+class ServiceEntry:
+    name: str
+    applications: List[str] = field(default_factory=list)  # paths relative to the project root
+    packages: Set[str] = field(default_factory=set)        # Java packages holding .java files
+    files: List[str] = field(default_factory=list)
+    has_java_root: bool = False
+
+    @property
+    def package(self) -> Optional[str]:
+        if not self.applications:
+            return None
+        return package_of(min(self.applications))
+
+
+def package_of(path: str) -> str:
+    """Package of a .../java/<package dirs>/File.java path."""
+    parts = path.split("/")
+    idx = parts.index("java")
+    return ".".join(parts[idx + 1:-1])
+
+
+@dataclass
+class ProjectManifest:
+    files: List[str] = field(default_factory=list)
+    dirs: Set[str] = field(default_factory=set)
+    folders: Dict[str, ServiceEntry] = field(default_factory=dict)  # every top-level folder
+
+    @property
+    def services(self) -> Dict[str, ServiceEntry]:
+        return {name: e for name, e in sorted(self.folders.items()) if e.has_java_root and e.applications}
+
+    def _add_dir(self, rel: str) -> None:
+        self.dirs.add(rel)
+        top, _, rest = rel.partition("/")
+        entry = self.folders.setdefault(top, ServiceEntry(top))
+        if rest == JAVA_ROOT:
+            entry.has_java_root = True
+
+    def _add_file(self, rel: str) -> None:
+        self.files.append(rel)
+        top, sep, rest = rel.partition("/")
+        if not sep:
+            return
+        entry = self.folders.setdefault(top, ServiceEntry(top))
+        entry.files.append(rel)
+        if rel.endswith(".java") and "/java/" in rel:
+            if rest.startswith(JAVA_ROOT + "/"):
+                entry.packages.add(package_of(rest))
+            if rel.endswith(APPLICATION_SUFFIX):
+                entry.applications.append(rel)
+
+    @classmethod
+    def scan(cls, root: Path) -> "ProjectManifest":
+        """Walk root once with os.scandir."""
+        manifest = cls()
+        stack: List[Tuple[str, str]] = [(str(root), "")]
+        while stack:
+            path, rel = stack.pop()
+            with os.scandir(path) as it:
+                for entry in it:
+                    child = f"{rel}/{entry.name}" if rel else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        manifest._add_dir(child)
+                        stack.append((entry.path, child))
+                    elif entry.is_file():
+                        manifest._add_file(child)
+        return manifest
+
+    @classmethod
+    def from_paths(cls, files: Iterable[str], dirs: Iterable[str] = ()) -> "ProjectManifest":
+        """Manifest of an in-memory tree given its file and directory paths."""
+        manifest = cls()
+        for d in dirs:
+            if d:
+                manifest._add_dir(d)
+        for f in files:
+            manifest._add_file(f)
+        return manifest
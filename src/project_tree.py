@@ -0,0 +1,199 @@
+"""
+In-memory project tree for add_pattern.
+
+add_pattern used to extract the input ZIP to old_project_work, copy it to
+output_project, rglob both several times (find_services, detect_package),
+write the generated files and finally walk and compress output_project again.
+ProjectTree loads the archive once into a {relative path: bytes} map with a
+directory index, answers the same queries from memory, takes the generated
+files and serializes straight back to a ZIP. Contents of the input archive
+are only decompressed when read, and to_zip_bytes() copies the compressed
+bytes of untouched entries from it (zip_patch.py), so writing the result
+costs about as much as the generated files:
+
+    with ProjectTree.from_zip_bytes(base64_decode(payload["zip_base64"])) as project:
+        for svc in project.find_services():
+            package = project.detect_package(svc)
+            project.write(f"{svc}/src/main/java/{package.replace('.', '/')}/Foo.java", code)
+        blob = project.to_zip_bytes()
+
+Paths are POSIX, relative to the project root, without a leading "./".
+"""
+import io
+import posixpath
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Union
+
+from project_manifest import ProjectManifest
+from zip_patch import patch_zip
+
+
+def _norm(path: str) -> str:
+    path = posixpath.normpath(str(path).replace("\\", "/")).lstrip("/")
+    if path == "." or path.startswith("../"):
+        raise ValueError(f"Path outside the project: {path!r}")
+    return path
+
+
+class ProjectTree:
+    def __init__(self):
+        self.files: Dict[str, Optional[bytes]] = {}  # None: not read from the source archive yet
+        self.infos: Dict[str, zipfile.ZipInfo] = {}  # entries of the source archive
+        self.changed: Set[str] = set()
+        self.source: Optional[bytes] = None
+        self._zip: Optional[zipfile.ZipFile] = None
+        self._children: Dict[str, Set[str]] = {"": set()}
+        self._manifest: Optional[ProjectManifest] = None
+
+    def close(self) -> None:
+        """Release the source archive; entries not read yet can no longer be read."""
+        if self._zip is not None:
+            self._zip.close()
+
+    def __enter__(self) -> "ProjectTree":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- loading ----
+
+    @classmethod
+    def from_zip_bytes(cls, data: bytes) -> "ProjectTree":
+        tree = cls()
+        tree.source = data
+        tree._zip = zipfile.ZipFile(io.BytesIO(data))
+        for info in tree._zip.infolist():
+            name = info.filename.rstrip("/")
+            if not name:
+                continue
+            if info.is_dir():
+                tree._add_dir(_norm(name))
+            else:
+                path = _norm(name)
+                tree._put(path, None)
+                tree.infos[path] = info
+        return tree
+
+    @classmethod
+    def from_dir(cls, root: Path) -> "ProjectTree":
+        tree = cls()
+        root = Path(root)
+        for p in sorted(root.rglob("*")):
+            rel = p.relative_to(root).as_posix()
+            if p.is_dir():
+                tree._add_dir(rel)
+            else:
+                tree._put(rel, p.read_bytes())
+        return tree
+
+    def _add_dir(self, path: str) -> None:
+        if path in self._children:
+            return
+        parent, name = posixpath.split(path)
+        self._add_dir(parent)
+        self._children[path] = set()
+        self._children[parent].add(name)
+
+    def _put(self, path: str, data: bytes) -> None:
+        self.files[path] = data
+        parent, name = posixpath.split(path)
+        self._add_dir(parent)
+        self._children[parent].add(name)
+
+    # ---- queries ----
+
+    def exists(self, path: str) -> bool:
+        path = _norm(path)
+        return path in self.files or path in self._children
+
+    def is_dir(self, path: str) -> bool:
+        return _norm(path) in self._children if path else True
+
+    def listdir(self, path: str = "") -> List[str]:
+        return sorted(self._children.get(_norm(path) if path else "", ()))
+
+    def walk_files(self, prefix: str = "") -> Iterator[str]:
+        """Every file path under the directory prefix (all files for "")."""
+        stack = [_norm(prefix) if prefix else ""]
+        while stack:
+            d = stack.pop()
+            for name in self._children.get(d, ()):
+                path = posixpath.join(d, name) if d else name
+                if path in self.files:
+                    yield path
+                if path in self._children:
+                    stack.append(path)
+
+    def read_bytes(self, path: str) -> bytes:
+        path = _norm(path)
+        if path not in self.files:
+            raise FileNotFoundError(path)
+        data = self.files[path]
+        if data is None:
+            data = self.files[path] = self._zip.read(self.infos[path])
+        return data
+
+    def read_text(self, path: str, default: Optional[str] = None) -> str:
+        if default is not None and _norm(path) not in self.files:
+            return default
+        return self.read_bytes(path).decode("utf-8")
+
+    def manifest(self) -> ProjectManifest:
+        """Services, packages and file inventory, built in one pass over the paths."""
+        if self._manifest is None:
+            self._manifest = ProjectManifest.from_paths(self.files, self._children)
+        return self._manifest
+
+    def find_services(self) -> List[str]:
+        """Top-level folders with a src/main/java tree holding an *Application.java (cf. find_services)."""
+        return list(self.manifest().services)
+
+    def detect_package(self, service: str) -> str:
+        """Java package of the service's *Application.java (cf. detect_package)."""
+        entry = self.manifest().folders.get(service)
+        if entry is None or entry.package is None:
+            raise FileNotFoundError(f"No *Application.java under {service}")
+        return entry.package
+
+    # ---- updates ----
+
+    def write(self, path: str, content: Union[str, bytes]) -> None:
+        path = _norm(path)
+        self._put(path, content.encode("utf-8") if isinstance(content, str) else content)
+        self.changed.add(path)
+        self._manifest = None
+
+    # ---- output ----
+
+    def to_zip_bytes(self) -> bytes:
+        buf = io.BytesIO()
+        self.write_zip(buf)
+        return buf.getvalue()
+
+    def write_zip(self, fileobj) -> None:
+        if self.source is not None:
+            # Untouched entries are copied compressed; only the changed files are deflated
+            changes = {self.infos[p].filename if p in self.infos else p: self.files[p] for p in self.changed}
+            patch_zip(self.source, changes, fileobj)
+            return
+        now = time.localtime(time.time())[:6]
+        with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as zf:
+            for d in sorted(self._children):
+                if d:
+                    zf.writestr(d + "/", b"")
+            for path in sorted(self.files):
+                info = zipfile.ZipInfo(path, date_time=now)
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_DEFLATED
+                zf.writestr(info, self.files[path])
+
+    def to_dir(self, root: Path) -> None:
+        """Materialize the tree on disk (debugging / tools that need real files)."""
+        root = Path(root)
+        for d in self._children:
+            (root / d).mkdir(parents=True, exist_ok=True)
+        for path in self.files:
+            (root / path).write_bytes(self.read_bytes(path))
@@ -0,0 +1,161 @@
+"""
+Provider prompt caching: stable prompt prefixes and cached-token accounting.
+
+OpenAI caches the longest previously seen prompt prefix automatically
+(>= 1024 tokens); Anthropic caches up to a block marked with cache_control.
+Both only pay off when the large, repeated part of a prompt comes first and
+the per-call variables come last, so the fan-out steps build their messages
+as
+
+    [system]  instructions                       (stable)
+    [user]    shared context, cache breakpoint   (stable per run / service)
+    [user]    per-call variables                 (changes every call)
+
+cached_prefix(content, llm) builds the middle message. Only Anthropic reads
+the cache_control marker; other clients may forward additional_kwargs into
+the request body and reject an unknown field, so the marker is only added
+for an Anthropic llm, and llm_calls drops it again (for_llm) when the router
+fails a call over to another provider.
+
+Hit rates are collected from the usage block of every LLM response (OpenAI
+prompt_tokens_details.cached_tokens, Anthropic cache_read_input_tokens /
+cache_creation_input_tokens) through LlamaIndex instrumentation, attributed to
+the step llm_calls is running; see prompt_cache_stats().
+"""
+import contextvars
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMCompletionEndEvent
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from rate_limit import PROVIDER_OF_CLASS
+
+
+CACHE_BREAKPOINT = {"cache_control": {"type": "ephemeral"}}
+
+
+def supports_breakpoints(llm) -> bool:
+    return PROVIDER_OF_CLASS.get(type(llm).__name__) == "anthropic"
+
+
+def cached_prefix(content: str, llm, role: MessageRole = MessageRole.USER) -> ChatMessage:
+    """A message closing the cacheable prefix of a prompt (marked for Anthropic only)."""
+    extra = dict(CACHE_BREAKPOINT) if supports_breakpoints(llm) else {}
+    return ChatMessage(role=role, content=content, additional_kwargs=extra)
+
+
+def for_llm(messages: List[ChatMessage], llm) -> List[ChatMessage]:
+    """messages, without cache_control markers unless llm is an Anthropic client."""
+    if supports_breakpoints(llm) or not any("cache_control" in m.additional_kwargs for m in messages):
+        return messages
+    out = []
+    for m in messages:
+        if "cache_control" in m.additional_kwargs:
+            extra = {k: v for k, v in m.additional_kwargs.items() if k != "cache_control"}
+            m = m.model_copy(update={"additional_kwargs": extra})
+        out.append(m)
+    return out
+
+
+# ---- usage accounting ----
+
+_step: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_step", default=None)
+
+
+@contextmanager
+def step_scope(step: Optional[str]):
+    """Attribute the usage of LLM responses received inside the block to step."""
+    token = _step.set(step)
+    try:
+        yield
+    finally:
+        _step.reset(token)
+
+
+def _get(obj: Any, name: str) -> Any:
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def usage_of(raw: Any) -> Optional[Dict[str, int]]:
+    """{prompt, cached, cache_write} token counts from a provider response, if it reports usage."""
+    usage = _get(raw, "usage")
+    if usage is None:
+        return None
+    cache_read = _get(usage, "cache_read_input_tokens")
+    if cache_read is not None or _get(usage, "cache_creation_input_tokens") is not None:
+        # Anthropic: input_tokens excludes the cached and cache-written parts
+        cache_read = cache_read or 0
+        cache_write = _get(usage, "cache_creation_input_tokens") or 0
+        prompt = (_get(usage, "input_tokens") or 0) + cache_read + cache_write
+        return {"prompt": prompt, "cached": cache_read, "cache_write": cache_write}
+    prompt = _get(usage, "prompt_tokens") or _get(usage, "input_tokens") or 0
+    cached = _get(_get(usage, "prompt_tokens_details"), "cached_tokens") or 0
+    return {"prompt": prompt, "cached": cached, "cache_write": 0}
+
+
+class PromptCacheUsage(BaseEventHandler):
+    """Accumulates prompt / cached token counts per step from LLM end events."""
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PromptCacheUsage"
+
+    def handle(self, event: Any, **kwargs: Any) -> None:
+        if not isinstance(event, (LLMChatEndEvent, LLMCompletionEndEvent)):
+            return
+        raw = _get(event.response, "raw")
+        if raw is None or _seen(raw):
+            return
+        usage = usage_of(raw)
+        if usage is not None:
+            _add(_step.get(), usage)
+
+
+_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+# A chat model's complete() emits both a completion and a chat end event for one response
+_recent: Deque[Any] = deque(maxlen=64)
+
+
+def _seen(raw: Any) -> bool:
+    with _lock:
+        if any(r is raw for r in _recent):
+            return True
+        _recent.append(raw)
+        return False
+
+
+def _add(step: Optional[str], usage: Dict[str, int]) -> None:
+    with _lock:
+        s = _stats.setdefault(step or "", {"calls": 0, "prompt": 0, "cached": 0, "cache_write": 0})
+        s["calls"] += 1
+        for k in ("prompt", "cached", "cache_write"):
+            s[k] += usage[k]
+
+
+def prompt_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-step prompt tokens, cached tokens and hit rate (cached / prompt)."""
+    with _lock:
+        return {
+            step: {**s, "hit_rate": round(s["cached"] / s["prompt"], 3) if s["prompt"] else 0.0}
+            for step, s in _stats.items()
+        }
+
+
+def reset_prompt_cache_stats() -> None:
+    with _lock:
+        _stats.clear()
+        _recent.clear()
+
+
+_handler = PromptCacheUsage()
+get_dispatcher().add_event_handler(_handler)
@@ -509,7 +509,7 @@ The json with the backend is:
 The output json is:
 """
 
-GEN_CODE_FROM_MS = """
+GEN_CODE_FROM_MS_STATIC = """
 # Prompt Template: Microservice → Full Java Implementation Text File
 
 You are a **code generator** that takes a microservice description as input and outputs a **single plain-text file** containing a complete Java Spring Boot project implementation for that microservice.  
@@ -641,11 +641,17 @@ Do **not** include any commentary, markdown headings, or explanations outside th
 **Prompt output:**  
 → A `.txt` file containing a **complete Java project**, structured and formatted as above, one file per section, including all contents.
 ------------------------------------------------------------
+"""
 
+# Per-microservice tail of GEN_CODE_FROM_MS. Kept separate so the static part
+# above can be sent as a cacheable prompt prefix (see prompt_cache.py).
+GEN_CODE_FROM_MS_INPUT = """
 The input is {{microservice}}
 -
 """
 
+GEN_CODE_FROM_MS = GEN_CODE_FROM_MS_STATIC + GEN_CODE_FROM_MS_INPUT
+
 UPDATE_PLAN_SPEC = """
 You must output ONLY a single JSON object (no markdown, no pre/post text) matching this schema:
 
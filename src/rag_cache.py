@@ -0,0 +1,130 @@
+"""
+In-process cache for CodegenWorkflow's RAG retrievals.
+
+retrieve_examples called the blocking GITHUB_RETRIEVER.retrieve() inside an
+async step, stalling the event loop for the query embedding and the vector
+search, and repeated runs sent the same queries again. RetrievalCache runs
+retriever.aretrieve() and keeps the nodes in an LRU with a TTL, keyed on the
+index identity and the full query text; concurrent lookups of one key share
+a single in-flight retrieval:
+
+    index_id = "microservices-patterns/ftgo-application@master:3f2a9c..."  # repo, branch, revision
+    nodes = await get_rag_cache().get_or_retrieve(index_id, retriever, query)
+
+The identity names the index content (github_index.index_revision), not the
+retriever object, so entries stay valid across runs that load the same index
+and never outlive a refresh that changed it; drop_index() forgets them.
+
+RAG_CACHE_SIZE bounds the entries (default 128, 0 disables the cache) and
+RAG_CACHE_TTL_S their age (default 3600 s).
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+async def aretrieve(retriever, query: str) -> List[Any]:
+    """Async retrieval; retrievers without aretrieve run in a worker thread."""
+    if hasattr(retriever, "aretrieve"):
+        return await retriever.aretrieve(query)
+    return await asyncio.to_thread(retriever.retrieve, query)
+
+
+class RetrievalCache:
+    def __init__(self, max_entries: int = 128, ttl_s: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.stats = {"hits": 0, "misses": 0, "shared": 0, "evicted": 0}
+        self._entries: "OrderedDict[Any, Tuple[float, List[Any]]]" = OrderedDict()
+        # (event loop, key) -> retrieval in progress; Streamlit sessions run their own loops
+        self._inflight: Dict[Tuple[int, Any], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key) -> Optional[List[Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, nodes = entry
+            if self.ttl_s and time.monotonic() - stored_at > self.ttl_s:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return nodes
+
+    def _store(self, key, nodes: List[Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), nodes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    async def get_or_retrieve(self, index_id: str, retriever, query: str) -> List[Any]:
+        """Nodes retriever returns for query; index_id must change whenever the index content does."""
+        if self.max_entries <= 0:
+            return await aretrieve(retriever, query)
+        key = (index_id, query)
+        nodes = self._lookup(key)
+        if nodes is not None:
+            return nodes
+
+        flight = (id(asyncio.get_running_loop()), key)
+        pending = self._inflight.get(flight)
+        if pending is not None:
+            with self._lock:
+                self.stats["shared"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[flight] = future
+        with self._lock:
+            self.stats["misses"] += 1
+        try:
+            nodes = await aretrieve(retriever, query)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved: nobody may be waiting
+            raise
+        else:
+            self._store(key, nodes)
+            future.set_result(nodes)
+            return nodes
+        finally:
+            self._inflight.pop(flight, None)
+
+    def drop_index(self, index_id: str) -> None:
+        """Forget every entry retrieved from index_id (e.g. after refresh_index changed it)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == index_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_cache: Optional[RetrievalCache] = None
+
+
+def get_rag_cache() -> RetrievalCache:
+    """Process-wide retrieval cache configured from RAG_CACHE_SIZE / RAG_CACHE_TTL_S."""
+    global _cache
+    if _cache is None:
+        _cache = RetrievalCache(
+            max_entries=int(os.getenv("RAG_CACHE_SIZE", "128")),
+            ttl_s=float(os.getenv("RAG_CACHE_TTL_S", "3600")),
+        )
+    return _cache
+
+
+def rag_cache_stats() -> Dict[str, Any]:
+    cache = get_rag_cache()
+    return {**cache.stats, "entries": len(cache._entries)}
@@ -0,0 +1,296 @@
+"""
+Provider-aware rate limiting shared by every LLM call in the process.
+
+Each provider (openai / anthropic / mistral) gets a Governor holding two token
+buckets, requests-per-minute and tokens-per-minute. llm_calls reserves one
+request plus the estimated prompt + max output tokens before every call and
+settles the token reservation with the real size afterwards, so concurrent
+steps, fan-out workers and batch projects share one quota instead of racing
+into 429s.
+
+The limits adapt at runtime:
+  - x-ratelimit-* / anthropic-ratelimit-* response headers (read by an httpx
+    hook attached in llm_clients.get_llm) resize the buckets to the account's
+    real limits and clamp them to the remaining quota;
+  - a 429 pauses the provider for retry-after seconds and lowers its rate,
+    which then recovers gradually on successful calls.
+
+Starting limits come from DEFAULT_LIMITS, overridable per provider with
+RATE_LIMIT_<PROVIDER>_RPM / RATE_LIMIT_<PROVIDER>_TPM. LLM_MAX_CONCURRENCY sets
+the fan-out width of the workflows (num_workers).
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+
+# provider -> (requests per minute, tokens per minute); conservative starting points
+DEFAULT_LIMITS: Dict[str, Tuple[int, int]] = {
+    "openai": (500, 300_000),
+    "anthropic": (50, 80_000),
+    "mistral": (60, 500_000),
+}
+
+# LlamaIndex class name -> provider key used here and in llm_clients
+PROVIDER_OF_CLASS = {
+    "OpenAI": "openai",
+    "Anthropic": "anthropic",
+    "MistralAI": "mistral",
+}
+
+MAX_RATE_LIMIT_RETRIES = 4
+
+
+def max_concurrency(default: int = 8) -> int:
+    """Fan-out width for workflow steps (LLM_MAX_CONCURRENCY)."""
+    return max(1, int(os.getenv("LLM_MAX_CONCURRENCY", default)))
+
+
+class TokenBucket:
+    """Continuously refilled bucket; reservations may go negative and the caller waits off the debt."""
+
+    def __init__(self, per_minute: float):
+        self.nominal = float(per_minute)
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, n: float, now: float) -> float:
+        """Take n (clamped to the capacity) and return how long to wait before using it."""
+        self._refill(now)
+        self.level -= min(n, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def refund(self, n: float, now: float) -> None:
+        self._refill(now)
+        self.level = min(self.capacity, self.level + n)
+
+    def resize(self, per_minute: float) -> None:
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = min(self.level, self.capacity)
+
+
+class Governor:
+    def __init__(self, provider: str, rpm: int, tpm: int):
+        self.provider = provider
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.stats = {"calls": 0, "waited_s": 0.0, "rate_limited": 0}
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self.requests.reserve(1, now),
+                self.tokens.reserve(tokens, now),
+                self.paused_until - now,
+            )
+            self.stats["calls"] += 1
+            self.stats["waited_s"] += max(wait, 0.0)
+            return max(wait, 0.0)
+
+    async def acquire(self, tokens: int) -> None:
+        wait = self._reserve(tokens)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def acquire_sync(self, tokens: int) -> None:
+        wait = self._reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Give back the part of a reservation the call did not use; recover the rate."""
+        with self._lock:
+            now = time.monotonic()
+            if reserved > used:
+                self.tokens.refund(reserved - used, now)
+            for bucket in (self.requests, self.tokens):
+                if bucket.capacity < bucket.nominal:
+                    bucket.resize(min(bucket.nominal, bucket.capacity * 1.05))
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> float:
+        """Pause the provider after a 429 and lower its rate; return the pause length."""
+        with self._lock:
+            pause = retry_after if retry_after is not None else min(60.0, 2.0 * 2 ** min(self.stats["rate_limited"], 5))
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            for bucket in (self.requests, self.tokens):
+                bucket.resize(max(bucket.nominal * 0.1, bucket.capacity * 0.7))
+            self.stats["rate_limited"] += 1
+            return pause
+
+    def update_from_headers(self, headers) -> None:
+        """Resize / clamp the buckets from the provider's rate-limit response headers."""
+        info = parse_rate_limit_headers(headers)
+        with self._lock:
+            now = time.monotonic()
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                limit = info.get(f"{kind}_limit")
+                if limit:
+                    bucket.nominal = float(limit)
+                    if bucket.capacity > limit:
+                        bucket.resize(limit)
+                remaining = info.get(f"{kind}_remaining")
+                if remaining is not None:
+                    bucket._refill(now)
+                    bucket.level = min(bucket.level, float(remaining))
+            retry_after = info.get("retry_after")
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+
+# ---- header parsing ----
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def _seconds(value: str) -> Optional[float]:
+    """'20ms', '6m0s', '1.5', or an RFC 3339 timestamp -> seconds from now."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[u] for n, u in parts)
+    try:
+        when = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except ValueError:
+        return None
+
+
+def parse_rate_limit_headers(headers) -> Dict[str, float]:
+    """
+    Normalise OpenAI (x-ratelimit-limit-requests), Anthropic
+    (anthropic-ratelimit-tokens-remaining) and Mistral (x-ratelimit-*-minute)
+    headers to {requests,tokens}_{limit,remaining} and retry_after.
+    """
+    out: Dict[str, float] = {}
+    for name, value in headers.items():
+        name = name.lower()
+        if name in ("retry-after", "retry-after-ms"):
+            secs = _seconds(value)
+            if secs is not None:
+                out["retry_after"] = secs / 1000 if name.endswith("-ms") else secs
+            continue
+        if "ratelimit" not in name or "input-tokens" in name or "output-tokens" in name:
+            continue
+        if "request" in name or "-req" in name:
+            kind = "requests"
+        elif "token" in name or "size" in name:
+            kind = "tokens"
+        else:
+            continue
+        for field in ("limit", "remaining"):
+            if name.endswith(f"-{field}") or f"-{field}-" in name:
+                try:
+                    out[f"{kind}_{field}"] = float(value)
+                except ValueError:
+                    pass
+    return out
+
+
+def retry_after_of(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers is None:
+        return None
+    return parse_rate_limit_headers(headers).get("retry_after")
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """True for a provider 429, whichever SDK raised it."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429 or type(exc).__name__ == "RateLimitError"
+
+
+# ---- registry ----
+
+_lock = threading.Lock()
+_governors: Dict[str, Governor] = {}
+
+
+def get_governor(provider: Optional[str]) -> Optional[Governor]:
+    """Shared governor for provider, or None for unknown providers (mocks, offline LLMs)."""
+    if provider not in DEFAULT_LIMITS:
+        return None
+    with _lock:
+        gov = _governors.get(provider)
+        if gov is None:
+            rpm, tpm = DEFAULT_LIMITS[provider]
+            env = provider.upper()
+            gov = Governor(
+                provider,
+                rpm=int(os.getenv(f"RATE_LIMIT_{env}_RPM", rpm)),
+                tpm=int(os.getenv(f"RATE_LIMIT_{env}_TPM", tpm)),
+            )
+            _governors[provider] = gov
+        return gov
+
+
+def governor_for(llm) -> Optional[Governor]:
+    return get_governor(PROVIDER_OF_CLASS.get(type(llm).__name__))
+
+
+def limiter_stats() -> Dict[str, dict]:
+    with _lock:
+        return {
+            p: {**g.stats, "rpm": round(g.requests.capacity), "tpm": round(g.tokens.capacity)}
+            for p, g in _governors.items()
+        }
+
+
+# ---- httpx hooks ----
+
+def header_hooks(provider: str):
+    """(sync, async) httpx response hooks feeding provider's governor."""
+    def hook(response):
+        gov = get_governor(provider)
+        if gov is not None:
+            gov.update_from_headers(response.headers)
+
+    async def ahook(response):
+        hook(response)
+
+    return hook, ahook
+
+
+def attach_header_hooks(llm, provider: str) -> None:
+    """
+    Add the hooks to the httpx clients an already-built Anthropic / MistralAI
+    LLM holds. (OpenAI takes http_client / async_http_client at construction.)
+    """
+    hook, ahook = header_hooks(provider)
+    candidates = []
+    for attr in ("_client", "_aclient"):
+        sdk = getattr(llm, attr, None)
+        if sdk is None:
+            continue
+        candidates.append(getattr(sdk, "_client", None))            # anthropic SDK
+        conf = getattr(sdk, "sdk_configuration", None)               # mistralai SDK
+        if conf is not None:
+            candidates += [getattr(conf, "client", None), getattr(conf, "async_client", None)]
+    for client in candidates:
+        # Duck-typed: the anthropic SDK ships its own httpx fork
+        if client is None or not hasattr(client, "event_hooks"):
+            continue
+        hooks = client.event_hooks
+        hooks["response"] = [*hooks.get("response", []), ahook if hasattr(client, "aclose") else hook]
+        client.event_hooks = hooks
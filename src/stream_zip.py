@@ -0,0 +1,212 @@
+"""
+Incremental packaging of streamed DalleOutputCode JSON.
+
+DalleWorkflow.generate_code used to wait for the complete JSON tree before
+package_zip wrote a single entry. In streaming mode the provider's token
+stream is fed to FileStreamParser, which emits every {name, content} file
+object as soon as it closes, and ZipStreamWriter writes it straight into the
+archive; neither the raw JSON nor the parsed tree is kept around.
+
+    parser = FileStreamParser()
+    with ZipStreamWriter(buf) as zw:
+        async for delta in llm_calls.astream_complete(llm, prompt):
+            for path, content in parser.feed(delta):
+                zw.add(path, content)
+"""
+import json
+import posixpath
+import re
+import zipfile
+from typing import List, Optional, Tuple
+
+
+# Longest run of string body that cannot end the string: plain chars or complete escapes
+_STR_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_WS = re.compile(r"\s*")
+_LITERAL = re.compile(r"[^,\]\}\s]+")
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "expect_key", "cur_key", "name", "content", "pending")
+
+    def __init__(self, kind: str, key: Optional[str]):
+        self.kind = kind            # "obj" | "arr"
+        self.key = key              # key under which this container sits in its parent
+        self.expect_key = True      # obj only: next string is a key
+        self.cur_key: Optional[str] = None
+        self.name: Optional[str] = None
+        self.content: Optional[str] = None
+        self.pending: List[Tuple[str, str]] = []  # folder only: files waiting for this folder's name
+
+
+class FileStreamParser:
+    """
+    Incremental parser for the DalleOutputCode schema:
+      { "folders": [ { "name", "folders": [...], "files": [ {"name", "content"} ] } ],
+        "files": [ {"name", "content"} ] }
+
+    feed() accepts arbitrary chunks and returns the (path, content) pairs of the
+    file objects completed by that chunk. Text before the first '{' (e.g. a
+    ```json fence) and after the root object is ignored.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._str: Optional[List[str]] = None   # raw pieces of the string being read
+        self._started = False
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        out: List[Tuple[str, str]] = []
+        while not self.done and self._step(out):
+            pass
+        return out
+
+    # ---- tokenizer ----
+
+    def _step(self, out: List[Tuple[str, str]]) -> bool:
+        """Consume one token; return False when more input is needed."""
+        buf = self._buf
+        if self._str is not None:
+            return self._read_string(out)
+
+        if not self._started:
+            i = buf.find("{", self._pos)
+            if i == -1:
+                self._pos = len(buf)
+                return False
+            self._pos = i + 1
+            self._started = True
+            self._stack.append(_Frame("obj", None))
+            return True
+
+        self._pos = _WS.match(buf, self._pos).end()
+        if self._pos >= len(buf):
+            return False
+        c = buf[self._pos]
+        top = self._stack[-1]
+
+        if c == '"':
+            self._pos += 1
+            self._str = []
+            return True
+        if c == ":":
+            top.expect_key = False
+            self._pos += 1
+            return True
+        if c == ",":
+            top.expect_key = True
+            self._pos += 1
+            return True
+        if c in "{[":
+            key = top.cur_key if top.kind == "obj" else top.key
+            self._stack.append(_Frame("obj" if c == "{" else "arr", key))
+            self._pos += 1
+            return True
+        if c in "}]":
+            self._pos += 1
+            self._close(out)
+            return True
+
+        m = _LITERAL.match(buf, self._pos)
+        if m.end() >= len(buf):
+            return False  # number / true / false / null may continue in the next chunk
+        self._pos = m.end()
+        return True
+
+    def _read_string(self, out: List[Tuple[str, str]]) -> bool:
+        buf = self._buf
+        m = _STR_BODY.match(buf, self._pos)
+        self._str.append(m.group())
+        self._pos = m.end()
+        if self._pos >= len(buf) or buf[self._pos] != '"':
+            # End of chunk (possibly on a lone backslash, which stays in the buffer)
+            return False
+        self._pos += 1
+        value = json.loads('"' + "".join(self._str) + '"')
+        self._str = None
+        self._on_string(value, out)
+        return True
+
+    # ---- tree tracking ----
+
+    def _on_string(self, value: str, out: List[Tuple[str, str]]) -> None:
+        top = self._stack[-1]
+        if top.kind != "obj":
+            return
+        if top.expect_key:
+            top.cur_key = value
+            return
+        if top.cur_key == "name":
+            top.name = value
+            if self._is_folder(len(self._stack) - 1) and top.pending:
+                self._flush_pending(len(self._stack) - 1, out)
+        elif top.cur_key == "content" and top.key == "files":
+            top.content = value
+
+    def _is_folder(self, idx: int) -> bool:
+        f = self._stack[idx]
+        return f.kind == "obj" and f.key == "folders"
+
+    def _close(self, out: List[Tuple[str, str]]) -> None:
+        frame = self._stack.pop()
+        if not self._stack:
+            self.done = True
+            return
+        if frame.kind == "obj" and frame.key == "files" and frame.name:
+            self._resolve(len(self._stack), frame.name, frame.content or "", out)
+        elif frame.kind == "obj" and frame.key == "folders":
+            # Folder closed without a name: its files belong to the parent path
+            for rel, content in frame.pending:
+                self._resolve(len(self._stack), rel, content, out)
+
+    def _resolve(self, depth: int, rel: str, content: str, out: List[Tuple[str, str]]) -> None:
+        """Prefix rel with the folder names below depth, or park it on the first unnamed folder."""
+        for idx in range(depth - 1, -1, -1):
+            if not self._is_folder(idx):
+                continue
+            frame = self._stack[idx]
+            if frame.name is None:
+                frame.pending.append((rel, content))
+                return
+            rel = posixpath.join(frame.name, rel)
+        out.append((rel.strip("/"), content))
+
+    def _flush_pending(self, idx: int, out: List[Tuple[str, str]]) -> None:
+        frame = self._stack[idx]
+        pending, frame.pending = frame.pending, []
+        for rel, content in pending:
+            self._resolve(idx, posixpath.join(frame.name, rel), content, out)
+
+
+class ZipStreamWriter:
+    """Writes files into a ZIP as they arrive, adding each directory entry once."""
+
+    def __init__(self, file, compression: int = zipfile.ZIP_DEFLATED):
+        self._zf = zipfile.ZipFile(file, "w", compression)
+        self._dirs = set()
+        self.count = 0
+
+    def add(self, path: str, content: str) -> None:
+        arcpath = path.lstrip("/")
+        parts = arcpath.split("/")[:-1]
+        for i in range(1, len(parts) + 1):
+            d = "/".join(parts[:i]) + "/"
+            if d not in self._dirs:
+                self._dirs.add(d)
+                self._zf.writestr(d, "")
+        self._zf.writestr(arcpath, content or "")
+        self.count += 1
+
+    def close(self) -> None:
+        self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -7,17 +7,10 @@ from llama_index.core.workflow import (
     Event
 )
 
-from llama_index.llms.mistralai import MistralAI
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.anthropic import Anthropic
-
 from llama_index.core.schema import (
+    MetadataMode,
     NodeWithScore,
 )
-from llama_index.core.response_synthesizers import (
-    get_response_synthesizer,
-    ResponseMode
-)
 
 
 from llama_index.core.prompts import RichPromptTemplate, PromptTemplate
@@ -30,6 +23,8 @@ from typing import Any
 
 from output import DalleOutput, DalleOutputCode
 from utils import single_quote_to_double, single_quote_to_double_with_content, to_dict
+from llm_clients import llm_for, pool_stats
+import llm_calls
 from prompts import (
     EXTRACT_MICROSERVICES_TEXT,
     FIND_CONTEXT_TEXT,
@@ -83,7 +78,8 @@ CITATION_QA_TEMPLATE = PromptTemplate(
 # --- Workflow Definitions ---
 import os 
 from dotenv import load_dotenv
-assert load_dotenv()
+from offline_llm import offline_enabled
+assert load_dotenv() or offline_enabled()
 
 class CitationQueryEngineWorkflow(Workflow):
     @step
@@ -99,7 +95,7 @@ class CitationQueryEngineWorkflow(Workflow):
             print("Retriever is empty!")
             return None
 
-        nodes = retriever.retrieve(query)
+        nodes = await retriever.aretrieve(query)
         st.write(f"✅ Retrieved {len(nodes)} nodes for context.")
         return RetrieverEvent(nodes=nodes)
 
@@ -110,21 +106,11 @@ class CitationQueryEngineWorkflow(Workflow):
     @step
     async def synthesize(self, ctx: Context, ev: CreateCitationsEvent) -> StopEvent:
         model = await ctx.store.get("model")
-        if model == "mistral":
-            llm = MistralAI(model="mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=9000)
-        elif model in ("claude", "anthropic"):
-            llm = Anthropic(model="claude-sonnet-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
-        else:
-            llm = OpenAI(model="gpt-4.1", temperature=0, timeout=9999.0)
+        llm = llm_for(model)
 
         query = await ctx.store.get("query", default=None)
-        synthesizer = get_response_synthesizer(
-            llm=llm,
-            text_qa_template=CITATION_QA_TEMPLATE,
-            response_mode=ResponseMode.TREE_SUMMARIZE,
-            use_async=True,
-        )
-        response = await synthesizer.asynthesize(query, nodes=ev.nodes)
+        texts = [n.node.get_content(metadata_mode=MetadataMode.LLM) for n in ev.nodes]
+        response = await llm_calls.asynthesize(llm, CITATION_QA_TEMPLATE, query, texts, step="synthesize_context")
         return StopEvent(result=response)
 
 class DalleWorkflow(Workflow):
@@ -136,12 +122,7 @@ class DalleWorkflow(Workflow):
         await ctx.store.set("model", ev.model)
 
         model = await ctx.store.get("model")
-        if model == "mistral":
-            llm = MistralAI(model="mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=9000)
-        elif model in ("claude", "anthropic"):
-            llm = Anthropic(model="claude-sonnet-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
-        else:
-            llm = OpenAI(model="gpt-4.1", temperature=0, timeout=9999.0)
+        llm = llm_for(model)
         await ctx.store.set("llm", llm)
 
         print("The model being used is:", model)
@@ -151,7 +132,7 @@ class DalleWorkflow(Workflow):
         extract_template = RichPromptTemplate(EXTRACT_MICROSERVICES_TEXT)
         extract_query = extract_template.format(specs=ev.specs, user_stories=ev.user_stories)
 
-        resp = llm.complete(extract_query).text
+        resp = await llm_calls.acomplete(llm, extract_query, step="extract_microservices")
         try:
             resp_list = resp
         except (ValueError, SyntaxError):
@@ -169,12 +150,7 @@ class DalleWorkflow(Workflow):
         retriever = await ctx.store.get("retriever")
 
         model = await ctx.store.get("model")
-        if model == "mistral":
-            llm = MistralAI(model="mistral-large-2411", temperature=0, timeout=9999.0, max_tokens=9000)
-        elif model in ("claude", "anthropic"):
-            llm = Anthropic(model="claude-sonnet-4-5", temperature=1.0, max_tokens=64000, timeout=9999.0)
-        else:
-            llm = OpenAI(model="gpt-4.1", reasoning_effort="low", temperature=0, timeout=9999.0)
+        llm = llm_for(model, "context")
         
         #sllm = llm.as_structured_llm(output_cls=DalleOutput)
 
@@ -201,7 +177,9 @@ class DalleWorkflow(Workflow):
             verbose=True,
         )
         
-        output = program(
+        output = await llm_calls.acall_program(
+            program,
+            step="retrieve_context",
             specs=specs,
             context=str(context_response),
             user_stories=user_stories,
@@ -218,5 +196,6 @@ class DalleWorkflow(Workflow):
         st.write("✅ Generated Final Architecture.")
         st.json(single_quote_to_double(str(to_dict(output))))
 
+        print("LLM client pool:", pool_stats())
         return StopEvent(result=to_dict(output))
 
@@ -0,0 +1,387 @@
+"""
+Pre-flight token budgeting and hard cost caps per workflow run.
+
+Prompts such as GEN_CODE_FROM_MS, USE_CONTEXT_TEXT or the project_documents
+blobs of DalleCodeWorkflow2 can silently grow past a model's context window.
+Every call routed through llm_calls is now measured *before* it is sent:
+
+  - the rendered prompt is tokenized locally (tiktoken, or ~4 chars/token
+    when its encoding files are not available offline);
+  - the output size is predicted from the client's max_tokens;
+  - the call is checked against the model context window, the per-step cap,
+    the per-run token cap and the per-run cost cap.
+
+When a cap would be exceeded the budget's action decides what happens:
+  trim  - cut the middle of the largest context block until the call fits
+  split - callers that can (DalleCodeWorkflow2) split the documents into
+          several requests via pack_documents(); elsewhere it behaves as trim
+  abort - raise BudgetExceeded before anything is sent
+
+Every call is recorded in a ledger, written next to the run outputs:
+
+    budget = TokenBudget.from_env()
+    with use_budget(budget):
+        res = await wf.run(...)
+    budget.write_ledger(Path("results/run.ledger.json"))
+
+Env: TOKEN_BUDGET_RUN_TOKENS, TOKEN_BUDGET_RUN_COST (USD),
+     TOKEN_BUDGET_STEP_TOKENS ("generate_code=60000,judge=20000"),
+     TOKEN_BUDGET_ACTION (trim | split | abort, default trim).
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from llm_cache import llm_identity
+
+
+ACTIONS = ("trim", "split", "abort")
+
+# Used when a client has no max_tokens (OpenAI leaves it to the server)
+DEFAULT_OUTPUT_TOKENS = 4096
+DEFAULT_CONTEXT_WINDOW = 128_000
+
+# Approximate list prices, USD per 1M tokens: model prefix -> (input, output)
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "claude-haiku-4-5": (1.00, 5.00),
+    "claude-sonnet-4-5": (3.00, 15.00),
+    "claude-opus-4": (15.00, 75.00),
+    "mistral-large": (2.00, 6.00),
+    "codestral": (0.30, 0.90),
+}
+
+TRUNCATION_MARKER = "\n[... truncated to fit the token budget ...]\n"
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when a call cannot fit the run/step caps and the action is abort."""
+
+
+# ---- tokenizer ----
+
+_encoder = None
+_encoder_loaded = False
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            # tiktoken missing, or its encoding file cannot be downloaded (offline)
+            _encoder = None
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """Local token count of text; ~4 chars/token when tiktoken is unavailable."""
+    if not text:
+        return 0
+    enc = _get_encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def trim_text(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of text (instructions / output format) and drop the middle."""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    keep = int(len(text) * max_tokens / tokens)
+    for _ in range(8):
+        half = max(keep - len(TRUNCATION_MARKER), 0) // 2
+        out = text[:half] + TRUNCATION_MARKER + text[len(text) - half:] if half else text[:keep]
+        if count_tokens(out) <= max_tokens:
+            return out
+        keep = int(keep * 0.9)
+    return text[: max(keep, 0)]
+
+
+# ---- model facts ----
+
+def price_for(model: Optional[str]) -> Tuple[float, float]:
+    """(input, output) USD per 1M tokens for the longest matching model prefix."""
+    model = (model or "").lower()
+    best = ""
+    for prefix in PRICES:
+        if model.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    return PRICES.get(best, (0.0, 0.0))
+
+
+def predicted_output_tokens(llm) -> int:
+    return int(getattr(llm, "max_tokens", None) or DEFAULT_OUTPUT_TOKENS)
+
+
+def context_window(llm) -> int:
+    try:
+        return int(llm.metadata.context_window) or DEFAULT_CONTEXT_WINDOW
+    except Exception:
+        return DEFAULT_CONTEXT_WINDOW
+
+
+def _parse_step_caps(raw: str) -> Dict[str, int]:
+    caps: Dict[str, int] = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            caps[name.strip()] = int(value)
+    return caps
+
+
+# ---- budget ----
+
+# Ledger statuses the provider charges for: answered calls and thrown-away hedges
+BILLED = ("sent", "unused")
+
+def with_content(message, text: str):
+    """
+    Copy of a ChatMessage with its text replaced. content is a property over
+    message.blocks, so model_copy(update={"content": ...}) would keep the old text.
+    """
+    copied = message.model_copy(deep=True)
+    copied.content = text
+    return copied
+
+
+class TokenBudget:
+    def __init__(
+        self,
+        max_run_tokens: Optional[int] = None,
+        max_run_cost: Optional[float] = None,
+        step_caps: Optional[Dict[str, int]] = None,
+        action: str = "trim",
+    ):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown budget action: {action!r} (expected one of {ACTIONS})")
+        self.max_run_tokens = max_run_tokens
+        self.max_run_cost = max_run_cost
+        self.step_caps = dict(step_caps or {})
+        self.action = action
+        self.ledger: List[Dict[str, Any]] = []
+        self.run_tokens = 0
+        self.run_cost = 0.0
+        self.step_tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TokenBudget":
+        run_tokens = os.getenv("TOKEN_BUDGET_RUN_TOKENS")
+        run_cost = os.getenv("TOKEN_BUDGET_RUN_COST")
+        return cls(
+            max_run_tokens=int(run_tokens) if run_tokens else None,
+            max_run_cost=float(run_cost) if run_cost else None,
+            step_caps=_parse_step_caps(os.getenv("TOKEN_BUDGET_STEP_TOKENS", "")),
+            action=os.getenv("TOKEN_BUDGET_ACTION", "trim").strip().lower() or "trim",
+        )
+
+    def prompt_limit(self, llm, step: Optional[str]) -> int:
+        """Largest prompt (in tokens) the next call of step may send."""
+        out = predicted_output_tokens(llm)
+        limit = context_window(llm) - out
+        with self._lock:
+            cap = self.step_caps.get(step or "")
+            if cap is not None:
+                limit = min(limit, cap - self.step_tokens.get(step or "", 0) - out)
+            if self.max_run_tokens is not None:
+                limit = min(limit, self.max_run_tokens - self.run_tokens - out)
+            if self.max_run_cost is not None:
+                cin, cout = price_for(llm_identity(llm)["model"])
+                if cin:
+                    left = (self.max_run_cost - self.run_cost) * 1e6 - out * cout
+                    limit = min(limit, int(left / cin))
+        return limit
+
+    def _refuse(self, step: Optional[str], tokens: int, limit: int) -> None:
+        self._record(step, None, tokens, 0, "abort")
+        raise BudgetExceeded(
+            f"Step {step or '?'}: prompt of {tokens} tokens exceeds the remaining budget of "
+            f"{max(limit, 0)} tokens (run {self.run_tokens}/{self.max_run_tokens}, "
+            f"cost ${self.run_cost:.4f}/{self.max_run_cost})"
+        )
+
+    def fit_text(self, llm, prompt: str, step: Optional[str] = None) -> str:
+        """Return prompt unchanged, trimmed to fit, or raise BudgetExceeded."""
+        tokens = count_tokens(prompt)
+        limit = self.prompt_limit(llm, step)
+        if tokens <= limit:
+            return prompt
+        if self.action == "abort" or limit <= 0:
+            self._refuse(step, tokens, limit)
+        print(f"✂️ Budget: trimming {step or 'prompt'} from {tokens} to {limit} tokens")
+        return trim_text(prompt, limit)
+
+    def fit_messages(self, llm, messages: List[Any], step: Optional[str] = None) -> List[Any]:
+        """Like fit_text for chat messages: the longest message absorbs the cut."""
+        tokens = sum(count_tokens(m.content or "") for m in messages)
+        limit = self.prompt_limit(llm, step)
+        if tokens <= limit:
+            return messages
+        if self.action == "abort" or limit <= 0:
+            self._refuse(step, tokens, limit)
+        longest = max(range(len(messages)), key=lambda i: len(messages[i].content or ""))
+        keep = count_tokens(messages[longest].content or "") - (tokens - limit)
+        print(f"✂️ Budget: trimming {step or 'messages'} from {tokens} to {limit} tokens")
+        fitted = list(messages)
+        fitted[longest] = with_content(messages[longest], trim_text(messages[longest].content or "", keep))
+        return fitted
+
+    def fit_program_kwargs(self, program, kwargs: dict, step: Optional[str] = None, llm=None) -> dict:
+        """
+        Trim the largest string argument of an LLMTextCompletionProgram until its
+        prompt fits the limits of llm (default: the program's own client).
+        """
+        kwargs = dict(kwargs)
+        for _ in range(4):
+            tokens = count_tokens(program.prompt.format(llm=program._llm, **kwargs))
+            limit = self.prompt_limit(llm or program._llm, step)
+            if tokens <= limit:
+                return kwargs
+            text_args = [k for k, v in kwargs.items() if isinstance(v, str)]
+            if self.action == "abort" or limit <= 0 or not text_args:
+                self._refuse(step, tokens, limit)
+            name = max(text_args, key=lambda k: len(kwargs[k]))
+            print(f"✂️ Budget: trimming '{name}' of {step or 'program'} ({tokens} > {limit} tokens)")
+            kwargs[name] = trim_text(kwargs[name], count_tokens(kwargs[name]) - (tokens - limit))
+        return kwargs
+
+    def pack_documents(
+        self, llm, documents: List[str], overhead: str, step: Optional[str] = None
+    ) -> List[str]:
+        """
+        Group documents into prompt-sized blobs joined by blank lines.
+
+        overhead is the prompt rendered with an empty document slot. With
+        action "split" every group fits on its own and the caller sends one
+        request per group; with "trim" the documents that do not fit are cut
+        or dropped; with "abort" an oversized set raises BudgetExceeded.
+        """
+        limit = self.prompt_limit(llm, step) - count_tokens(overhead)
+        sizes = [count_tokens(d) + 1 for d in documents]  # +1 for the blank-line separator
+        if sum(sizes) <= limit:
+            return ["\n\n".join(documents)]
+        if self.action == "abort" or limit <= 0:
+            self._refuse(step, sum(sizes) + count_tokens(overhead), limit + count_tokens(overhead))
+
+        groups: List[List[str]] = [[]]
+        used = 0
+        trimmed = 0
+        for doc, size in zip(documents, sizes):
+            if size > limit:
+                doc, size = trim_text(doc, limit), limit
+                trimmed += 1
+            if used + size > limit and groups[-1]:
+                if self.action == "trim":
+                    groups[-1].append(trim_text(doc, limit - used))
+                    trimmed += 1
+                    break
+                groups.append([])
+                used = 0
+            groups[-1].append(doc)
+            used += size
+        print(f"✂️ Budget: {step or 'documents'} packed {len(documents)} documents "
+              f"({sum(sizes)} tokens) into {len(groups)} request(s) of <= {limit} tokens ({self.action})")
+        dropped = len(documents) - sum(len(g) for g in groups)
+        if trimmed or dropped:
+            lost = sum(sizes) - sum(count_tokens(d) + 1 for g in groups for d in g)
+            print(f"✂️ Budget: {step or 'documents'} cut {trimmed} and dropped {dropped} of "
+                  f"{len(documents)} documents ({lost} tokens not sent)")
+            self._record(step, llm, max(lost, 0), 0, "dropped",
+                         detail={"trimmed_documents": trimmed, "dropped_documents": dropped})
+        return ["\n\n".join(g) for g in groups]
+
+    def record(self, llm, step: Optional[str], prompt: str, output: str, cached: bool = False) -> None:
+        """Add a completed call to the ledger; cache hits are listed but cost nothing."""
+        self._record(step, llm, count_tokens(prompt), count_tokens(output), "cached" if cached else "sent")
+
+    def record_unused(
+        self, llm, step: Optional[str], prompt_tokens: int, output_tokens: int, estimated: bool = False
+    ) -> None:
+        """
+        Add a request whose answer was thrown away (a hedge that lost, or one
+        cancelled mid-flight); the provider bills it all the same. estimated
+        marks a cancelled request, whose output tokens are unknown.
+        """
+        self._record(step, llm, prompt_tokens, output_tokens, "unused",
+                     detail={"estimated": True} if estimated else None)
+
+    def _record(self, step, llm, prompt_tokens: int, output_tokens: int, status: str,
+                detail: Optional[Dict[str, Any]] = None) -> None:
+        ident = llm_identity(llm) if llm is not None else {"provider": None, "model": None}
+        cin, cout = price_for(ident["model"])
+        cost = (prompt_tokens * cin + output_tokens * cout) / 1e6
+        with self._lock:
+            if status in BILLED:
+                self.run_tokens += prompt_tokens + output_tokens
+                self.run_cost += cost
+                self.step_tokens[step or ""] = self.step_tokens.get(step or "", 0) + prompt_tokens + output_tokens
+            self.ledger.append({
+                "ts": time.time(),
+                "step": step,
+                "provider": ident["provider"],
+                "model": ident["model"],
+                "prompt_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "cost_usd": round(cost, 6) if status in BILLED else 0.0,
+                "status": status,
+                **(detail or {}),
+            })
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "caps": {
+                    "run_tokens": self.max_run_tokens,
+                    "run_cost_usd": self.max_run_cost,
+                    "step_tokens": self.step_caps,
+                    "action": self.action,
+                },
+                "totals": {
+                    "calls": sum(1 for e in self.ledger if e["status"] in BILLED),
+                    "tokens": self.run_tokens,
+                    "cost_usd": round(self.run_cost, 6),
+                    "per_step": dict(self.step_tokens),
+                },
+            }
+
+    def write_ledger(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            calls = list(self.ledger)
+        path.write_text(json.dumps({**self.summary(), "calls": calls}, indent=2), encoding="utf-8")
+        return path
+
+
+_current: contextvars.ContextVar[Optional[TokenBudget]] = contextvars.ContextVar("token_budget", default=None)
+
+
+def current_budget() -> Optional[TokenBudget]:
+    """Budget of the workflow run executing in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def use_budget(budget: TokenBudget):
+    """Make budget active for the calls (and workflow step tasks) started inside the block."""
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
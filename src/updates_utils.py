@@ -2,7 +2,7 @@ import os
 import json
 import shutil
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 def _safe_join(root: Path, rel: str) -> Path:
     p = (root / rel).resolve()
@@ -129,3 +129,28 @@ def apply_project_update_from_json(plan_str: str, project_root: Path) -> Dict[st
             summary["errors"].append({"index": i, "action": action, "error": str(e)})
 
     return summary
+
+
+def merge_update_plans(plan_strs: List[str]) -> str:
+    """
+    Merge the JSON plans returned for one request split into several calls
+    (see token_budget.TokenBudget.pack_documents) into a single plan.
+    """
+    if len(plan_strs) == 1:
+        return plan_strs[0]
+
+    actions = []
+    for plan_str in plan_strs:
+        try:
+            plan = json.loads(plan_str)
+        except Exception:
+            # Models often wrap the plan in a ```json fence or add prose around it
+            i, j = plan_str.find("{"), plan_str.rfind("}")
+            try:
+                plan = json.loads(plan_str[i:j + 1]) if i != -1 and j != -1 else None
+            except Exception as e:
+                raise ValueError(f"Invalid JSON plan: {e}")
+            if plan is None:
+                raise ValueError("Invalid JSON plan: no JSON object found")
+        actions.extend(plan.get("actions", []) if isinstance(plan, dict) else [])
+    return json.dumps({"version": "1", "actions": actions}, ensure_ascii=False)
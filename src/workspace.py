@@ -0,0 +1,141 @@
+"""
+Run-scoped scratch workspaces.
+
+DalleCodeWorkflow2 materialised the project in ./output_project and wrote its
+plans (patterns.plan.json, datastore.plan.json, <service>.txt, ...) next to
+it, and DalleWorkflow.package_zip wrote debug_generated_code.txt, all in the
+current directory: two Streamlit sessions or batch workers in one directory
+overwrote each other. Every run now writes into its own directory under
+WORKSPACE_ROOT (default <tmp>/archillm-runs):
+
+    with use_workspace("batch") as ws:        # caller-scoped: every workflow run inside shares ws
+        await DalleCodeWorkflow2(timeout=None).run(input_json=...)
+
+    ws = await run_workspace(ctx, "code2")    # inside a step: the caller's workspace, or one owned by the run
+    ws.write_text("patterns.plan.json", plan)
+    await release_workspace(ctx)              # final step: removes a workspace the run owns
+
+WORKSPACE_KEEP decides what survives a run: "never" (default), "on_error"
+(keep the directories of failed runs for inspection) or "always".
+A workspace a run created itself is only released by the run's final step,
+so a run that raises leaves it behind until interpreter exit. Long-lived
+callers (the Streamlit app, main_batch, the archi_code2 CLI) therefore wrap
+every run in use_workspace(), which finishes the workspace in a finally.
+"""
+import atexit
+import contextvars
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Set
+
+KEEP_MODES = ("never", "on_error", "always")
+
+
+def workspace_root() -> Path:
+    return Path(os.getenv("WORKSPACE_ROOT") or Path(tempfile.gettempdir()) / "archillm-runs")
+
+
+def keep_mode() -> str:
+    mode = os.getenv("WORKSPACE_KEEP", "never").strip().lower() or "never"
+    if mode not in KEEP_MODES:
+        raise ValueError(f"Unknown WORKSPACE_KEEP: {mode!r} (expected one of {KEEP_MODES})")
+    return mode
+
+
+class RunWorkspace:
+    """A private directory for one workflow run."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.run_id = self.path.name
+
+    @classmethod
+    def create(cls, prefix: str = "run") -> "RunWorkspace":
+        run_id = f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        path = workspace_root() / run_id
+        path.mkdir(parents=True)
+        return cls(path)
+
+    def file(self, name: str) -> Path:
+        return self.path / name
+
+    def write_text(self, name: str, text: str) -> Path:
+        p = self.file(name)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(text, encoding="utf-8")
+        return p
+
+    def finish(self, failed: bool = False) -> bool:
+        """Remove the workspace unless WORKSPACE_KEEP retains it. Returns True when it was kept."""
+        _pending.discard(self)
+        mode = keep_mode()
+        if mode == "always" or (mode == "on_error" and failed):
+            print(f"Workspace kept: {self.path}")
+            return True
+        shutil.rmtree(self.path, ignore_errors=True)
+        return False
+
+    def __repr__(self) -> str:
+        return f"RunWorkspace({str(self.path)!r})"
+
+
+_current: contextvars.ContextVar[Optional[RunWorkspace]] = contextvars.ContextVar("run_workspace", default=None)
+# Workspaces created by runs that have not released them yet
+_pending: Set[RunWorkspace] = set()
+
+
+def current_workspace() -> Optional[RunWorkspace]:
+    """Workspace of the use_workspace() block executing in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def use_workspace(prefix: str = "run"):
+    """Create a workspace for the runs started inside the block and finish it on exit."""
+    ws = RunWorkspace.create(prefix)
+    token = _current.set(ws)
+    failed = True
+    try:
+        yield ws
+        failed = False
+    finally:
+        _current.reset(token)
+        ws.finish(failed=failed)
+
+
+async def run_workspace(ctx, prefix: str = "run") -> RunWorkspace:
+    """The workspace of this workflow run: the caller's, or a new one owned by the run (kept in ctx.store)."""
+    ws = await ctx.store.get("workspace", default=None)
+    if ws is None:
+        ws = current_workspace()
+        if ws is None:
+            ws = RunWorkspace.create(prefix)
+            _pending.add(ws)
+            await ctx.store.set("workspace_owned", True)
+        await ctx.store.set("workspace", ws)
+    return ws
+
+
+async def release_workspace(ctx, failed: bool = False) -> bool:
+    """
+    Finish the workspace the run created itself; a caller's workspace is left to
+    use_workspace(). Returns True when the workspace still exists afterwards.
+    """
+    ws = await ctx.store.get("workspace", default=None)
+    if ws is None:
+        return False
+    if not await ctx.store.get("workspace_owned", default=False):
+        return True
+    await ctx.store.set("workspace_owned", False)
+    return ws.finish(failed=failed)
+
+
+@atexit.register
+def _finish_pending() -> None:
+    for ws in list(_pending):
+        ws.finish(failed=True)
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# Modules under src/ import each other by bare name (they run from src/)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+# Reference implementations the tests compare against live with the benchmarks
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "bench"))
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+
+from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+
+import archi_code2
+
+DELAY = 0.5
+N_MICROSERVICES = 8
+
+
+class DelayedStubLLM(CustomLLM):
+    """Answers every workflow prompt after DELAY seconds and records when code-gen calls ran."""
+
+    codegen_calls: list = []
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name="delayed-stub")
+
+    def _answer(self, prompt: str) -> str:
+        if "code generator" in prompt:
+            sections = "svc/src/main/java/App.java\n----------\n```java\nclass App {}\n```\n"
+            return json.dumps({"code": sections})
+        return json.dumps({"version": "1", "actions": []})
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        # Blocking path: a step that still calls this stalls the whole event loop
+        time.sleep(DELAY)
+        return CompletionResponse(text=self._answer(prompt))
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        start = time.perf_counter()
+        await asyncio.sleep(DELAY)
+        if "code generator" in prompt:
+            self.codegen_calls.append((start, time.perf_counter()))
+        return CompletionResponse(text=self._answer(prompt))
+
+    def stream_complete(self, prompt, formatted=False, **kwargs):
+        raise NotImplementedError
+
+
+def test_microservice_fan_out_overlaps_llm_calls(tmp_path, monkeypatch):
+    stub = DelayedStubLLM()
+    monkeypatch.setattr(archi_code2, "get_llm", lambda *args, **kwargs: stub)
+    monkeypatch.chdir(tmp_path)
+
+    input_json = {
+        "microservices": [{"name": f"svc{i}", "endpoints": []} for i in range(N_MICROSERVICES)],
+        "patterns": [],
+        "datastore": [],
+    }
+
+    async def run():
+        wf = archi_code2.DalleCodeWorkflow2(timeout=60)
+        return await wf.run(input_json=input_json)
+
+    asyncio.run(run())
+
+    assert len(stub.codegen_calls) == N_MICROSERVICES
+    first_start = min(s for s, _ in stub.codegen_calls)
+    last_end = max(e for _, e in stub.codegen_calls)
+    # Serial execution would take N * DELAY; overlapped calls finish in about one DELAY
+    assert last_end - first_start < 2 * DELAY
+
+
+def test_codegen_files_are_generated_concurrently_in_plan_order(monkeypatch):
+    import pattern_workflow
+    from offline_llm import OfflineLLM
+
+    class FlakyLLM(OfflineLLM):
+        async def acomplete(self, prompt, formatted=False, **kwargs):
+            if "Broken.java" in prompt:
+                raise ValueError("bad file")
+            return await super().acomplete(prompt, formatted=formatted, **kwargs)
+
+    monkeypatch.setattr(pattern_workflow.Settings, "_llm", FlakyLLM(latency_s=DELAY))
+    monkeypatch.setenv("CODEGEN_FILE_CONCURRENCY", "8")
+    req = pattern_workflow.PlanRequestEvent(
+        service_dir="svc", package="com.acme", service_name="svc", patterns={}, readme="", output_service_dir="out"
+    )
+    paths = [f"com/acme/File{i}.java" for i in range(7)] + ["com/acme/Broken.java"]
+    ev = pattern_workflow.ExamplesRetrievedEvent(
+        plan={"files": [{"path": p, "purpose": "x"} for p in paths]}, req=req, rag_context=""
+    )
+
+    start = time.perf_counter()
+    res = asyncio.run(pattern_workflow.CodegenWorkflow(timeout=60).generate_files(ev))
+    elapsed = time.perf_counter() - start
+
+    assert [f["path"] for f in res.files] == paths[:-1]
+    assert [f["path"] for f in res.failed] == ["com/acme/Broken.java"]
+    assert elapsed < 2 * DELAY
+
+
+def test_add_pattern_runs_services_concurrently(tmp_path, monkeypatch):
+    from pathlib import Path
+
+    import pattern_workflow
+    from llm_clients import reset_pool
+
+    example = Path(__file__).resolve().parent.parent / "example/output/not-farm-from-home"
+    payload = {"filename": "p.zip", "zip_base64": pattern_workflow.base64_encode(pattern_workflow.zip_dir_to_bytes(example))}
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+    monkeypatch.setenv("LLM_OFFLINE", "1")
+    monkeypatch.setenv("OFFLINE_LATENCY_S", str(DELAY / 2))
+    monkeypatch.setenv("CODEGEN_SERVICE_CONCURRENCY", "16")
+    reset_pool()
+
+    start = time.perf_counter()
+    res = asyncio.run(pattern_workflow.add_pattern(payload, output=tmp_path / "out.zip"))
+    elapsed = time.perf_counter() - start
+    reset_pool()
+
+    from project_tree import ProjectTree
+
+    services = ProjectTree.from_zip_bytes(Path(res["zip_path"]).read_bytes()).find_services()
+    assert len(services) > 4 and "service_errors" not in res
+    # Each service makes two sequential LLM rounds (plan, files); serially that is len(services) times more
+    assert elapsed < len(services) * DELAY / 2
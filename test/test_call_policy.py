@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from llama_index.core.llms import CompletionResponse, MockLLM
+
+import call_policy
+import llm_calls
+from call_policy import policy_stats, run_with_policy
+from token_budget import TokenBudget, use_budget
+
+
+@pytest.fixture(autouse=True)
+def fast_policy(monkeypatch):
+    call_policy.reset_policy_stats()
+    monkeypatch.setenv("LLM_BACKOFF_S", "0.01")
+    monkeypatch.delenv("LLM_HEDGE", raising=False)
+
+
+def _scripted(delays):
+    """make_call factory whose n-th call sleeps delays[n] then returns n."""
+    calls = []
+
+    def make_call():
+        n = len(calls)
+        calls.append(n)
+
+        async def call():
+            await asyncio.sleep(delays[n])
+            return n
+        return call()
+    return make_call, calls
+
+
+def test_stuck_call_hits_deadline_and_is_retried(monkeypatch):
+    monkeypatch.setenv("LLM_STEP_DEADLINES", "judge=0.2")
+    make_call, calls = _scripted([30, 0])
+
+    assert asyncio.run(run_with_policy("judge", make_call)) == 1
+    stats = policy_stats()["judge"]
+    assert stats["timeouts"] == 1 and stats["retries"] == 1 and stats["calls"] == 1
+
+
+def test_non_transient_errors_are_not_retried():
+    calls = []
+
+    async def boom():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run_with_policy("plan_service", boom))
+    assert len(calls) == 1
+
+
+def test_hedge_after_p95_and_keep_the_faster_response(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE", "generate_files")
+    stats = call_policy._step_stats("generate_files")
+    stats.latencies.extend([0.05] * call_policy.HEDGE_MIN_SAMPLES)
+    make_call, calls = _scripted([30, 0.01])
+
+    assert asyncio.run(run_with_policy("generate_files", make_call)) == 1
+    assert len(calls) == 2
+    assert policy_stats()["generate_files"]["hedge_wins"] == 1
+
+
+class _SlowFirstLLM(MockLLM):
+    """First request hangs, the others answer at once."""
+
+    calls: int = 0
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            await asyncio.sleep(30)
+        return CompletionResponse(text="ok")
+
+
+def test_cancelled_hedge_is_billed_and_only_provider_time_is_a_latency(monkeypatch):
+    monkeypatch.setenv("LLM_HEDGE", "generate_files")
+    stats = call_policy._step_stats("generate_files")
+    stats.latencies.extend([0.05] * call_policy.HEDGE_MIN_SAMPLES)
+    budget = TokenBudget()
+    with use_budget(budget):
+        text = asyncio.run(llm_calls.acomplete(_SlowFirstLLM(max_tokens=10), "hello " * 50, step="generate_files"))
+
+    assert text == "ok"
+    assert [e["status"] for e in budget.ledger] == ["unused", "sent"]
+    assert budget.ledger[0]["estimated"] and budget.ledger[0]["prompt_tokens"] > 0
+    assert budget.summary()["totals"]["calls"] == 2
+    # the winner's provider time, not the 0.05s the hedge waited before it was sent
+    assert len(stats.latencies) == call_policy.HEDGE_MIN_SAMPLES + 1
+    assert stats.latencies[-1] < 0.05
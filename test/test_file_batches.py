@@ -0,0 +1,71 @@
+import asyncio
+import json
+
+import pattern_workflow
+from file_batches import group_small_files, parse_batch_response
+from offline_llm import OfflineLLM
+
+PLAN = [
+    {"path": "com/acme/OrderApplication.java", "purpose": "entry point"},
+    {"path": "com/acme/web/OrderController.java", "purpose": "REST controller"},
+    {"path": "com/acme/dto/OrderDto.java", "purpose": "order data"},
+    {"path": "com/acme/events/OrderCreatedEvent.java", "purpose": "domain event"},
+    {"path": "com/acme/repository/OrderRepository.java", "purpose": "persistence"},
+    {"path": "com/acme/service/OrderService.java", "purpose": "business logic"},
+    {"path": "com/acme/model/OrderStatus.java", "purpose": "status"},
+]
+
+
+class RecordingLLM(OfflineLLM):
+    prompts: list = []
+    drop: str = ""  # file left out of every batch answer
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        self.prompts.append(prompt)
+        res = await super().acomplete(prompt, formatted=formatted, **kwargs)
+        if self.drop and "for each of the files" in prompt:
+            data = json.loads(res.text)
+            data["files"] = [f for f in data["files"] if not f["path"].endswith(self.drop)]
+            res.text = json.dumps(data)
+        return res
+
+
+def test_grouping_and_parsing(monkeypatch):
+    monkeypatch.setenv("CODEGEN_BATCH_FILES", "1")
+    assert group_small_files(PLAN) == ([], PLAN)
+
+    monkeypatch.setenv("CODEGEN_BATCH_FILES", "3")
+    batches, singles = group_small_files(PLAN)
+    assert [[f["path"].rsplit("/", 1)[-1] for f in b] for b in batches] == [
+        ["OrderApplication.java", "OrderDto.java", "OrderCreatedEvent.java"],
+        ["OrderRepository.java", "OrderStatus.java"],
+    ]
+    assert [f["path"] for f in singles] == [PLAN[1]["path"], PLAN[5]["path"]]
+
+    paths = ["com/acme/A.java", "com/acme/B.java"]
+    answer = "```json\n" + json.dumps({"files": [
+        {"path": "/com/acme/A.java", "code": "class A {}"},
+        {"path": "B.java", "code": "class B {}"},
+        {"path": "com/acme/Other.java", "code": "class Other {}"},
+    ]}) + "\n```"
+    assert parse_batch_response(answer, paths) == {"com/acme/A.java": "class A {}", "com/acme/B.java": "class B {}"}
+    assert parse_batch_response("not json", paths) == {}
+
+
+def test_generate_files_batches_small_files_and_falls_back(monkeypatch):
+    monkeypatch.setenv("CODEGEN_BATCH_FILES", "8")
+    req = pattern_workflow.PlanRequestEvent(
+        service_dir="svc", package="com.acme", service_name="order", patterns={}, readme="", output_service_dir="out"
+    )
+    ev = pattern_workflow.ExamplesRetrievedEvent(plan={"files": PLAN}, req=req, rag_context="")
+
+    for drop, calls in (("", 3), ("OrderDto.java", 4)):
+        llm = RecordingLLM(prompts=[], drop=drop)
+        monkeypatch.setattr(pattern_workflow.Settings, "_llm", llm)
+        res = asyncio.run(pattern_workflow.CodegenWorkflow(timeout=60).generate_files(ev))
+
+        # one batch of five small files + controller + service (+ the dropped file alone)
+        assert len(llm.prompts) == calls
+        assert [f["path"] for f in res.files] == [f["path"] for f in PLAN] and not res.failed
+        dto = next(f["code"] for f in res.files if f["path"].endswith("OrderDto.java"))
+        assert "public class OrderDto" in dto
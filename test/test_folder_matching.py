@@ -0,0 +1,47 @@
+import random
+import time
+from pathlib import Path
+
+import pattern_workflow
+from folder_matching import FolderIndex, match_labels_to_folders
+
+EXAMPLE = Path(__file__).resolve().parent.parent / "example/output/not-farm-from-home"
+
+
+def test_readme_labels_map_to_example_services():
+    folders = [p.name for p in pattern_workflow.find_services(EXAMPLE)]
+    readme = pattern_workflow.parse_patterns_from_readme((EXAMPLE / "README.md").read_text(encoding="utf-8"))
+    assigned = match_labels_to_folders(readme, folders)
+
+    assert set(assigned) == set(folders) - {"frontend"}
+    assert assigned["order_service"] is readme["order"]
+    assert assigned["product_catalog_service"] is readme["product catalog"]
+
+
+def test_conflicting_labels_get_distinct_folders():
+    folders = ["order-history-service", "order-service", "billing-service"]
+    labels = {"order": {"saga": {"name": "Order"}}, "order history": {"cqrs": True}, "Shipping": {}}
+    # Greedy matching gave "order" the first folder it tied on, leaving order-service unassigned
+    assert match_labels_to_folders(labels, folders) == {
+        "order-history-service": labels["order history"],
+        "order-service": labels["order"],
+    }
+    index = FolderIndex(folders)
+    assert index.score("order", 0) == index.score("order", 1) == 6
+    assert all(index.score("Shipping", i) == 0 for i in index.candidates("Shipping"))
+
+
+def test_hundreds_of_services():
+    rng = random.Random(3)
+    words = ["order", "payment", "user", "catalog", "billing", "ship", "notify", "audit", "report", "search",
+             "cart", "review", "stock", "price", "promo", "loyalty", "fraud", "ledger", "tax", "invoice"]
+    names = sorted({" ".join(rng.sample(words, 3)) for _ in range(600)})[:400]
+    folders = [n.replace(" ", "-") + "-service" for n in names]
+    labels = {n: {"i": i} for i, n in enumerate(reversed(names))}
+    rng.shuffle(folders)
+
+    start = time.perf_counter()
+    assigned = match_labels_to_folders(labels, folders)
+    assert time.perf_counter() - start < 5
+    assert all(pats is labels[f[: -len("-service")].replace("-", " ")] for f, pats in assigned.items())
+    assert len(assigned) == len(names)
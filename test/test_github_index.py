@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import hashlib
+import json
+
+from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+from llama_index.readers.github import GithubClient, GithubRepositoryReader
+
+import pattern_workflow
+from github_index import fetch_github_blobs, github_tree, index_revision, indexed_files, refresh_index
+from local_repo_reader import allowed_dir, git_blob_sha
+from offline_llm import HashEmbedding
+
+EMBEDDED = []
+OWNER, REPO = "microservices-patterns", "ftgo-application"
+
+
+class CountingEmbedding(HashEmbedding):
+    def _get_text_embedding(self, text):
+        EMBEDDED.append(text)
+        return self._embed(text)
+
+
+class _Response:
+    def __init__(self, body):
+        self.text = json.dumps(body)
+
+
+class FakeGithubClient(GithubClient):
+    """The real GithubClient with its HTTP request answered from an in-memory branch."""
+
+    def __init__(self, files):
+        super().__init__(github_token="ghp-test")
+        self.blobs, self.trees = {}, {}
+        self.root = self._add_tree(files)
+        self.requests = []
+
+    def _add_tree(self, files):
+        entries, subdirs = [], {}
+        for path, text in sorted(files.items()):
+            head, sep, rest = path.partition("/")
+            if sep:
+                subdirs.setdefault(head, {})[rest] = text
+            else:
+                data = text if isinstance(text, bytes) else text.encode()
+                sha = git_blob_sha(data)
+                self.blobs[sha] = data
+                entries.append({"path": head, "mode": "100644", "type": "blob", "sha": sha, "size": len(data)})
+        for name, sub in subdirs.items():
+            entries.append({"path": name, "mode": "040000", "type": "tree", "sha": self._add_tree(sub)})
+        sha = hashlib.sha1(json.dumps(entries, sort_keys=True).encode()).hexdigest()
+        self.trees[sha] = entries
+        return sha
+
+    async def request(self, endpoint, method, headers={}, timeout=5, retries=0, **kwargs):
+        self.requests.append(endpoint)
+        if endpoint == "getBranch":
+            return _Response({
+                "name": kwargs["branch"],
+                "commit": {"commit": {"tree": {"sha": self.root}}},
+                "_links": {"self": "", "html": ""},
+            })
+        if endpoint == "getTree":
+            tree_sha = kwargs["tree_sha"]
+            return _Response({"sha": tree_sha, "url": "", "tree": self.trees[tree_sha], "truncated": False})
+        data = self.blobs[kwargs["file_sha"]]
+        return _Response({
+            "content": base64.b64encode(data).decode(), "encoding": "base64", "url": "",
+            "sha": kwargs["file_sha"], "size": len(data), "node_id": "",
+        })
+
+
+def _refresh(index, client, skipped=None, descend=None):
+    async def run():
+        tree = await github_tree(client, OWNER, REPO, "master", descend=descend)
+
+        async def fetch(files):
+            return await fetch_github_blobs(client, OWNER, REPO, "master", files)
+
+        return await refresh_index(index, tree, fetch, skipped)
+
+    return asyncio.run(run())
+
+
+def test_refresh_embeds_only_changed_files(tmp_path):
+    embed = CountingEmbedding()
+    tree = {f"src/svc{i % 3}/Service{i}.java": f"class Service{i} {{ int v = {i}; }}" for i in range(20)}
+    index = VectorStoreIndex([], embed_model=embed)
+    assert _refresh(index, FakeGithubClient(tree)) == {"added": 20, "changed": 0, "deleted": 0, "unchanged": 0}
+    index.storage_context.persist(persist_dir=str(tmp_path))
+    EMBEDDED.clear()
+
+    tree = dict(tree)
+    tree["src/svc0/Service3.java"] = "class Service3 { String saga = \"order\"; }"
+    del tree["src/svc1/Service7.java"]
+    tree["src/OrderSaga.java"] = "class OrderSaga { void compensate() {} }"
+
+    index = load_index_from_storage(StorageContext.from_defaults(persist_dir=str(tmp_path)), embed_model=embed)
+    before = index_revision(index)
+    client = FakeGithubClient(tree)
+    stats = _refresh(index, client)
+
+    assert stats == {"added": 1, "changed": 1, "deleted": 1, "unchanged": 18}
+    assert client.requests.count("getBlob") == 2
+    assert len(EMBEDDED) == 2
+    assert sorted(indexed_files(index).values()) == sorted(tree)
+    doc_url = next(info.metadata["url"] for info in index.ref_doc_info.values()
+                   if info.metadata["file_path"] == "src/OrderSaga.java")
+    assert doc_url == f"https://github.com/{OWNER}/{REPO}/blob/master/src/OrderSaga.java"
+
+    index.storage_context.persist(persist_dir=str(tmp_path))
+    reloaded = load_index_from_storage(StorageContext.from_defaults(persist_dir=str(tmp_path)), embed_model=embed)
+    hits = reloaded.as_retriever(similarity_top_k=1).retrieve("OrderSaga compensate")
+    assert hits[0].node.metadata["file_path"] == "src/OrderSaga.java"
+    # Nothing changed: nothing downloaded or embedded
+    EMBEDDED.clear()
+    again = FakeGithubClient(tree)
+    assert _refresh(reloaded, again) == {"added": 0, "changed": 0, "deleted": 0, "unchanged": 20}
+    assert "getBlob" not in again.requests and EMBEDDED == []
+    # The RAG cache key follows the content: the refresh changed it, reloading did not
+    assert index_revision(reloaded) == index_revision(index) != before
+
+
+def test_excluded_directories_and_binary_blobs_are_not_fetched_again():
+    files = {
+        "src/Order.java": "class Order {}",
+        "src/logo.bin": b"\x89PNG\xff\xfe",
+        "docs/guide/intro.md": "# Intro",
+    }
+    exclude_docs = (["docs"], GithubRepositoryReader.FilterType.EXCLUDE)
+    index, skipped = VectorStoreIndex([], embed_model=HashEmbedding()), set()
+
+    client = FakeGithubClient(files)
+    stats = _refresh(index, client, skipped, descend=lambda d: allowed_dir(d, exclude_docs))
+    assert stats["added"] == 1 and sorted(indexed_files(index).values()) == ["src/Order.java"]
+    assert client.requests.count("getTree") == 2  # the root and src/, never docs/ or docs/guide/
+    assert skipped == {git_blob_sha(files["src/logo.bin"])}
+
+    again = FakeGithubClient(files)
+    _refresh(index, again, skipped, descend=lambda d: allowed_dir(d, exclude_docs))
+    assert "getBlob" not in again.requests
+
+
+def test_build_retriever_refreshes_through_the_github_client(tmp_path, monkeypatch, capsys):
+    files = {
+        "README.md": "# FTGO\n",
+        "order/CreateOrderSaga.java": "class CreateOrderSaga { void compensate() {} }\n",
+        "docs/diagram.png": "not really a png\n",
+    }
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("REFERENCE_REPO_PATH", raising=False)
+    monkeypatch.setattr(pattern_workflow.Settings, "_embed_model", HashEmbedding())
+    index = VectorStoreIndex([])
+    index.storage_context.persist(persist_dir=str(tmp_path / f".cache/github_indexes/{OWNER}_{REPO}_master"))
+    client = FakeGithubClient(files)
+    monkeypatch.setattr(pattern_workflow, "GithubClient", lambda **kwargs: client)
+
+    retriever = asyncio.run(pattern_workflow.build_github_retriever("ghp-test", refresh=True))
+
+    assert "rebuilding" not in capsys.readouterr().out
+    assert sorted(indexed_files(retriever._index).values()) == ["README.md", "order/CreateOrderSaga.java"]
+    assert client.requests.count("getBlob") == 2
@@ -0,0 +1,90 @@
+from llama_index.core import Document, VectorStoreIndex
+from llama_index.core.node_parser import SentenceSplitter
+
+from java_chunks import JavaNodeParser, java_chunks
+from offline_llm import HashEmbedding
+
+ORDER_SERVICE = '''/*
+ * Copyright (c) 2017 Chris Richardson
+ * Licensed under the Apache License, Version 2.0
+ */
+package net.chrisrichardson.ftgo.orderservice.domain;
+
+import io.eventuate.tram.sagas.orchestration.SagaManager;
+import org.springframework.transaction.annotation.Transactional;
+import java.util.List;
+
+/**
+ * Creates and revises orders { braces in comments are ignored }
+ */
+@Transactional
+public class OrderService {
+
+  private SagaManager<CreateOrderSagaState> createOrderSagaManager;
+  private static final String[] STATES = {"APPROVED", "}"};
+
+  public OrderService(SagaManager<CreateOrderSagaState> createOrderSagaManager) {
+    this.createOrderSagaManager = createOrderSagaManager;
+  }
+
+  public Order createOrder(long consumerId, long restaurantId, List<MenuItemIdAndQuantity> lineItems) {
+    String note = "not a brace: }";
+    CreateOrderSagaState data = new CreateOrderSagaState(consumerId, restaurantId, lineItems);
+    createOrderSagaManager.create(data, Order.class, consumerId);
+    return new Order(consumerId, restaurantId, lineItems);
+  }
+
+  @Transactional(readOnly = true)
+  public void cancel(long orderId) {
+    Runnable r = () -> { System.out.println('}'); };
+    r.run();
+  }
+
+  public static class OrderLimits {
+    int maxItems;
+    boolean exceeds(int n) { return n > maxItems; }
+  }
+}
+'''
+
+
+def test_chunks_follow_types_and_members():
+    chunks = java_chunks(ORDER_SERVICE, max_chars=500)
+    text = "\n".join(c.text for c in chunks)
+    assert "Licensed" not in text and "import " not in text and "Creates and revises" not in text
+    assert all(c.text.startswith("package net.chrisrichardson.ftgo.orderservice.domain;") for c in chunks)
+
+    outer = [c for c in chunks if c.metadata["class_name"] == "OrderService"]
+    assert len(outer) > 1 and all(len(c.text) <= 500 for c in outer)
+    assert all(c.metadata["annotations"] == "Transactional" and c.metadata["kind"] == "class" for c in outer)
+    assert all("@Transactional public class OrderService {" in c.text for c in outer)
+    members = [m for c in outer for m in c.metadata["members"].split(", ") if m]
+    assert members == ["OrderService", "createOrder", "cancel"]
+    # Whole methods, despite braces in strings, chars and lambdas
+    create = next(c for c in outer if "createOrder" in c.metadata["members"])
+    assert 'String note = "not a brace: }";' in create.text and "return new Order(" in create.text
+    cancel = next(c for c in outer if "cancel" in c.metadata["members"])
+    assert "@Transactional(readOnly = true)" in cancel.text and "r.run();" in cancel.text
+
+    nested = next(c for c in chunks if c.metadata["class_name"] == "OrderService.OrderLimits")
+    assert nested.metadata["members"] == "exceeds" and "int maxItems;" in nested.text
+
+
+def test_parser_nodes_belong_to_their_document():
+    docs = [
+        Document(text=ORDER_SERVICE, doc_id="sha-java", metadata={"file_path": "order/OrderService.java"}),
+        Document(text="FTGO is an example application. " * 40, doc_id="sha-md", metadata={"file_path": "README.md"}),
+        Document(text="// nothing declared here\n", doc_id="sha-empty", metadata={"file_path": "package-info.java"}),
+    ]
+    nodes = JavaNodeParser(max_chars=600).get_nodes_from_documents(docs)
+    assert {n.ref_doc_id for n in nodes} == {"sha-java", "sha-md", "sha-empty"}
+    java = [n for n in nodes if n.ref_doc_id == "sha-java"]
+    assert all(n.metadata["file_path"] == "order/OrderService.java" and n.metadata["package"] for n in java)
+    assert not any("package" in n.metadata for n in nodes if n.ref_doc_id != "sha-java")
+
+    # Denser than the default splitter: the retrieved method comes without header or imports
+    index = VectorStoreIndex(nodes, embed_model=HashEmbedding())
+    hit = index.as_retriever(similarity_top_k=1).retrieve("createOrder consumerId restaurantId lineItems note")[0]
+    default = SentenceSplitter().get_nodes_from_documents(docs[:1])
+    assert "createOrder" in hit.node.metadata["members"]
+    assert len(hit.node.text) < min(len(n.text) for n in default)
@@ -0,0 +1,41 @@
+import pytest
+from llama_index.core.llms import MockLLM
+
+import llm_calls
+from llm_cache import CacheMiss, set_cache_mode
+
+
+@pytest.fixture(autouse=True)
+def _reset_cache_mode():
+    yield
+    set_cache_mode("off")
+
+
+class CountingLLM(MockLLM):
+    calls: int = 0
+
+    def complete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        return super().complete(prompt, formatted=formatted, **kwargs)
+
+
+def test_read_through_serves_second_call_from_disk(tmp_path):
+    cache = set_cache_mode("read", root=str(tmp_path))
+    llm = CountingLLM()
+    first = llm_calls.complete(llm, "list the microservices")
+    second = llm_calls.complete(llm, "list the microservices")
+    assert first == second
+    assert llm.calls == 1
+    assert cache.stats == {"hits": 1, "misses": 1, "writes": 1}
+
+
+def test_strict_replay_fails_on_miss(tmp_path):
+    set_cache_mode("record", root=str(tmp_path))
+    llm = CountingLLM()
+    recorded = llm_calls.complete(llm, "recorded prompt")
+
+    set_cache_mode("replay", root=str(tmp_path))
+    assert llm_calls.complete(llm, "recorded prompt") == recorded
+    with pytest.raises(CacheMiss):
+        llm_calls.complete(llm, "never recorded")
+    assert llm.calls == 1
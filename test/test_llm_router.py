@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+from llama_index.core.llms import CompletionResponse, LLMMetadata, MockLLM
+
+import llm_calls
+import llm_router
+from llm_cache import LLMCache
+from llm_clients import llm_for
+from token_budget import TokenBudget, use_budget
+
+
+@pytest.fixture
+def router(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-ant-test")
+    monkeypatch.delenv("MISTRAL_API_KEY", raising=False)
+    monkeypatch.setenv("LLM_ROUTING_LOG", str(tmp_path / "routing.jsonl"))
+    monkeypatch.setenv("LLM_STEP_SLOS", "generate_code=10")
+    monkeypatch.setenv("LLM_FAILOVER", "1")
+    monkeypatch.delenv("LLM_FAILOVER_STEPS", raising=False)
+    fresh = llm_router.Router()
+    monkeypatch.setattr(llm_router, "_router", fresh)
+    return fresh
+
+
+def test_slo_breach_fails_over_to_same_role_of_another_provider(router, tmp_path):
+    primary = llm_for("openai", "code")
+    for _ in range(llm_router.MIN_SAMPLES):
+        router.observe(primary, "generate_code", latency=60.0, ok=True)
+
+    chosen = router.route(primary, "generate_code")[0]
+
+    assert chosen is llm_for("anthropic", "code")
+    logged = json.loads((tmp_path / "routing.jsonl").read_text().splitlines()[0])
+    assert logged["requested"]["provider"] == "openai"
+    assert logged["chosen"]["provider"] == "anthropic"
+    assert logged["primary_health"]["breach"] is True
+
+
+def test_healthy_primary_and_pinned_steps_are_not_rerouted(router):
+    primary = llm_for("openai")
+    for _ in range(llm_router.MIN_SAMPLES):
+        router.observe(primary, "generate_code", latency=1.0, ok=True)
+        router.observe(primary, "judge", latency=60.0, ok=False)
+
+    assert router.route(primary, "generate_code")[0] is primary
+    assert router.route(primary, "judge") == [primary]
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+class DownLLM(MockLLM):
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        raise APIConnectionError("connection reset")
+
+
+class UpLLM(MockLLM):
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        return CompletionResponse(text="from fallback")
+
+
+def test_transient_failure_moves_the_call_to_the_next_candidate(router, monkeypatch):
+    monkeypatch.setenv("LLM_RETRIES", "0")
+    down, up = DownLLM(), UpLLM()
+    monkeypatch.setattr(router, "candidates", lambda llm, step: [down, up])
+
+    text = asyncio.run(llm_calls.acomplete(down, "hi", step="plan_service"))
+
+    assert text == "from fallback"
+    assert sum(router.decisions.values()) == 1
+
+
+def test_failover_is_off_unless_enabled_or_listed(router, monkeypatch):
+    primary = llm_for("openai", "code")
+    for _ in range(llm_router.MIN_SAMPLES):
+        router.observe(primary, "generate_code", latency=60.0, ok=True)
+
+    monkeypatch.delenv("LLM_FAILOVER")
+    assert router.route(primary, "generate_code") == [primary]
+
+    monkeypatch.setenv("LLM_FAILOVER_STEPS", "generate_code=anthropic")
+    assert router.route(primary, "generate_code")[0] is llm_for("anthropic", "code")
+    assert router.route(primary, "plan_service") == [primary]
+
+
+def test_failover_answer_is_billed_to_the_answering_model_and_replays(router, monkeypatch, tmp_path):
+    monkeypatch.setenv("LLM_RETRIES", "0")
+    down, up = DownLLM(max_tokens=7), UpLLM(max_tokens=9)
+    monkeypatch.setattr(router, "candidates", lambda llm, step: [down, up])
+    budget = TokenBudget()
+
+    cache = LLMCache(tmp_path / "cache", mode="record")
+    monkeypatch.setattr(llm_calls, "get_cache", lambda: cache)
+    with use_budget(budget):
+        asyncio.run(llm_calls.acomplete(down, "hi", step="plan_service"))
+    assert budget.ledger[-1]["provider"] == "UpLLM" and budget.ledger[-1]["status"] == "sent"
+    entry = json.loads(next((tmp_path / "cache").rglob("*.json")).read_text())
+    assert entry["meta"]["answered_by"]["provider"] == "UpLLM"
+
+    replay = LLMCache(tmp_path / "cache", mode="replay")
+    monkeypatch.setattr(llm_calls, "get_cache", lambda: replay)
+    with use_budget(budget):
+        assert asyncio.run(llm_calls.acomplete(down, "hi", step="plan_service")) == "from fallback"
+    assert budget.ledger[-1]["status"] == "cached"
+
+
+class SmallUpLLM(UpLLM):
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=500, num_output=self.max_tokens or -1)
+
+
+def test_prompt_is_fitted_to_the_tightest_failover_candidate(router, monkeypatch):
+    down, up = DownLLM(max_tokens=10), SmallUpLLM(max_tokens=10)
+    monkeypatch.setattr(router, "candidates", lambda llm, step: [down, up])
+    budget = TokenBudget(action="trim")
+
+    with use_budget(budget):
+        asyncio.run(llm_calls.acomplete(down, "word " * 2000, step="plan_service"))
+
+    assert budget.ledger[-1]["prompt_tokens"] <= 500
@@ -0,0 +1,87 @@
+import asyncio
+import tarfile
+import zipfile
+
+import pattern_workflow
+from local_repo_reader import FilterType, LocalRepositoryReader, allowed_dir, git_blob_sha
+from offline_llm import HashEmbedding
+
+FILES = {
+    "README.md": "# FTGO\n",
+    "ftgo-order-service/src/main/java/OrderService.java": "class OrderService { void createOrder() {} }\n",
+    "ftgo-order-service/src/main/java/CreateOrderSaga.java": "class CreateOrderSaga { void compensate() {} }\n",
+    "ftgo-kitchen-service/build.gradle": "dependencies {}\n",
+    "docs/diagram.png": "not really a png\n",
+    "package.json": "{}\n",
+}
+
+
+def make_checkout(root):
+    for path, text in FILES.items():
+        p = root / path
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text(text)
+    (root / ".git").mkdir()
+    (root / ".git" / "HEAD").write_text("ref: refs/heads/master\n")
+    return root
+
+
+def test_git_blob_sha_matches_git():
+    assert git_blob_sha(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_allowed_dir_prunes_only_directories_without_allowed_files():
+    include = (["ftgo-order-service/src"], FilterType.INCLUDE)
+    assert allowed_dir("ftgo-order-service", include) and allowed_dir("ftgo-order-service/src/main", include)
+    assert not allowed_dir("ftgo-consumer-service", include)
+    exclude = (["docs", "build/"], FilterType.EXCLUDE)
+    assert not allowed_dir("docs/img", exclude) and not allowed_dir("build", exclude)
+    assert allowed_dir("src", exclude) and allowed_dir("src", None)
+
+
+def test_checkout_and_archives_give_the_same_documents(tmp_path):
+    checkout = make_checkout(tmp_path / "ftgo-application-master")
+    tgz = tmp_path / "ftgo.tar.gz"
+    with tarfile.open(tgz, "w:gz") as tf:
+        tf.add(checkout, arcname="ftgo-application-master")
+    zipped = tmp_path / "ftgo.zip"
+    with zipfile.ZipFile(zipped, "w") as zf:
+        for path, text in FILES.items():
+            zf.writestr(path, text)
+
+    filters = dict(
+        filter_directories=(["docs"], FilterType.EXCLUDE),
+        filter_file_extensions=([".png", "json"], FilterType.EXCLUDE),  # "json" lacks the dot: not filtered, as on GitHub
+    )
+    expected = {git_blob_sha(text.encode()): path for path, text in FILES.items() if path != "docs/diagram.png"}
+    for source in (checkout, tgz, zipped):
+        docs = LocalRepositoryReader(source, owner="microservices-patterns", repo="ftgo-application", **filters).load_data("master")
+        assert {d.doc_id: d.metadata["file_path"] for d in docs} == expected
+    doc = next(d for d in docs if d.metadata["file_name"] == "OrderService.java")
+    assert doc.metadata["url"].startswith("https://github.com/microservices-patterns/ftgo-application/blob/master/")
+
+    skipped = LocalRepositoryReader(checkout, filter_directories=(["ftgo-order-service"], FilterType.INCLUDE))
+    seen = []
+    docs = skipped.load_data(file_exists_callback=lambda sha: seen.append(sha) or sha == git_blob_sha(FILES["ftgo-order-service/src/main/java/OrderService.java"].encode()))
+    assert len(seen) == 2
+    assert [d.metadata["file_name"] for d in docs] == ["CreateOrderSaga.java"]
+
+
+def test_build_retriever_from_local_checkout(tmp_path, monkeypatch):
+    checkout = make_checkout(tmp_path / "ftgo")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("GITHUB_INDEX_REFRESH", raising=False)
+    monkeypatch.setattr(pattern_workflow.Settings, "_embed_model", HashEmbedding())
+
+    retriever = asyncio.run(pattern_workflow.build_github_retriever(None, local_path=str(checkout)))
+    assert (tmp_path / ".cache/github_indexes/microservices-patterns_ftgo-application_master").is_dir()
+    hits = retriever.retrieve("CreateOrderSaga compensate")
+    assert hits[0].node.metadata["file_name"] == "CreateOrderSaga.java"
+
+    (checkout / "ftgo-kitchen-service/build.gradle").write_text("dependencies { implementation 'eventuate' }\n")
+    retriever = asyncio.run(pattern_workflow.build_github_retriever(None, local_path=str(checkout), refresh=True))
+    files = {info.metadata["file_path"] for info in retriever._index.ref_doc_info.values()}
+    assert files == {"README.md", "package.json", "ftgo-kitchen-service/build.gradle",
+                     "ftgo-order-service/src/main/java/OrderService.java",
+                     "ftgo-order-service/src/main/java/CreateOrderSaga.java"}
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import time
+
+from llama_index.core.program import LLMTextCompletionProgram
+
+from offline_llm import HashEmbedding, OfflineLLM, index_dir, prompt_kind
+from output import DalleOutput, DalleOutputCode
+
+
+def test_structured_programs_parse_offline_answers():
+    llm = OfflineLLM()
+
+    for output_cls in (DalleOutput, DalleOutputCode):
+        program = LLMTextCompletionProgram.from_defaults(
+            output_cls=output_cls, prompt_template_str="Input: {input_json}", llm=llm
+        )
+        output = asyncio.run(program.acall(input_json="{}"))
+        assert isinstance(output, output_cls)
+
+    arch = LLMTextCompletionProgram.from_defaults(output_cls=DalleOutput, prompt_template_str="{x}", llm=llm)
+    assert arch(x="a") == arch(x="b")
+
+
+def test_update_plan_and_codegen_prompts():
+    from pattern_workflow import FILE_PROMPT, PLAN_PROMPT
+    from prompts import UPDATE_PLAN_SPEC
+
+    llm = OfflineLLM()
+    plan = json.loads(llm.complete("Focus on PATTERNS.\n" + UPDATE_PLAN_SPEC).text)
+    assert plan["version"] == "1" and plan["actions"][-1]["op"] == "write"
+
+    prompt = PLAN_PROMPT.format(package="com.acme.orders", service_name="Order Service", patterns="[]", readme="")
+    files = json.loads(llm.complete(prompt).text)["files"]
+    assert files[0]["path"].startswith("com/acme/orders/")
+
+    prompt = FILE_PROMPT.format(package="com.acme", patterns="[]", purpose="REST controller",
+                                relpath="com/acme/web/OrderController.java")
+    assert prompt_kind(prompt) == "java_file"
+    assert llm.complete(prompt).text.startswith("package com.acme.web;")
+
+
+def test_latency_and_token_rate_are_simulated():
+    llm = OfflineLLM(latency_s=0.05, tokens_per_s=1_000_000)
+    start = time.perf_counter()
+    asyncio.run(llm.acomplete("hello"))
+    assert time.perf_counter() - start >= 0.05
+
+
+def test_hash_embeddings_are_deterministic_and_normalised():
+    embed = HashEmbedding(embed_dim=64)
+    a = embed.get_text_embedding("saga pattern for orders")
+    assert a == HashEmbedding(embed_dim=64).get_text_embedding("saga pattern for orders")
+    assert abs(sum(v * v for v in a) - 1.0) < 1e-9
+    b = embed.get_text_embedding("orders saga")
+    c = embed.get_text_embedding("frontend vite config")
+    dot = lambda x, y: sum(p * q for p, q in zip(x, y))
+    assert dot(a, b) > dot(a, c)
+
+
+def test_offline_runs_use_their_own_index_dir(monkeypatch):
+    monkeypatch.delenv("ARCHI_INDEX_DIR", raising=False)
+    monkeypatch.delenv("MODEL", raising=False)
+    monkeypatch.setenv("LLM_OFFLINE", "0")
+    assert index_dir() == "./archi"
+
+    monkeypatch.setenv("LLM_OFFLINE", "1")
+    assert index_dir() == "./archi-offline"
+
+    monkeypatch.setenv("ARCHI_INDEX_DIR", "/data/bench-index")
+    assert index_dir() == "/data/bench-index"
+
+
+def test_offline_defaults_are_installed_by_configure_not_by_import(monkeypatch):
+    import importlib
+
+    from llama_index.core import Settings
+
+    import llm_clients
+
+    monkeypatch.setenv("LLM_OFFLINE", "1")
+    monkeypatch.setattr(Settings, "_llm", None)
+    monkeypatch.setattr(Settings, "_embed_model", None)
+    importlib.reload(llm_clients)
+    assert Settings._llm is None and Settings._embed_model is None
+
+    llm_clients.configure()
+    assert isinstance(Settings.llm, OfflineLLM)
+    assert isinstance(Settings.embed_model, HashEmbedding)
@@ -0,0 +1,67 @@
+import base64
+import io
+import os
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import pattern_workflow
+from project_tree import ProjectTree
+
+EXAMPLE = Path(__file__).resolve().parent.parent / "example/output/not-farm-from-home"
+
+
+class Sink(io.RawIOBase):
+    """A pipe-like sink: write-only, no seek or tell."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        return len(b)
+
+
+def edited_project() -> ProjectTree:
+    project = ProjectTree.from_zip_bytes(pattern_workflow.zip_dir_to_bytes(EXAMPLE))
+    project.write("cart_service/src/main/java/Saga.java", "class Saga {}\n")
+    return project
+
+
+def test_archive_is_streamed_to_paths_and_sinks(tmp_path):
+    expected = edited_project().to_zip_bytes()
+
+    res = pattern_workflow.write_output_zip(edited_project(), tmp_path / "out.zip")
+    assert res == {"filename": "augmented_project.zip", "zip_path": str(tmp_path / "out.zip")}
+    assert (tmp_path / "out.zip").read_bytes() == expected
+
+    sink = Sink()
+    res = pattern_workflow.write_output_zip(edited_project(), sink)
+    assert res["zip_file"] is sink and len(sink.chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(sink.chunks))) as zf:
+        assert zf.testzip() is None
+        assert zf.read("cart_service/src/main/java/Saga.java") == b"class Saga {}\n"
+        assert sorted(zf.namelist()) == sorted(zipfile.ZipFile(io.BytesIO(expected)).namelist())
+
+    res = pattern_workflow.write_output_zip(edited_project(), None)
+    try:
+        legacy = pattern_workflow.base64_payload({**res, "service_errors": {"x": "y"}})
+        assert set(legacy) == {"filename", "zip_base64", "service_errors"}
+        assert base64.b64decode(legacy["zip_base64"]) == expected
+    finally:
+        os.remove(res["zip_path"])
+
+
+def test_base64_payload_reads_seekable_file_results(tmp_path):
+    expected = edited_project().to_zip_bytes()
+    with open(tmp_path / "out.zip", "w+b") as f:
+        res = pattern_workflow.write_output_zip(edited_project(), f)
+        assert base64.b64decode(pattern_workflow.base64_payload(res)["zip_base64"]) == expected
+
+    res = pattern_workflow.write_output_zip(edited_project(), Sink())
+    with pytest.raises(ValueError):
+        pattern_workflow.base64_payload(res)
@@ -0,0 +1,49 @@
+import asyncio
+
+import pattern_workflow
+import plan_cache
+from offline_llm import OfflineLLM
+
+
+class CountingLLM(OfflineLLM):
+    calls: int = 0
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        return await super().acomplete(prompt, formatted=formatted, **kwargs)
+
+
+def test_plan_cache_entries(tmp_path):
+    cache = plan_cache.PlanCache(tmp_path, ttl_s=60)
+    key = cache.key("Order", "com.acme", {"saga": None}, "readme", "v1", {"model": "gpt-4.1"})
+    assert key != cache.key("Order", "com.acme", {"saga": None}, "readme", "v2", {"model": "gpt-4.1"})
+    assert key != cache.key("Order", "com.acme", {"saga": None}, "readme", "v1", {"model": "offline"})
+    assert cache.get(key) is None
+
+    cache.put(key, {"files": [{"path": "A.java"}]}, meta={"service_name": "Order"})
+    assert cache.get(key) == {"files": [{"path": "A.java"}]}
+    assert cache.invalidate(service_name="Other") == 0
+    assert cache.invalidate(service_name="Order") == 1 and cache.get(key) is None
+
+    cache.put(key, {"files": []})
+    cache.ttl_s = -1  # every entry is older than that
+    assert cache.get(key) is None
+    assert cache.stats == {"hits": 1, "misses": 3, "writes": 2, "expired": 1, "invalidated": 1}
+
+
+def test_repeat_run_skips_the_planning_call(tmp_path, monkeypatch):
+    monkeypatch.setattr(plan_cache, "_cache", None)
+    monkeypatch.setenv("PLAN_CACHE_DIR", str(tmp_path))
+    req = pattern_workflow.PlanRequestEvent(
+        service_dir="svc", package="com.acme", service_name="Order", patterns={}, readme="r", output_service_dir="out"
+    )
+    wf = pattern_workflow.CodegenWorkflow(timeout=60)
+    plans = []
+    for readme, model in (("r", "offline"), ("r", "offline"), ("changed", "offline"), ("r", "offline/other")):
+        llm = CountingLLM(model=model)
+        monkeypatch.setattr(pattern_workflow.Settings, "_llm", llm)
+        plans.append((asyncio.run(wf.plan_service(req.model_copy(update={"readme": readme}))).plan, llm.calls))
+
+    assert [calls for _, calls in plans] == [1, 0, 1, 1]
+    assert plans[0][0] == plans[1][0] and plans[0][0]["files"]
+    assert pattern_workflow.plan_cache_stats()["hits"] == 1
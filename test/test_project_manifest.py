@@ -0,0 +1,59 @@
+import os
+from pathlib import Path
+
+import pattern_workflow
+import project_manifest
+from project_manifest import ProjectManifest
+from project_tree import ProjectTree
+
+EXAMPLE = Path(__file__).resolve().parent.parent / "example/output/not-farm-from-home"
+
+
+def test_manifest_matches_rglob_discovery():
+    manifest = ProjectManifest.scan(EXAMPLE)
+
+    expected = sorted(
+        p.name for p in EXAMPLE.iterdir()
+        if p.is_dir() and (p / "src/main/java").exists() and list(p.rglob("*Application.java"))
+    )
+    assert list(manifest.services) == expected
+    for name in expected:
+        app = next((EXAMPLE / name).rglob("*Application.java"))
+        assert manifest.services[name].package == pattern_workflow.pkg_from_application(app.relative_to(EXAMPLE))
+    assert len(manifest.files) == sum(1 for p in EXAMPLE.rglob("*") if p.is_file())
+
+    tree = ProjectTree.from_dir(EXAMPLE)
+    assert tree.find_services() == expected
+
+
+def test_discovery_walks_the_tree_once(tmp_path, monkeypatch):
+    for i in range(40):
+        pkg = tmp_path / f"svc{i}/src/main/java/com/acme/svc{i}"
+        pkg.mkdir(parents=True)
+        (pkg / f"Svc{i}Application.java").write_text("class A {}")
+        (pkg / "Foo.java").write_text("class Foo {}")
+    (tmp_path / "frontend/src").mkdir(parents=True)
+    n_dirs = sum(1 for p in tmp_path.rglob("*") if p.is_dir())
+
+    calls = []
+    real_scandir = os.scandir
+    monkeypatch.setattr(project_manifest.os, "scandir", lambda p: calls.append(p) or real_scandir(p))
+
+    services = pattern_workflow.find_services(tmp_path)
+
+    assert len(services) == 40
+    assert len(calls) == n_dirs + 1
+    assert pattern_workflow.detect_package(tmp_path / "svc7") == "com.acme.svc7"
+
+
+def test_detect_package_sees_changes(tmp_path):
+    app = tmp_path / "svc/src/main/java/com/acme/old/SvcApplication.java"
+    app.parent.mkdir(parents=True)
+    app.write_text("class A {}")
+    [svc] = pattern_workflow.find_services(tmp_path)
+    assert pattern_workflow.detect_package(svc) == "com.acme.old"
+
+    moved = tmp_path / "svc/src/main/java/com/acme/new/SvcApplication.java"
+    moved.parent.mkdir(parents=True)
+    app.rename(moved)
+    assert pattern_workflow.detect_package(svc) == "com.acme.new"
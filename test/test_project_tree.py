@@ -0,0 +1,39 @@
+import io
+import zipfile
+from pathlib import Path
+
+import pattern_workflow
+from project_tree import ProjectTree
+
+EXAMPLE = Path(__file__).resolve().parent.parent / "example/output/not-farm-from-home"
+
+
+def test_queries_match_the_disk_helpers():
+    project = ProjectTree.from_zip_bytes(pattern_workflow.zip_dir_to_bytes(EXAMPLE))
+
+    services = [p.name for p in pattern_workflow.find_services(EXAMPLE)]
+    assert project.find_services() == sorted(services)
+    for name in services:
+        assert project.detect_package(name) == pattern_workflow.detect_package(EXAMPLE / name)
+    assert project.read_text("README.md") == (EXAMPLE / "README.md").read_text(encoding="utf-8")
+    assert project.read_text("missing.md", default="") == ""
+
+
+def test_written_files_round_trip_through_the_zip():
+    project = ProjectTree.from_dir(EXAMPLE)
+    svc = project.find_services()[0]
+    new_path = f"{svc}/src/main/java/com/acme/saga/OrderSaga.java"
+    project.write(new_path, "package com.acme.saga;\n")
+
+    with zipfile.ZipFile(io.BytesIO(project.to_zip_bytes())) as zf:
+        names = set(zf.namelist())
+        assert zf.read(new_path) == b"package com.acme.saga;\n"
+        assert zf.read("docker-compose.yml") == (EXAMPLE / "docker-compose.yml").read_bytes()
+    assert f"{svc}/src/main/java/com/acme/saga/" in names
+    assert project.is_dir(f"{svc}/src/main/java/com/acme") and new_path in set(project.walk_files(svc))
+
+
+def test_tree_closes_its_source_archive():
+    with ProjectTree.from_zip_bytes(pattern_workflow.zip_dir_to_bytes(EXAMPLE)) as tree:
+        assert tree.read_bytes("README.md")
+    assert tree._zip.fp is None
@@ -0,0 +1,75 @@
+import asyncio
+
+from llama_index.core.llms import ChatMessage, CompletionResponse, MessageRole, MockLLM
+from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.llms.anthropic import Anthropic
+from llama_index.llms.openai import OpenAI
+from llama_index.llms.openai.utils import to_openai_message_dicts
+
+import llm_calls
+from prompt_cache import (
+    CACHE_BREAKPOINT,
+    cached_prefix,
+    for_llm,
+    prompt_cache_stats,
+    reset_prompt_cache_stats,
+    usage_of,
+)
+
+
+def test_usage_of_openai_and_anthropic_responses():
+    openai_raw = {"usage": {"prompt_tokens": 2000, "prompt_tokens_details": {"cached_tokens": 1536}}}
+    anthropic_raw = {"usage": {"input_tokens": 40, "cache_read_input_tokens": 1900, "cache_creation_input_tokens": 0}}
+
+    assert usage_of(openai_raw) == {"prompt": 2000, "cached": 1536, "cache_write": 0}
+    assert usage_of(anthropic_raw) == {"prompt": 1940, "cached": 1900, "cache_write": 0}
+    assert usage_of({"id": "x"}) is None
+
+
+class UsageLLM(MockLLM):
+    @llm_completion_callback()
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        usage = {"prompt_tokens": 1000, "prompt_tokens_details": {"cached_tokens": 750}}
+        return CompletionResponse(text="ok", raw={"usage": usage})
+
+
+def test_hit_rate_is_reported_per_step():
+    reset_prompt_cache_stats()
+    llm = UsageLLM()
+
+    async def run():
+        for _ in range(2):
+            await llm_calls.acomplete(llm, "same long prefix", step="extract_microservices_code")
+
+    asyncio.run(run())
+
+    stats = prompt_cache_stats()["extract_microservices_code"]
+    assert stats["calls"] == 2
+    assert stats["hit_rate"] == 0.75
+
+
+def test_microservice_code_prompt_puts_static_instructions_first():
+    import archi_code2
+
+    program = archi_code2.microservice_code_program(Anthropic(model="claude-sonnet-4-5", api_key="sk-ant-test"))
+    a = program.prompt.format_messages(microservice={"name": "orders"})
+    b = program.prompt.format_messages(microservice={"name": "billing"})
+
+    assert a[0].content == b[0].content
+    assert a[0].additional_kwargs == CACHE_BREAKPOINT
+    assert "orders" in a[-1].content and "billing" in b[-1].content
+
+
+def test_breakpoint_never_reaches_openai_messages():
+    openai = OpenAI(model="gpt-4.1", api_key="sk-test")
+    anthropic = Anthropic(model="claude-sonnet-4-5", api_key="sk-ant-test")
+    usr = ChatMessage(role=MessageRole.USER, content="file prompt")
+
+    sent = to_openai_message_dicts(for_llm([cached_prefix("shared rag context", openai), usr], openai))
+    assert all(set(m) == {"role", "content"} for m in sent)
+
+    # A failover from Anthropic to OpenAI drops the marker the Anthropic prompt carried
+    marked = [cached_prefix("shared rag context", anthropic), usr]
+    assert marked[0].additional_kwargs == CACHE_BREAKPOINT
+    assert all(not m.additional_kwargs for m in for_llm(marked, openai))
+    assert for_llm(marked, anthropic) is marked
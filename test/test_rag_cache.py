@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pattern_workflow
+import rag_cache
+from rag_cache import RetrievalCache
+
+
+class SlowRetriever:
+    """Async retriever taking 0.2 s per query."""
+
+    def __init__(self):
+        self.queries = []
+
+    async def aretrieve(self, query):
+        self.queries.append(query)
+        await asyncio.sleep(0.2)
+        return [f"example for {query}"]
+
+
+def test_concurrent_lookups_share_one_retrieval():
+    cache, retriever = RetrievalCache(max_entries=2, ttl_s=60), SlowRetriever()
+
+    async def run():
+        same = [cache.get_or_retrieve("ftgo@master:1", retriever, "q-saga") for _ in range(5)]
+        return await asyncio.gather(*same, cache.get_or_retrieve("ftgo@master:1", retriever, "q-cqrs"))
+
+    results = asyncio.run(run())
+    assert retriever.queries == ["q-saga", "q-cqrs"] and results[0] == results[4] == ["example for q-saga"]
+    assert cache.stats == {"hits": 0, "misses": 2, "shared": 4, "evicted": 0}
+
+    asyncio.run(cache.get_or_retrieve("ftgo@master:1", retriever, "q-saga"))  # hit, now most recent
+    asyncio.run(cache.get_or_retrieve("ftgo@master:1", retriever, "q-events"))  # evicts cqrs
+    asyncio.run(cache.get_or_retrieve("ftgo@master:1", retriever, "q-saga"))
+    assert retriever.queries == ["q-saga", "q-cqrs", "q-events"] and cache.stats["evicted"] == 1
+
+    cache.ttl_s = -1  # every entry expired
+    asyncio.run(cache.get_or_retrieve("ftgo@master:1", retriever, "q-saga"))
+    assert retriever.queries[-1] == "q-saga" and len(retriever.queries) == 4
+
+
+def test_entries_follow_the_index_revision():
+    cache, retriever = RetrievalCache(), SlowRetriever()
+
+    asyncio.run(cache.get_or_retrieve("ftgo@master:1", retriever, "q"))
+    asyncio.run(cache.get_or_retrieve("ftgo@master:1", SlowRetriever(), "q"))  # another retriever, same index
+    assert retriever.queries == ["q"] and cache.stats["hits"] == 1
+
+    cache.drop_index("ftgo@master:1")  # refresh_index changed the index
+    asyncio.run(cache.get_or_retrieve("ftgo@master:2", retriever, "q"))
+    assert retriever.queries == ["q", "q"] and not any(k[0] == "ftgo@master:1" for k in cache._entries)
+
+
+def test_repeated_service_queries_share_retrieval(monkeypatch):
+    class SyncOnly:
+        """A retriever without aretrieve: runs in a worker thread, not on the loop."""
+
+        calls = 0
+
+        def retrieve(self, query):
+            SyncOnly.calls += 1
+            time.sleep(0.2)
+            return ["saga example"]
+
+    monkeypatch.setattr(rag_cache, "_cache", None)
+    monkeypatch.setattr(pattern_workflow, "GITHUB_RETRIEVER", SyncOnly())
+    monkeypatch.setattr(pattern_workflow, "GITHUB_INDEX_ID", "ftgo@master:1")
+    wf = pattern_workflow.CodegenWorkflow(timeout=60)
+
+    def event(service, patterns):
+        req = pattern_workflow.PlanRequestEvent(
+            service_dir=service, package="com.acme", service_name=service, patterns=patterns, readme="",
+            output_service_dir=service,
+        )
+        return pattern_workflow.PlanResultEvent(plan={"files": []}, req=req)
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.create_task(ticker())
+        out = await asyncio.gather(
+            wf.retrieve_examples(event("order", {"saga": {"name": "Order"}, "aggregate": True, "cqrs": False})),
+            wf.retrieve_examples(event("order", {"saga": {"name": "Order"}, "aggregate": True, "cqrs": False})),
+        )
+        t.cancel()
+        return out, ticks
+
+    (order, again), ticks = asyncio.run(run())
+    assert SyncOnly.calls == 1 and "saga example" in order.rag_context and order.rag_context == again.rag_context
+    assert ticks > 5  # the loop kept running during the retrieval
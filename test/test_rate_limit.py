@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from llama_index.core.llms import CompletionResponse, MockLLM
+
+import llm_calls
+import rate_limit
+from rate_limit import Governor, TokenBucket, parse_rate_limit_headers
+
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+        self.status_code = 429
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after="0"):
+        super().__init__("429 Too Many Requests")
+        self.response = _Response({"retry-after": retry_after})
+
+
+class FlakyLLM(MockLLM):
+    """Answers after raising one 429."""
+
+    calls: int = 0
+
+    async def acomplete(self, prompt, formatted=False, **kwargs):
+        self.calls += 1
+        if self.calls == 1:
+            raise RateLimitError()
+        return CompletionResponse(text="ok")
+
+
+@pytest.fixture
+def fresh_governors(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_governors", {})
+    monkeypatch.setitem(rate_limit.PROVIDER_OF_CLASS, "FlakyLLM", "openai")
+
+
+def test_parse_openai_anthropic_and_mistral_headers():
+    assert parse_rate_limit_headers({
+        "x-ratelimit-limit-requests": "500",
+        "x-ratelimit-remaining-tokens": "29000",
+        "x-ratelimit-reset-requests": "6m0s",
+        "retry-after-ms": "1500",
+    }) == {"requests_limit": 500.0, "tokens_remaining": 29000.0, "retry_after": 1.5}
+    assert parse_rate_limit_headers({"anthropic-ratelimit-requests-limit": "50"}) == {"requests_limit": 50.0}
+    assert parse_rate_limit_headers({"x-ratelimitbysize-remaining-minute": "400"}) == {"tokens_remaining": 400.0}
+
+
+def test_bucket_makes_callers_wait_off_the_debt():
+    bucket = TokenBucket(per_minute=60)  # one per second
+    assert bucket.reserve(60, now=bucket.updated) == 0.0
+    assert bucket.reserve(2, now=bucket.updated) == pytest.approx(2.0)
+
+
+def test_headers_clamp_remaining_quota():
+    gov = Governor("openai", rpm=500, tpm=100_000)
+    gov.update_from_headers({"x-ratelimit-limit-tokens": "30000", "x-ratelimit-remaining-tokens": "0"})
+    assert gov.tokens.capacity == 30_000
+    assert gov._reserve(600) == pytest.approx(600 / (30_000 / 60), rel=0.05)
+
+
+def test_429_is_retried_and_slows_the_provider(fresh_governors):
+    llm = FlakyLLM(max_tokens=10)
+    text = asyncio.run(llm_calls.acomplete(llm, "hi", step="judge"))
+
+    gov = rate_limit.get_governor("openai")
+    assert text == "ok" and llm.calls == 2
+    assert gov.stats["rate_limited"] == 1
+    assert gov.requests.capacity < gov.requests.nominal
+
+
+def test_openai_http_clients_keep_sdk_defaults():
+    from llm_clients import _http_clients
+
+    clients = _http_clients("openai", {})
+
+    assert clients["http_client"].timeout.read == 600
+    assert clients["async_http_client"].timeout.read == 600
+    assert len(clients["async_http_client"].event_hooks["response"]) == 1
+
+
+def test_clients_leave_retries_to_the_governor(monkeypatch):
+    import llm_clients
+
+    monkeypatch.delenv("LLM_OFFLINE", raising=False)
+    monkeypatch.setattr(llm_clients, "_clients", {})
+    for provider, model in [("openai", "gpt-4.1"), ("anthropic", "claude-sonnet-4-5"), ("mistral", "mistral-large-2411")]:
+        assert llm_clients.get_llm(provider, model, api_key="test").max_retries == 0
+    assert llm_clients.get_llm("openai", "gpt-4.1", api_key="test", max_retries=2).max_retries == 2
@@ -0,0 +1,40 @@
+import random
+from pathlib import Path
+
+from legacy_readme import legacy_parse
+from pattern_workflow import parse_patterns_from_readme, simplify_service_label
+
+EXAMPLE_README = Path(__file__).resolve().parent.parent / "example/output/not-farm-from-home/README.md"
+
+NAMES = ["Booking Service", "**Order Service**", "__Cart Service__", "Product Catalog Service", "Auth", "booking  service"]
+PHRASES = [
+    "Uses Aggregate and Domain Event patterns", "domain events", "domainevents", "Domain  Eventsourcing",
+    "database per service", "database-per service", "Database-Per-Service", "databaseperservice",
+    "the saga pattern", "sagas", "API Composition", "api  composition", "aggregates", "eventss",
+    "İstanbul aggregate", "(Saga, Aggregate, Domain Event)", "(cqrs， api composition)", "(Event)",
+]
+BULLETS = ["- ", "* ", "• ", "  -", "", "1. "]
+
+
+def random_line(rng: random.Random) -> str:
+    parts = [rng.choice(BULLETS), rng.choice(NAMES)]
+    if rng.random() < 0.6:
+        parts.append(rng.choice([": ", " : ", ":", " "]))
+    parts += [rng.choice(PHRASES) + rng.choice([" ", ", ", ". "]) for _ in range(rng.randint(0, 4))]
+    if rng.random() < 0.4:
+        parts.append(rng.choice(PHRASES[-3:]) + rng.choice(["", "  ", "\r"]))
+    return "".join(parts)
+
+
+def test_matches_two_pass_parser_on_example_readme():
+    text = EXAMPLE_README.read_text(encoding="utf-8")
+    assert parse_patterns_from_readme(text) == legacy_parse(text)
+    assert parse_patterns_from_readme(text)[simplify_service_label("Order Service")]["saga"] == {"name": "Order"}
+
+
+def test_matches_two_pass_parser_on_random_readmes():
+    rng = random.Random(7)
+    for _ in range(300):
+        text = "\n".join(random_line(rng) for _ in range(rng.randint(1, 12)))
+        new, old = parse_patterns_from_readme(text), legacy_parse(text)
+        assert list(new.items()) == list(old.items()), text
@@ -0,0 +1,59 @@
+import io
+import json
+import random
+import zipfile
+
+from stream_zip import FileStreamParser, ZipStreamWriter
+
+TREE = {
+    "folders": [
+        {
+            # name arrives after the nested content: files wait for it
+            "folders": [{"name": "java", "folders": [], "files": [
+                {"content": 'class A { String s = "\\\\ é 😀"; }', "name": "A.java"},
+            ]}],
+            "files": [{"name": "pom.xml", "content": "<project/>"}],
+            "name": "user_service",
+        },
+    ],
+    "files": [{"name": "README.md", "content": "# Title\n\n- **User Service**\n"}],
+}
+EXPECTED = [
+    ("user_service/java/A.java", 'class A { String s = "\\\\ é 😀"; }'),
+    ("user_service/pom.xml", "<project/>"),
+    ("README.md", "# Title\n\n- **User Service**\n"),
+]
+
+
+def test_parser_emits_files_regardless_of_chunking():
+    text = "```json\n" + json.dumps(TREE, indent=2) + "\n```"
+    rng = random.Random(0)
+    for _ in range(50):
+        parser, out, i = FileStreamParser(), [], 0
+        while i < len(text):
+            n = rng.randint(1, 9)
+            out += parser.feed(text[i:i + n])
+            i += n
+        assert out == EXPECTED
+        assert parser.done
+
+
+def test_parser_emits_file_as_soon_as_its_object_closes():
+    text = json.dumps({"folders": [{"name": "svc", "files": [
+        {"name": "A.java", "content": "class A {}"},
+        {"name": "B.java", "content": "class B {}"},
+    ]}]})
+    cut = text.index("class A {}") + len('class A {}"}')
+    parser = FileStreamParser()
+    assert parser.feed(text[:cut]) == [("svc/A.java", "class A {}")]
+    assert parser.feed(text[cut:]) == [("svc/B.java", "class B {}")]
+
+
+def test_zip_writer_adds_directory_entries_once():
+    buf = io.BytesIO()
+    with ZipStreamWriter(buf) as zw:
+        for path, content in EXPECTED:
+            zw.add(path, content)
+    names = zipfile.ZipFile(buf).namelist()
+    assert names == ["user_service/", "user_service/java/", "user_service/java/A.java",
+                     "user_service/pom.xml", "README.md"]
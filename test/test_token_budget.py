@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+from llama_index.core.llms import ChatMessage, MessageRole, MockLLM
+
+import llm_calls
+from token_budget import BudgetExceeded, TokenBudget, count_tokens, use_budget
+from updates_utils import merge_update_plans
+
+
+def _llm(max_tokens=100):
+    return MockLLM(max_tokens=max_tokens)
+
+
+def test_small_prompt_is_sent_and_recorded_in_ledger(tmp_path):
+    budget = TokenBudget(max_run_tokens=10_000)
+    with use_budget(budget):
+        asyncio.run(llm_calls.acomplete(_llm(), "hello world", step="extract_microservices"))
+
+    ledger = budget.write_ledger(tmp_path / "token_ledger.json").read_text()
+    assert '"step": "extract_microservices"' in ledger
+    assert budget.summary()["totals"]["calls"] == 1
+    assert budget.run_tokens > 0
+
+
+def test_trim_keeps_head_and_tail_within_step_cap():
+    budget = TokenBudget(step_caps={"generate_code": 300}, action="trim")
+    prompt = "INSTRUCTIONS\n" + "context " * 2000 + "\nThe output json is:"
+    fitted = budget.fit_text(_llm(max_tokens=100), prompt, step="generate_code")
+
+    assert count_tokens(fitted) <= 200
+    assert fitted.startswith("INSTRUCTIONS")
+    assert fitted.endswith("The output json is:")
+
+
+def test_abort_raises_before_sending():
+    budget = TokenBudget(max_run_tokens=500, action="abort")
+    with use_budget(budget), pytest.raises(BudgetExceeded):
+        llm_calls.complete(_llm(), "word " * 5000, step="retrieve_context")
+    assert budget.run_tokens == 0
+    assert budget.ledger[-1]["status"] == "abort"
+
+
+def test_split_packs_documents_into_requests_that_each_fit():
+    budget = TokenBudget(step_caps={"generate_patterns_code": 1100}, action="split")
+    docs = [f"file {i}\n" + "x " * 800 for i in range(6)]
+    groups = budget.pack_documents(_llm(max_tokens=100), docs, "overhead", step="generate_patterns_code")
+
+    assert len(groups) > 1
+    assert all(count_tokens(g) <= 1000 for g in groups)
+    assert sum(g.count("file ") for g in groups) == len(docs)
+
+
+def test_trim_records_the_documents_it_cuts_and_drops():
+    budget = TokenBudget(step_caps={"generate_patterns_code": 1100}, action="trim")
+    docs = [f"file {i}\n" + "x " * 800 for i in range(6)]
+    groups = budget.pack_documents(_llm(max_tokens=100), docs, "overhead", step="generate_patterns_code")
+
+    assert len(groups) == 1
+    entry = budget.ledger[-1]
+    assert entry["status"] == "dropped"
+    assert entry["trimmed_documents"] == 1 and entry["dropped_documents"] == 3
+    assert entry["prompt_tokens"] > 1000
+    assert budget.summary()["totals"]["calls"] == 0 and budget.run_tokens == 0
+
+
+def test_synthesize_splits_sources_and_summarizes_the_answers():
+    from llama_index.core.prompts import PromptTemplate
+
+    template = PromptTemplate("Sources:\n{context_str}\nQuestion: {query_str}\nAnswer:")
+    budget = TokenBudget(action="split")  # groups are bounded by the model's context window
+    texts = [f"story {i}\n" + "x " * 3000 for i in range(6)]
+    with use_budget(budget):
+        answer = asyncio.run(llm_calls.asynthesize(_llm(max_tokens=100), template, "which patterns?", texts,
+                                                   step="synthesize_context"))
+
+    assert answer
+    sent = [e for e in budget.ledger if e["status"] == "sent"]
+    assert len(sent) > 2  # one request per group, then the summary of their answers
+    assert all(e["step"] == "synthesize_context" for e in sent)
+
+
+def test_fit_messages_trims_the_longest_message_content():
+    budget = TokenBudget(step_caps={"generate_files": 300}, action="trim")
+    sysm = ChatMessage(role=MessageRole.SYSTEM, content="You write Java.")
+    usr = ChatMessage(role=MessageRole.USER, content="HEAD\n" + "context " * 2000 + "\nTAIL")
+    fitted = budget.fit_messages(_llm(max_tokens=100), [sysm, usr], step="generate_files")
+
+    assert fitted[0] is sysm
+    assert sum(count_tokens(m.content) for m in fitted) <= 200
+    assert fitted[1].content.startswith("HEAD") and fitted[1].content.endswith("TAIL")
+    assert usr.content.count("context") == 2000
+
+
+def test_merge_update_plans_accepts_fenced_parts():
+    parts = [
+        '```json\n{"actions": [{"op": "mkdir", "path": "a"}]}\n```',
+        '{"actions": [{"op": "mkdir", "path": "b"}]}',
+    ]
+    merged = merge_update_plans(parts)
+
+    assert [a["path"] for a in json.loads(merged)["actions"]] == ["a", "b"]
+    with pytest.raises(ValueError):
+        merge_update_plans(["no plan here", "{}"])
@@ -0,0 +1,90 @@
+import asyncio
+import base64
+import io
+import os
+import zipfile
+
+import archi_code2
+import workspace
+from offline_llm import OfflineLLM
+
+
+def run_two_workflows(monkeypatch):
+    monkeypatch.setattr(archi_code2, "get_llm", lambda *args, **kwargs: OfflineLLM(latency_s=0.05))
+
+    def input_json(run):
+        return {"microservices": [{"name": f"{run} Service {i}", "endpoints": []} for i in range(3)],
+                "patterns": [], "datastore": []}
+
+    async def run_both():
+        return await asyncio.gather(*(
+            archi_code2.DalleCodeWorkflow2(timeout=60).run(input_json=input_json(run)) for run in ("Alpha", "Beta")
+        ))
+
+    return asyncio.run(run_both())
+
+
+def test_concurrent_runs_get_private_workspaces(tmp_path, monkeypatch):
+    cwd, root = tmp_path / "cwd", tmp_path / "runs"
+    cwd.mkdir()
+    monkeypatch.chdir(cwd)
+    monkeypatch.setenv("WORKSPACE_ROOT", str(root))
+
+    results = run_two_workflows(monkeypatch)
+
+    for run, res in zip(("Alpha", "Beta"), results):
+        names = zipfile.ZipFile(io.BytesIO(base64.b64decode(res["zip_base64"]))).namelist()
+        assert any(run.lower() in n.lower() for n in names)
+        assert not any(("Beta" if run == "Alpha" else "Alpha").lower() in n.lower() for n in names)
+        assert "workspace" not in res
+    # Nothing written to the working directory, and the workspaces were removed
+    assert os.listdir(cwd) == [] and os.listdir(root) == []
+
+
+def test_workspace_retention(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("WORKSPACE_ROOT", str(tmp_path / "runs"))
+    monkeypatch.setenv("WORKSPACE_KEEP", "always")
+
+    kept = [res["workspace"] for res in run_two_workflows(monkeypatch)]
+    assert len(set(kept)) == 2
+    for path in kept:
+        assert os.path.exists(os.path.join(path, "patterns.plan.json"))
+        assert os.path.isdir(os.path.join(path, "output_project"))
+
+    monkeypatch.setenv("WORKSPACE_KEEP", "on_error")
+    try:
+        with workspace.use_workspace("batch") as ws:
+            ws.write_text("partial.txt", "x")
+            raise RuntimeError("job failed")
+    except RuntimeError:
+        pass
+    assert ws.file("partial.txt").exists()
+    with workspace.use_workspace("batch") as ok:
+        assert workspace.current_workspace() is ok
+    assert not ok.path.exists() and workspace.current_workspace() is None
+
+
+def test_failed_run_inside_use_workspace_leaves_nothing_behind(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    root = tmp_path / "runs"
+    monkeypatch.setenv("WORKSPACE_ROOT", str(root))
+    monkeypatch.setattr(archi_code2, "get_llm", lambda *args, **kwargs: OfflineLLM())
+
+    def broken(project_root):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(archi_code2, "load_project_documents", broken)
+    input_json = {"microservices": [{"name": "Order Service", "endpoints": []}], "patterns": [], "datastore": []}
+
+    async def run():
+        with workspace.use_workspace("code2"):
+            await archi_code2.DalleCodeWorkflow2(timeout=60).run(input_json=input_json)
+
+    try:
+        asyncio.run(run())
+    except Exception:
+        pass
+    else:
+        raise AssertionError("the run should have failed")
+    assert os.listdir(root) == [] and not workspace._pending
@@ -0,0 +1,61 @@
+import io
+import zipfile
+
+from zip_patch import patch_zip
+
+
+class Unseekable(io.RawIOBase):
+    """Forces zipfile to write data descriptors, as streamed archives have."""
+
+    def __init__(self):
+        self.buf = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.buf.write(b)
+
+
+def make_zip(files, stream=False):
+    out = Unseekable() if stream else io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("svc/", b"")
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return (out.buf if stream else out).getvalue()
+
+
+def test_patch_copies_unchanged_entries_and_applies_changes():
+    files = {f"svc/File{i}.java": (f"class File{i} {{}}\n" * 200).encode() for i in range(5)}
+    for stream in (False, True):
+        original = make_zip(files, stream=stream)
+        changes = {"svc/File0.java": b"class File0 { int x; }\n", "svc/File1.java": None,
+                   "svc/new/Saga.java": b"class Saga {}\n"}
+        out = io.BytesIO()
+        stats = patch_zip(original, changes, out)
+
+        assert stats == {"copied": 4, "compressed": 2, "deleted": 1}
+        with zipfile.ZipFile(io.BytesIO(out.getvalue())) as zf, zipfile.ZipFile(io.BytesIO(original)) as src:
+            assert zf.testzip() is None
+            assert zf.read("svc/File0.java") == changes["svc/File0.java"]
+            assert zf.read("svc/new/Saga.java") == changes["svc/new/Saga.java"]
+            assert "svc/File1.java" not in zf.namelist() and "svc/new/" in zf.namelist()
+            for name in ("svc/File2.java", "svc/File4.java"):
+                assert zf.read(name) == files[name]
+                assert zf.getinfo(name).compress_size == src.getinfo(name).compress_size
+
+
+def test_patch_recompresses_when_zipfile_internals_are_missing(monkeypatch):
+    files = {f"svc/File{i}.java": (f"class File{i} {{}}\n" * 200).encode() for i in range(3)}
+    original = make_zip(files)
+    monkeypatch.delattr(zipfile, "_strip_extra")
+
+    out = io.BytesIO()
+    stats = patch_zip(original, {"svc/File0.java": None, "svc/Saga.java": b"class Saga {}\n"}, out)
+
+    assert stats == {"copied": 0, "compressed": 4, "deleted": 1}
+    with zipfile.ZipFile(io.BytesIO(out.getvalue())) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["svc/", "svc/File1.java", "svc/File2.java", "svc/Saga.java"]
+        assert zf.read("svc/File2.java") == files["svc/File2.java"]